@@ -1,23 +1,48 @@
+-- Reference schema, matching server/models after every migration in
+-- server/migrations (the app creates and upgrades the real database itself)
+
+-- Table to store animal owners
+CREATE TABLE IF NOT EXISTS owners (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner_id VARCHAR(50) UNIQUE NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    phone VARCHAR(20) NOT NULL,
+    location VARCHAR(100) NOT NULL,
+    latitude REAL,                    -- geocoded from location when the owner is created
+    longitude REAL
+);
+
 -- Table to store animal information
 CREATE TABLE IF NOT EXISTS animals (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    animal_id VARCHAR(20) UNIQUE NOT NULL,
-    owner_id VARCHAR(20),
-    owner_name VARCHAR(100) NOT NULL,
-    owner_phone VARCHAR(20) NOT NULL,
-    owner_location VARCHAR(100) NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    animal_id VARCHAR(50) UNIQUE NOT NULL,
+    owner_id INTEGER NOT NULL,
+    image_front VARCHAR(255) NOT NULL,
+    image_back VARCHAR(255) NOT NULL,
+    image_left VARCHAR(255) NOT NULL,
+    image_right VARCHAR(255) NOT NULL,
+    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_seen_lat REAL,               -- position of the last registration / successful verify
+    last_seen_lng REAL,
+    last_seen_at TIMESTAMP,
+    FOREIGN KEY (owner_id) REFERENCES owners (id)
 );
+CREATE INDEX IF NOT EXISTS ix_animals_last_seen_at ON animals (last_seen_at);
 
--- Table to store image paths or URLs linked to animals
+-- Table mapping each animal view to its content-addressed image blob
+-- (uploads/<hash[0:2]>/<hash[2:4]>/<hash>.<ext>; identical uploads share one file)
 CREATE TABLE IF NOT EXISTS animal_images (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    animal_id VARCHAR(20) NOT NULL,
+    animal_id VARCHAR(50) NOT NULL,
     image_type VARCHAR(10) NOT NULL,  -- e.g., 'front', 'back', 'left', 'right'
+    blob_hash CHAR(64) NOT NULL,      -- SHA-256 of the file contents
+    phash BIGINT,                     -- 64-bit DCT perceptual hash (signed), for duplicate checks
     image_path TEXT NOT NULL,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (animal_id, image_type),
     FOREIGN KEY (animal_id) REFERENCES animals (animal_id) ON DELETE CASCADE
 );
+CREATE INDEX IF NOT EXISTS ix_animal_images_blob_hash ON animal_images (blob_hash);
 
 -- Table for unregistered animal alerts
 CREATE TABLE IF NOT EXISTS alerts (
@@ -31,35 +56,69 @@ CREATE TABLE IF NOT EXISTS alerts (
 -- Table to track payments (Mpesa or otherwise)
 CREATE TABLE IF NOT EXISTS payments (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    animal_id VARCHAR(20) NOT NULL,
-    owner_id VARCHAR(20) NOT NULL,
-    payment_reference VARCHAR(50) UNIQUE NOT NULL,
+    animal_id VARCHAR(50) NOT NULL,
     amount REAL NOT NULL,
-    status VARCHAR(20) DEFAULT 'Pending',
-    payment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    phone_number VARCHAR(20) NOT NULL,
+    payment_method VARCHAR(20) NOT NULL DEFAULT 'Mpesa',
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',  -- pending, success, failed
+    transaction_id VARCHAR(100),
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    synced BOOLEAN DEFAULT 0,
+    action_type VARCHAR(20),          -- 'ownership' or 'slaughter'
+    checkout_request_id VARCHAR(100), -- Mpesa STK callback fields
+    result_code VARCHAR(10),
+    result_desc TEXT,
+    transaction_date TIMESTAMP,
+    idempotency_key VARCHAR(64),      -- client-chosen per record, for offline sync retries
     FOREIGN KEY (animal_id) REFERENCES animals (animal_id) ON DELETE CASCADE
 );
+CREATE INDEX IF NOT EXISTS ix_payments_animal_action_status ON payments (animal_id, action_type, status);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_payments_checkout_request_id ON payments (checkout_request_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_payments_idempotency_key ON payments (idempotency_key);
 
 -- Table to track ownership history
 CREATE TABLE IF NOT EXISTS ownership_history (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    animal_id VARCHAR(20) NOT NULL,
-    previous_owner_id VARCHAR(20) NOT NULL,
-    new_owner_id VARCHAR(20) NOT NULL,
-    changed_by VARCHAR(50) NOT NULL,       -- e.g., admin ID
-    change_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    reason TEXT,
+    animal_id VARCHAR(50) NOT NULL,
+    previous_owner_id VARCHAR(50) NOT NULL,
+    previous_owner_name VARCHAR(100) NOT NULL,
+    previous_owner_phone VARCHAR(20) NOT NULL,
+    new_owner_id VARCHAR(50) NOT NULL,
+    new_owner_name VARCHAR(100) NOT NULL,
+    new_owner_phone VARCHAR(20) NOT NULL,
+    changed_by VARCHAR(50),           -- e.g., admin ID
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    notes TEXT,
+    idempotency_key VARCHAR(64),
     FOREIGN KEY (animal_id) REFERENCES animals (animal_id) ON DELETE CASCADE
 );
+CREATE INDEX IF NOT EXISTS ix_ownership_history_animal_id ON ownership_history (animal_id, timestamp);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_ownership_history_idempotency_key ON ownership_history (idempotency_key);
 
 -- Table to track slaughter records
 CREATE TABLE IF NOT EXISTS slaughter_records (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    animal_id VARCHAR(20) NOT NULL,
-    owner_id VARCHAR(20) NOT NULL,
-    slaughtered_by VARCHAR(50) NOT NULL,  -- admin or staff
-    slaughter_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    animal_id VARCHAR(50) NOT NULL,
+    authorized_by VARCHAR(50),        -- admin or staff
     reason TEXT,
-    location VARCHAR(100),
+    location VARCHAR(255),
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    synced BOOLEAN DEFAULT 0,
+    idempotency_key VARCHAR(64),
     FOREIGN KEY (animal_id) REFERENCES animals (animal_id) ON DELETE CASCADE
 );
+CREATE INDEX IF NOT EXISTS ix_slaughter_records_animal_id ON slaughter_records (animal_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_slaughter_records_idempotency_key ON slaughter_records (idempotency_key);
+
+-- Next unreserved sequence number per ID prefix (e.g. 'A-NE'); workers reserve blocks
+CREATE TABLE IF NOT EXISTS id_counters (
+    prefix VARCHAR(20) PRIMARY KEY,
+    next_value BIGINT NOT NULL
+);
+
+-- Applied server/migrations versions
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    applied_at DATETIME NOT NULL
+);
@@ -3,8 +3,11 @@ from flask import Flask
 from flask_cors import CORS
 from dotenv import load_dotenv
 
-from .models import db
+from .config import Config
+from .migrations import migrate
+from .models import db, init_db
 from .routes import api_bp
+from .utils.image_processor import InMemoryUploadRequest
 
 load_dotenv()
 
@@ -18,19 +21,22 @@ DB_PATH = os.path.join(DB_FOLDER, "livestock.db").replace("\\", "/")
 
 def create_app():
     app = Flask(__name__)
+    app.request_class = InMemoryUploadRequest
     CORS(app)
 
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "default_secret_key")
     app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DB_PATH}"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["UPLOAD_FOLDER"] = os.path.join(os.path.dirname(__file__), "uploads")
+    app.config["MAX_CONTENT_LENGTH"] = Config.MAX_CONTENT_LENGTH
 
-    db.init_app(app)
+    init_db(app, db)
     app.register_blueprint(api_bp, url_prefix="/api")
 
-    # Create tables
+    # Create missing tables, then bring existing ones up to date
     with app.app_context():
         db.create_all()
+        migrate(db.engine)
 
     return app
 
@@ -0,0 +1,192 @@
+# server/backfill_embeddings.py
+"""
+Backfill recognition embeddings for animals registered before recognition existed.
+
+Streams Animal rows in keyset-paginated chunks (id > last_id ORDER BY id),
+embeds their four views on a process pool, appends each chunk to the shared
+embedding store in one write and checkpoints the last processed id, so a
+killed run resumes where it stopped. Animals already in the store are skipped.
+Animals whose embedding fails are listed in the checkpoint and retried first
+on the next run.
+Images with a cached detection (DETECTION_CACHE_DIR) are embedded straight
+from their aligned face chips without being decoded or re-detected.
+
+--model-version fills another model version's store (see server.upgrade_model);
+each version keeps its own store and checkpoint.
+
+    python -m server.backfill_embeddings --workers 8 --batch-size 500
+    python -m server.backfill_embeddings --model-version dlib-v2
+    python -m server.backfill_embeddings --dry-run --limit 2000   # measure images/s only
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from server.models.animal import Animal
+from server.utils.facial_recognition.model_versions import active_version
+from server.utils.facial_recognition.recognizer import compute_view_embeddings, get_store, store_dir
+from server.utils.facial_recognition.result_cache import get_result_cache
+from server.utils.facial_recognition.worker_pool import init_recognition_worker
+from server.utils.id_validator import IN_CHUNK
+
+
+def _embed(job):
+    """Worker entry point: (animal_id, {view: path}, version) -> (animal_id, embeddings, views, n_images)."""
+    animal_id, paths, version = job
+    try:
+        embeddings, views = compute_view_embeddings(paths, version)
+    except Exception:
+        # One unreadable image must not abort the whole chunk; the animal is reported as failed
+        return animal_id, None, [], len(paths)
+    return animal_id, embeddings, views, len(paths)
+
+
+def new_checkpoint():
+    return {'last_id': 0, 'animals': 0, 'images': 0, 'failed_ids': []}
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return new_checkpoint()
+    with open(path) as f:
+        return {**new_checkpoint(), **json.load(f)}
+
+
+def save_checkpoint(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def iter_batches(last_id, batch_size, limit=None):
+    """Yield lists of Animal rows with id > last_id using keyset pagination."""
+    seen = 0
+    while limit is None or seen < limit:
+        size = batch_size if limit is None else min(batch_size, limit - seen)
+        rows = (
+            Animal.query
+            .with_entities(Animal.id, Animal.animal_id, Animal.image_front,
+                           Animal.image_back, Animal.image_left, Animal.image_right)
+            .filter(Animal.id > last_id)
+            .order_by(Animal.id)
+            .limit(size)
+            .all()
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+        seen += len(rows)
+
+
+def iter_retries(animal_ids, batch_size):
+    """Yield lists of Animal rows for animals that failed in an earlier run."""
+    animal_ids = sorted(animal_ids)
+    size = min(batch_size, IN_CHUNK)
+    for start in range(0, len(animal_ids), size):
+        rows = (
+            Animal.query
+            .with_entities(Animal.id, Animal.animal_id, Animal.image_front,
+                           Animal.image_back, Animal.image_left, Animal.image_right)
+            .filter(Animal.animal_id.in_(animal_ids[start:start + size]))
+            .order_by(Animal.id)
+            .all()
+        )
+        if rows:
+            yield rows
+
+
+def default_checkpoint(model_version):
+    return os.path.join(store_dir(model_version), 'backfill.checkpoint.json')
+
+
+def run(batch_size=500, workers=None, checkpoint=None, limit=None, dry_run=False, model_version=None, log=print):
+    model_version = model_version or active_version()
+    store = get_store(model_version)
+    already_indexed = set(store.load_index().animal_ids)
+    state = load_checkpoint(checkpoint) if checkpoint and not dry_run else new_checkpoint()
+    # Earlier failures, minus animals deleted since; few enough to hold
+    retries = list(iter_retries(state['failed_ids'], batch_size))
+    failed_ids = {row.animal_id for rows in retries for row in rows}
+    log(f"[{model_version}] Resuming after Animal.id={state['last_id']} "
+        f"({len(already_indexed)} animals already in the store, {len(failed_ids)} to retry)")
+
+    started = time.perf_counter()
+    images = animals = failed = 0
+    with ProcessPoolExecutor(max_workers=workers or multiprocessing.cpu_count(),
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_recognition_worker, initargs=((model_version,),)) as pool:
+        # Earlier failures first (without moving the checkpoint), then the rows after it
+        pages = chain(((rows, False) for rows in retries),
+                      ((rows, True) for rows in iter_batches(state['last_id'], batch_size, limit)))
+        for rows, advance in pages:
+            failed_ids.difference_update(row.animal_id for row in rows)
+            jobs = [
+                (row.animal_id, {'front': row.image_front, 'back': row.image_back,
+                                 'left': row.image_left, 'right': row.image_right}, model_version)
+                for row in rows if row.animal_id not in already_indexed
+            ]
+
+            entries = []
+            for animal_id, embeddings, views, n_images in pool.map(_embed, jobs, chunksize=8):
+                images += n_images
+                if views:
+                    entries.append((animal_id, embeddings, views))
+                else:
+                    failed += 1
+                    failed_ids.add(animal_id)
+                    log(f"No embeddings for {animal_id}")
+
+            if not dry_run:
+                store.append_many(entries)
+                if advance:
+                    state['last_id'] = rows[-1].id
+                state['failed_ids'] = sorted(failed_ids)
+                state['animals'] += len(entries)
+                state['images'] += sum(len(views) for _, _, views in entries)
+                if checkpoint:
+                    save_checkpoint(checkpoint, state)
+                if entries:
+                    # Cached "no match" verify results may now match a backfilled animal. This
+                    # process's own cache is empty; the web workers hear of it through the shared log.
+                    get_result_cache().publish_negatives_invalidation()
+
+            animals += len(jobs)
+            elapsed = time.perf_counter() - started
+            page = f"id<={rows[-1].id}" if advance else f"retried {len(rows)}"
+            log(f"{page}: {animals} animals, {images} images, {images / elapsed:.1f} images/s")
+
+    elapsed = time.perf_counter() - started
+    rate = images / elapsed if elapsed else 0.0
+    log(f"Done: {animals} animals ({failed} failed), {images} images in {elapsed:.1f}s ({rate:.1f} images/s)")
+    if failed_ids and not dry_run:
+        log(f"{len(failed_ids)} animals still without embeddings; they are retried on the next run")
+    return {'animals': animals, 'failed': failed, 'images': images, 'seconds': elapsed, 'images_per_second': rate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=500, help='Animal rows per keyset page')
+    parser.add_argument('--workers', type=int, default=None, help='embedding processes (default: all cores)')
+    parser.add_argument('--checkpoint', default=None, help="default: backfill.checkpoint.json in the version's store")
+    parser.add_argument('--limit', type=int, default=None, help='stop after this many animals')
+    parser.add_argument('--dry-run', action='store_true', help='embed but do not write; reports throughput')
+    parser.add_argument('--model-version', default=None, help='model version to embed with (default: the active one)')
+    args = parser.parse_args()
+
+    # Imported here so run() can be used without loading the web routes
+    from server.app import create_app
+    app = create_app()
+    with app.app_context():
+        version = args.model_version or active_version()
+        run(args.batch_size, args.workers, args.checkpoint or default_checkpoint(version), args.limit,
+            args.dry_run, model_version=version)
+
+
+if __name__ == '__main__':
+    main()
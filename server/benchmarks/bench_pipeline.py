@@ -0,0 +1,391 @@
+# server/benchmarks/bench_pipeline.py
+"""
+Offline benchmark of the recognition pipeline, stage by stage.
+
+Generates synthetic animal-like photos (encoded as JPEG like real uploads)
+and a synthetic gallery of clustered embeddings, then times each stage of a
+four-view verify request:
+
+    decode      JPEG bytes -> BGR arrays (decode_image)
+    preprocess  4 views -> float32 tensor (preprocess_batch)
+    crop        face crop of each view (crop_face)
+    embed       dlib descriptor per view (skipped when dlib/models are missing)
+    match       fused multi-view match against the gallery (match_embeddings)
+    quantization  recall and memory of the int8 gallery against exact float32
+
+Reports p50/p95/p99 latency and throughput per stage and writes JSON that a
+later run can be compared against (--compare exits 1 on a p95 regression).
+
+    python -m server.benchmarks.bench_pipeline --gallery 10000 --json before.json
+    python -m server.benchmarks.bench_pipeline --gallery 5000000 --store /data/bench-5m --stages match
+    python -m server.benchmarks.bench_pipeline --gallery 1000000 --stages quantization
+    python -m server.benchmarks.bench_pipeline --compare before.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from server.config import Config
+from server.utils.image_processor import decode_image
+from server.utils.facial_recognition.embedding_index import EmbeddingIndex, EMBEDDING_DIM, VIEWS, VIEW_CODES
+from server.utils.facial_recognition.embedding_store import EmbeddingStore
+from server.utils.facial_recognition.ann_index import IVFIndex
+from server.utils.facial_recognition.quantized_index import QuantizedEmbeddingIndex
+from server.utils.facial_recognition.preprocessor import preprocess_batch, crop_face
+from server.utils.facial_recognition.recognizer import compute_embedding, match_embeddings
+
+STAGES = ('decode', 'preprocess', 'crop', 'embed', 'match', 'quantization')
+
+# Synthetic embeddings: per-animal centre plus per-view jitter, scaled so
+# same-animal distances sit well under the 0.6 threshold and others well over
+ANIMAL_SCALE = 0.1
+VIEW_JITTER = 0.02
+
+
+# ---------- Synthetic data ----------
+
+def synthetic_animal_image(seed, height=1080, width=1440):
+    """A textured 'animal' (body, head, ears, eyes, patches) on a sky/grass background, as BGR."""
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    horizon = int(height * rng.uniform(0.3, 0.5))
+    image[:horizon] = np.linspace((235, 206, 135), (250, 230, 200), horizon, dtype=np.uint8)[:, None]
+    image[horizon:] = np.linspace((60, 140, 70), (30, 90, 40), height - horizon, dtype=np.uint8)[:, None]
+
+    coat = tuple(int(c) for c in rng.integers(20, 230, size=3))
+    cx, cy = int(width * rng.uniform(0.4, 0.6)), int(height * rng.uniform(0.5, 0.65))
+    body = (int(width * 0.25), int(height * 0.2))
+    cv2.ellipse(image, (cx, cy), body, 0, 0, 360, coat, -1)
+    for _ in range(rng.integers(3, 9)):
+        patch = (cx + int(rng.integers(-body[0], body[0]) * 0.7), cy + int(rng.integers(-body[1], body[1]) * 0.7))
+        cv2.circle(image, patch, int(rng.integers(20, 80)), tuple(255 - c for c in coat), -1)
+
+    head = (cx + body[0], cy - body[1])
+    radius = int(height * 0.12)
+    cv2.circle(image, head, radius, coat, -1)
+    for side in (-1, 1):
+        cv2.ellipse(image, (head[0] + side * radius, head[1] - radius // 2), (radius // 2, radius // 4),
+                    side * 30, 0, 360, coat, -1)
+        cv2.circle(image, (head[0] + side * radius // 3, head[1] - radius // 4), radius // 8, (20, 20, 20), -1)
+
+    noise = rng.normal(0, 6, size=image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def synthetic_request(seed, height=1080, width=1440, quality=90):
+    """Four JPEG-encoded views, as a verify request would upload them."""
+    views = {}
+    for i, view in enumerate(VIEWS):
+        ok, encoded = cv2.imencode('.jpg', synthetic_animal_image(seed * 4 + i, height, width),
+                                   [cv2.IMWRITE_JPEG_QUALITY, quality])
+        views[view] = encoded.tobytes()
+    return views
+
+
+def _gallery_chunks(n_rows, chunk_animals=50000, seed=0):
+    """Yield (first animal, (count * 4, dim) vectors, count) chunks of a clustered synthetic gallery."""
+    n_animals = max(1, n_rows // len(VIEWS))
+    for start in range(0, n_animals, chunk_animals):
+        count = min(chunk_animals, n_animals - start)
+        rng = np.random.default_rng((seed, start))
+        centres = rng.normal(scale=ANIMAL_SCALE, size=(count, 1, EMBEDDING_DIM)).astype(np.float32)
+        vectors = centres + rng.normal(scale=VIEW_JITTER, size=(count, len(VIEWS), EMBEDDING_DIM)).astype(np.float32)
+        yield start, vectors.reshape(-1, EMBEDDING_DIM), count
+
+
+def synthetic_gallery(n_rows, metric='l2', store_dir=None, seed=0, log=print):
+    """
+    An EmbeddingIndex of about n_rows embeddings (four views per animal).
+
+    In memory by default; with store_dir the rows are written once to an
+    EmbeddingStore there and memory-mapped, so multi-million galleries are
+    generated once and reused across runs.
+    """
+    n_animals = max(1, n_rows // len(VIEWS))
+    if store_dir is not None:
+        store = EmbeddingStore(store_dir)
+        if store.committed_rows() < n_animals * len(VIEWS):
+            if store.committed_rows():
+                raise SystemExit(f"{store_dir} holds a smaller gallery; remove it or pick another directory")
+            log(f"Writing {n_animals * len(VIEWS)} synthetic embeddings to {store_dir} ...")
+            for start, vectors, count in _gallery_chunks(n_rows, seed=seed):
+                store.append_many(
+                    (f"B-{start + i:08d}", vectors[i * len(VIEWS):(i + 1) * len(VIEWS)], VIEWS)
+                    for i in range(count)
+                )
+        return store.load_index(metric=metric)
+
+    vectors = np.empty((n_animals * len(VIEWS), EMBEDDING_DIM), dtype=np.float32)
+    for start, chunk, count in _gallery_chunks(n_rows, seed=seed):
+        vectors[start * len(VIEWS):(start + count) * len(VIEWS)] = chunk
+    labels = np.repeat(np.arange(n_animals, dtype=np.int32), len(VIEWS))
+    views = np.tile(np.array([VIEW_CODES[v] for v in VIEWS], dtype=np.int8), n_animals)
+    return EmbeddingIndex.from_arrays(
+        vectors, np.linalg.norm(vectors, axis=1), labels, views,
+        [f"B-{i:08d}" for i in range(n_animals)], metric=metric,
+    )
+
+
+# ---------- Measurement ----------
+
+def summarise(samples, units_per_sample=1):
+    """Latency percentiles (ms) and throughput (units/s) from per-sample seconds."""
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        'n': int(len(samples)),
+        'p50_ms': float(np.percentile(samples, 50) * 1000),
+        'p95_ms': float(np.percentile(samples, 95) * 1000),
+        'p99_ms': float(np.percentile(samples, 99) * 1000),
+        'mean_ms': float(samples.mean() * 1000),
+        'throughput_per_s': float(units_per_sample * len(samples) / samples.sum()) if samples.sum() else 0.0,
+    }
+
+
+def _time(fn, inputs, warmup=2):
+    for item in inputs[:warmup]:
+        fn(item)
+    samples = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+class _Rect:
+    """Face box with the dlib.rectangle accessors crop_face uses."""
+
+    def __init__(self, left, top, right, bottom):
+        self._box = (left, top, right, bottom)
+
+    def left(self):
+        return self._box[0]
+
+    def top(self):
+        return self._box[1]
+
+    def right(self):
+        return self._box[2]
+
+    def bottom(self):
+        return self._box[3]
+
+
+def run(stages=STAGES, gallery=10000, iterations=200, height=1080, width=1440, store_dir=None,
+        search_mode='exact', metric='l2', seed=0, quantized=False, log=print):
+    """Run the selected stages; returns the JSON-serialisable report."""
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'image_size': [width, height],
+            'iterations': iterations,
+            'gallery_rows': None,
+            'search_mode': search_mode,
+            'quantized': quantized,
+        },
+        'stages': {},
+    }
+    n_requests = min(iterations, 16)  # distinct photo sets, cycled through
+    requests = [synthetic_request(seed + i, height, width) for i in range(n_requests)] \
+        if set(stages) & {'decode', 'preprocess', 'crop', 'embed'} else []
+    cycle = [requests[i % n_requests] for i in range(iterations)] if requests else []
+    decoded = [[decode_image(data, min_side=Config.DECODE_MIN_SIDE) for data in views.values()] for views in requests]
+    decoded_cycle = [decoded[i % n_requests] for i in range(iterations)] if decoded else []
+    views_per_request = len(VIEWS)
+
+    if 'decode' in stages:
+        samples = _time(lambda views: [decode_image(d, min_side=Config.DECODE_MIN_SIDE) for d in views.values()], cycle)
+        report['stages']['decode'] = dict(summarise(samples, views_per_request), unit='views')
+
+    if 'preprocess' in stages:
+        out = np.empty((views_per_request, 160, 160, 3), dtype=np.float32)
+        samples = _time(lambda images: preprocess_batch(images, out=out), decoded_cycle)
+        report['stages']['preprocess'] = dict(summarise(samples, views_per_request), unit='views')
+
+    if 'crop' in stages:
+        def crop(images):
+            for image in images:
+                h, w = image.shape[:2]
+                crop_face(image, _Rect(w // 4, h // 6, w * 3 // 4, h * 2 // 3)).copy()
+        samples = _time(crop, decoded_cycle)
+        report['stages']['crop'] = dict(summarise(samples, views_per_request), unit='views')
+
+    if 'embed' in stages:
+        try:
+            compute_embedding(decoded[0][0])
+        except Exception as e:  # dlib or its model files not available on this machine
+            report['stages']['embed'] = {'skipped': f"{type(e).__name__}: {e}"}
+            log(f"embed skipped: {e}")
+        else:
+            samples = _time(lambda images: [compute_embedding(image) for image in images],
+                            decoded_cycle[:max(10, iterations // 10)])
+            report['stages']['embed'] = dict(summarise(samples, views_per_request), unit='views')
+
+    if {'match', 'quantization'} & set(stages):
+        started = time.perf_counter()
+        base = synthetic_gallery(gallery, metric=metric, store_dir=store_dir, seed=seed, log=log)
+        report['meta']['gallery_rows'] = len(base)
+        report['meta']['gallery_build_s'] = time.perf_counter() - started
+
+        # Queries are re-photographed gallery animals: their stored views plus fresh jitter
+        rng = np.random.default_rng(seed)
+        targets = rng.integers(0, len(base.animal_ids), size=iterations)
+        queries = [
+            base.reconstruct(base.rows_for([t]))
+            + rng.normal(scale=VIEW_JITTER / 2, size=(len(VIEWS), EMBEDDING_DIM)).astype(np.float32)
+            for t in targets
+        ]
+
+    if 'match' in stages:
+        index = _quantized(base, store_dir, metric) if quantized else base
+        if search_mode == 'ivf':
+            started = time.perf_counter()
+            index = IVFIndex.train(index, nlist=Config.IVF_NLIST, nprobe=Config.IVF_NPROBE)
+            report['meta']['ivf_train_s'] = time.perf_counter() - started
+
+        results = []
+        samples = _time(lambda q: results.append(match_embeddings(index, q, list(VIEWS))), queries, warmup=0)
+        hits = sum(1 for r, t in zip(results, targets) if r is not None and r[0] == base.animal_ids[t])
+        report['stages']['match'] = dict(summarise(samples), unit='queries',
+                                         top1_accuracy=hits / len(targets))
+
+    if 'quantization' in stages:
+        report['stages']['quantization'] = compare_quantized(base, _quantized(base, store_dir, metric), queries)
+
+    return report
+
+
+def _quantized(base, store_dir, metric):
+    if store_dir is not None:
+        return EmbeddingStore(store_dir).load_index(metric=metric, quantized=True)
+    return QuantizedEmbeddingIndex.from_index(base)
+
+
+def compare_quantized(exact, quantized, queries, k=10):
+    """
+    Recall of int8 asymmetric search against the exact float32 path.
+
+    recall_at_1 / recall_at_k: share of the exact top-1 / top-k rows (per view)
+    that the quantized search also returns in its top-1 / top-k;
+    match_agreement: share of queries whose fused match is the same animal.
+    Latency figures are for the quantized per-view search.
+    """
+    hit1 = hitk = agree = 0
+    float_samples, samples = [], []
+    for q in queries:
+        start = time.perf_counter()
+        exact_dist, exact_rows = exact.search(q, k=k, query_views=list(VIEWS))
+        float_samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        quant_dist, quant_rows = quantized.search(q, k=k, query_views=list(VIEWS))
+        samples.append(time.perf_counter() - start)
+
+        hit1 += int((exact_rows[:, 0] == quant_rows[:, 0]).sum())
+        hitk += sum(len(np.intersect1d(a, b)) for a, b in zip(exact_rows, quant_rows))
+        agree += _same_animal(match_embeddings(exact, q, list(VIEWS)), match_embeddings(quantized, q, list(VIEWS)))
+
+    n_views = len(queries) * len(VIEWS)
+    float_bytes = len(exact) * (exact.dim * 4 + 4)  # float32 rows + norms
+    return dict(
+        summarise(samples), unit='queries',
+        float_p50_ms=float(np.percentile(float_samples, 50) * 1000),
+        recall_at_1=hit1 / n_views,
+        recall_at_k=hitk / (n_views * k),
+        k=k,
+        match_agreement=agree / len(queries),
+        float_bytes=int(float_bytes),
+        quantized_bytes=int(quantized.nbytes),
+        memory_ratio=float_bytes / quantized.nbytes,
+    )
+
+
+def _same_animal(a, b):
+    return (a is None and b is None) or (a is not None and b is not None and a[0] == b[0])
+
+
+# ---------- Reporting ----------
+
+def print_report(report, out=sys.stdout):
+    meta = report['meta']
+    print(f"{meta['image_size'][0]}x{meta['image_size'][1]} images, {meta['iterations']} iterations, "
+          f"gallery={meta['gallery_rows']} rows ({meta['search_mode']}), {meta['cpu_count']} CPUs", file=out)
+    print(f"{'stage':12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'throughput':>16}", file=out)
+    for name, stats in report['stages'].items():
+        if 'skipped' in stats:
+            print(f"{name:12}  skipped ({stats['skipped']})", file=out)
+            continue
+        print(f"{name:12}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+              f"{stats['throughput_per_s']:>10.1f} {stats['unit']}/s", file=out)
+        if name == 'quantization':
+            print(f"{'':12}recall@1 {stats['recall_at_1']:.4f}  recall@{stats['k']} {stats['recall_at_k']:.4f}  "
+                  f"match agreement {stats['match_agreement']:.4f}  memory {stats['float_bytes'] / 2**20:.1f} -> "
+                  f"{stats['quantized_bytes'] / 2**20:.1f} MiB ({stats['memory_ratio']:.2f}x)  "
+                  f"float p50 {stats['float_p50_ms']:.3f} ms", file=out)
+
+
+def compare(report, baseline, tolerance=0.1, out=sys.stdout):
+    """Print p95 ratios against a baseline report; returns the names of regressed stages."""
+    regressed = []
+    print(f"{'stage':12}{'base p95':>10}{'new p95':>10}{'ratio':>8}", file=out)
+    for name, stats in report['stages'].items():
+        old = baseline.get('stages', {}).get(name)
+        if not old or 'p95_ms' not in old or 'p95_ms' not in stats:
+            continue
+        ratio = stats['p95_ms'] / old['p95_ms'] if old['p95_ms'] else float('inf')
+        flag = '  REGRESSION' if ratio > 1 + tolerance else ''
+        if flag:
+            regressed.append(name)
+        print(f"{name:12}{old['p95_ms']:>10.3f}{stats['p95_ms']:>10.3f}{ratio:>8.2f}{flag}", file=out)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma-separated subset of ' + ','.join(STAGES))
+    parser.add_argument('--gallery', type=int, default=10000, help='gallery size in embeddings (4 per animal)')
+    parser.add_argument('--store', default=None, help='generate/reuse the gallery as a memory-mapped store here')
+    parser.add_argument('--search-mode', choices=('exact', 'ivf'), default='exact')
+    parser.add_argument('--metric', choices=('l2', 'cosine'), default='l2')
+    parser.add_argument('--quantized', action='store_true', help='match against the int8 gallery')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--width', type=int, default=1440)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help='write the report here')
+    parser.add_argument('--compare', default=None, help='baseline report to compare p95 latencies against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed p95 slowdown before failing')
+    args = parser.parse_args()
+
+    stages = [s for s in args.stages.split(',') if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    report = run(stages, args.gallery, args.iterations, args.height, args.width, args.store,
+                 args.search_mode, args.metric, args.seed, args.quantized)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
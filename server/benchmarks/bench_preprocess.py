@@ -0,0 +1,58 @@
+# server/benchmarks/bench_preprocess.py
+"""
+Compare per-view preprocess_image against batched preprocess_batch.
+
+Reports latency and peak bytes allocated per four-view request.
+
+    python -m server.benchmarks.bench_preprocess --iterations 200
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from server.utils.facial_recognition.preprocessor import preprocess_image, preprocess_batch
+
+
+def _synthetic_views(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8) for _ in range(4)]
+
+
+def _measure(fn, iterations):
+    fn()  # warm up (scratch buffers, OpenCV thread pool)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    return elapsed / iterations * 1000.0, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--width', type=int, default=1440)
+    args = parser.parse_args()
+
+    views = _synthetic_views(args.height, args.width)
+    out = np.empty((4, 160, 160, 3), dtype=np.float32)
+
+    before = _measure(lambda: np.stack([preprocess_image(v) for v in views]), args.iterations)
+    after = _measure(lambda: preprocess_batch(views, out=out), args.iterations)
+
+    print(f"4 views of {args.width}x{args.height} -> 4x160x160x3 float32, {args.iterations} iterations")
+    print(f"{'':24}{'latency (ms)':>14}{'peak alloc (KiB)':>18}")
+    print(f"{'preprocess_image x4':24}{before[0]:>14.3f}{before[1] / 1024:>18.1f}")
+    print(f"{'preprocess_batch':24}{after[0]:>14.3f}{after[1] / 1024:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# server/build_ivf_index.py
+"""
+Train or refresh the persisted IVF index of a model version's embedding store.
+
+Web workers never train: with RECOGNITION_SEARCH_MODE=ivf they serve exact
+search until ivf.npz exists, then load it (and reload it whenever this
+command rewrites it), assigning rows appended since to their nearest cell.
+
+Run it once the gallery has IVF_NLIST * 39 rows, and then periodically
+(e.g. from cron) so workers have fewer new rows to catch up on at load:
+
+    python -m server.build_ivf_index
+    python -m server.build_ivf_index --retrain          # re-cluster from scratch
+    python -m server.build_ivf_index --model-version dlib-v2
+"""
+import argparse
+import os
+import sys
+
+from server.config import Config
+from server.utils.facial_recognition.ann_index import IVFIndex
+from server.utils.facial_recognition.model_versions import active_version
+from server.utils.facial_recognition.recognizer import get_index, ivf_path
+
+
+def build(version=None, retrain=False, log=print):
+    """Write the version's IVF index; returns False while the gallery is too small to train."""
+    version = version or active_version()
+    path = ivf_path(version)
+    base = get_index(exact=True, version=version)
+
+    if retrain or not os.path.exists(path):
+        if len(base) < Config.IVF_NLIST * 39:
+            log(f"{version}: {len(base)} rows, need {Config.IVF_NLIST * 39} to train {Config.IVF_NLIST} cells")
+            return False
+        log(f"{version}: training {Config.IVF_NLIST} cells over {len(base)} rows")
+        ann = IVFIndex.train(base, nlist=Config.IVF_NLIST, nprobe=Config.IVF_NPROBE)
+        ann.save(path)
+        log(f"Saved {path}")
+        return True
+
+    ann = IVFIndex.load(path, base, nprobe=Config.IVF_NPROBE)
+    added = ann.indexed_rows - ann.saved_rows
+    if added > Config.IVF_RESAVE_FRACTION * ann.saved_rows:
+        ann.save(path)
+        log(f"{version}: saved {path} with {added} new rows")
+    else:
+        log(f"{version}: {added} new rows since {path} was saved; left as is")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-version', default=None, help='store to index (default: the active version)')
+    parser.add_argument('--retrain', action='store_true', help='re-cluster even if an index already exists')
+    args = parser.parse_args()
+    sys.exit(0 if build(args.model_version, args.retrain) else 1)
+
+
+if __name__ == '__main__':
+    main()
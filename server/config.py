@@ -17,6 +17,98 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool and SQLite tuning (applied to every new connection)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # seconds to wait for a free connection
+    DB_READONLY_GETS = os.getenv('DB_READONLY_GETS', 'true').lower() == 'true'  # GETs read on query_only connections
+    DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', '10'))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))  # wait for the write lock
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # bytes
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))  # page cache per connection
+
+    # PaymentGuard.has_paid answers cached per worker, keyed by (animal_id, action_type)
+    PAYMENT_CACHE_SIZE = int(os.getenv('PAYMENT_CACHE_SIZE', '10000'))
+    PAYMENT_CACHE_TTL = float(os.getenv('PAYMENT_CACHE_TTL', '300'))  # seconds, "paid"
+    PAYMENT_CACHE_NEGATIVE_TTL = float(os.getenv('PAYMENT_CACHE_NEGATIVE_TTL', '5'))  # "not paid"; other workers' payments
+
+    # In-memory filter of registered animal IDs used by the bulk validator (server/utils/id_validator.py)
+    ANIMAL_FILTER_CAPACITY = int(os.getenv('ANIMAL_FILTER_CAPACITY', '1000000'))  # grows x2 when exceeded
+    ANIMAL_FILTER_REFRESH = float(os.getenv('ANIMAL_FILTER_REFRESH', '2'))  # seconds between loads of new rows
+    ANIMAL_FILTER_GAP_WINDOW = float(os.getenv('ANIMAL_FILTER_GAP_WINDOW', '300'))  # seconds to wait for ids committed out of order
+
+    # Offline sync uploads are inserted and committed this many rows at a time (server/utils/bulk_sync.py)
+    SYNC_CHUNK_SIZE = int(os.getenv('SYNC_CHUNK_SIZE', '1000'))
+    SYNC_MAX_RECORD_BYTES = int(os.getenv('SYNC_MAX_RECORD_BYTES', '65536'))  # longest line accepted by the NDJSON routes
+
+    # Animal / owner IDs: sequential per location, reserved from the database in blocks per worker.
+    # Pick the format before the first registration; switching it later can collide with earlier IDs.
+    ID_BLOCK_SIZE = int(os.getenv('ID_BLOCK_SIZE', '100'))
+    ID_SCRAMBLE = os.getenv('ID_SCRAMBLE', 'false').lower() == 'true'  # permute digits so IDs do not look sequential
+    ID_CHECK_DIGIT = os.getenv('ID_CHECK_DIGIT', 'false').lower() == 'true'  # append a Luhn digit to catch typos
+
     # Upload folder absolute path
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', os.path.join(PROJECT_ROOT, 'uploads'))
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', str(32 * 1024 * 1024)))  # uploads are held in memory
+
+    # Verify uploads are decoded in memory; optionally keep the originals (written in the background)
+    PERSIST_VERIFY_UPLOADS = os.getenv('PERSIST_VERIFY_UPLOADS', 'false').lower() == 'true'
+    DECODE_MIN_SIDE = int(os.getenv('DECODE_MIN_SIDE', '480'))  # shorter side kept by reduced-resolution decode
+
+    # Photo quality gate run on register/verify uploads before anything else
+    QUALITY_GATE = os.getenv('QUALITY_GATE', 'true').lower() == 'true'
+    QUALITY_MIN_SIDE = int(os.getenv('QUALITY_MIN_SIDE', '480'))               # px, original short side
+    QUALITY_MIN_SHARPNESS = float(os.getenv('QUALITY_MIN_SHARPNESS', '30'))     # Laplacian variance at 320px wide
+    QUALITY_MIN_BRIGHTNESS = float(os.getenv('QUALITY_MIN_BRIGHTNESS', '40'))   # mean grey level 0-255
+    QUALITY_MAX_BRIGHTNESS = float(os.getenv('QUALITY_MAX_BRIGHTNESS', '220'))
+    QUALITY_MAX_CLIPPED = float(os.getenv('QUALITY_MAX_CLIPPED', '0.5'))        # share of near-black/white pixels
+
+    # Facial recognition
+    RECOGNITION_METRIC = os.getenv('RECOGNITION_METRIC', 'l2')  # 'l2' or 'cosine'
+    RECOGNITION_MATCH_THRESHOLD = float(os.getenv('RECOGNITION_MATCH_THRESHOLD', '0.6'))
+    RECOGNITION_TOP_K = int(os.getenv('RECOGNITION_TOP_K', '10'))
+    RECOGNITION_SHORTLIST = int(os.getenv('RECOGNITION_SHORTLIST', '50'))  # animals kept after the lead view
+    RECOGNITION_EARLY_ACCEPT = float(os.getenv('RECOGNITION_EARLY_ACCEPT', '0.4'))  # stop scoring views below this
+    RECOGNITION_ACCEPT_MARGIN = float(os.getenv('RECOGNITION_ACCEPT_MARGIN', '0.1'))  # required lead over runner-up
+
+    # Recognition worker processes per web worker (0 = run inline on the request thread).
+    # Every web worker starts its own pool and each process loads the dlib models, so the
+    # host runs WEB_CONCURRENCY x RECOGNITION_WORKERS of them; the default splits the cores
+    # between the web workers (set WEB_CONCURRENCY to the gunicorn worker count).
+    RECOGNITION_WORKERS = int(os.getenv(
+        'RECOGNITION_WORKERS',
+        str(max(1, (os.cpu_count() or 1) // max(1, int(os.getenv('WEB_CONCURRENCY', '1'))))),
+    ))
+    RECOGNITION_MAX_PENDING = int(os.getenv('RECOGNITION_MAX_PENDING', '0')) or None  # default 2 x workers
+    RECOGNITION_TIMEOUT = float(os.getenv('RECOGNITION_TIMEOUT', '10'))  # seconds
+
+    # Verify result cache keyed by per-view dHash (absorbs retries of the same photos)
+    RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '10000'))
+    RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', '300'))  # seconds
+    EMBEDDING_STORE_DIR = os.getenv('EMBEDDING_STORE_DIR', os.path.join(PROJECT_ROOT, 'database', 'embeddings'))
+    # Face boxes, landmarks and aligned crops of stored images, keyed by blob hash ('' = disabled)
+    DETECTION_CACHE_DIR = os.getenv('DETECTION_CACHE_DIR', os.path.join(PROJECT_ROOT, 'database', 'detections'))
+    # Search the int8-quantized copy of the store (~3.8x less RAM, asymmetric distances)
+    RECOGNITION_QUANTIZED = os.getenv('RECOGNITION_QUANTIZED', 'false').lower() == 'true'
+    # Model version used until server.upgrade_model records another in the model state file
+    RECOGNITION_MODEL_VERSION = os.getenv('RECOGNITION_MODEL_VERSION', 'dlib-v1')
+    MODEL_STATE_PATH = os.getenv('MODEL_STATE_PATH', '')  # default <EMBEDDING_STORE_DIR>/model_state.json
+
+    # 'exact' brute-force search or 'ivf' approximate search for very large galleries.
+    # The IVF index is built offline (python -m server.build_ivf_index); exact search is used until it exists.
+    RECOGNITION_SEARCH_MODE = os.getenv('RECOGNITION_SEARCH_MODE', 'exact')
+    IVF_NLIST = int(os.getenv('IVF_NLIST', '1024'))    # cells; more = faster, needs >= 39 rows per cell to train
+    IVF_NPROBE = int(os.getenv('IVF_NPROBE', '16'))    # cells scanned per query; more = better recall
+    IVF_RESAVE_FRACTION = float(os.getenv('IVF_RESAVE_FRACTION', '0.05'))  # build_ivf_index re-persists after this much growth
+
+    # Registration near-duplicate check on front/side pHashes ('flag' = register and report, 'reject' = 409)
+    DUPLICATE_PHASH_RADIUS = int(os.getenv('DUPLICATE_PHASH_RADIUS', '6'))  # max differing bits of 64
+    DUPLICATE_POLICY = os.getenv('DUPLICATE_POLICY', 'flag')
+
+    # Verify searches animals seen/kept near the request GPS first, widening through these radii
+    # before falling back to the whole gallery (empty = always search everything)
+    GEO_SEARCH_RADII_KM = tuple(float(r) for r in os.getenv('GEO_SEARCH_RADII_KM', '10,50,200').split(',') if r.strip())
+    GEO_MAX_CANDIDATE_FRACTION = float(os.getenv('GEO_MAX_CANDIDATE_FRACTION', '0.25'))  # wider = just search all
+    GEO_INDEX_REFRESH = float(os.getenv('GEO_INDEX_REFRESH', '30'))  # seconds between picking up new positions
+    GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', os.path.join(PROJECT_ROOT, 'database', 'gazetteer.json'))
@@ -0,0 +1,15 @@
+# server/migrations/0001_recognition_columns.py
+"""Columns added for geo-pruned search and duplicate detection."""
+from . import add_column, create_index
+
+
+def upgrade(conn):
+    add_column(conn, 'owners', 'latitude', 'FLOAT')
+    add_column(conn, 'owners', 'longitude', 'FLOAT')
+
+    add_column(conn, 'animals', 'last_seen_lat', 'FLOAT')
+    add_column(conn, 'animals', 'last_seen_lng', 'FLOAT')
+    add_column(conn, 'animals', 'last_seen_at', 'DATETIME')
+    create_index(conn, 'ix_animals_last_seen_at', 'animals', ['last_seen_at'])
+
+    add_column(conn, 'animal_images', 'phash', 'BIGINT')
@@ -0,0 +1,16 @@
+# server/migrations/0002_payment_callbacks_and_hot_indexes.py
+"""Mpesa callback columns on payments, and indexes for the per-animal lookups."""
+from . import add_column, create_index
+
+
+def upgrade(conn):
+    add_column(conn, 'payments', 'action_type', 'VARCHAR(20)')
+    add_column(conn, 'payments', 'checkout_request_id', 'VARCHAR(100)')
+    add_column(conn, 'payments', 'result_code', 'VARCHAR(10)')
+    add_column(conn, 'payments', 'result_desc', 'TEXT')
+    add_column(conn, 'payments', 'transaction_date', 'DATETIME')
+
+    create_index(conn, 'ix_payments_animal_action_status', 'payments', ['animal_id', 'action_type', 'status'])
+    create_index(conn, 'uq_payments_checkout_request_id', 'payments', ['checkout_request_id'], unique=True)
+    create_index(conn, 'ix_ownership_history_animal_id', 'ownership_history', ['animal_id', 'timestamp'])
+    create_index(conn, 'ix_slaughter_records_animal_id', 'slaughter_records', ['animal_id'])
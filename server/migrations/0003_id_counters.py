@@ -0,0 +1,10 @@
+# server/migrations/0003_id_counters.py
+"""Per-prefix sequence counters for block-allocated animal / owner IDs."""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS id_counters ("
+        "prefix VARCHAR(20) NOT NULL PRIMARY KEY, next_value BIGINT NOT NULL)"
+    ))
@@ -0,0 +1,11 @@
+# server/migrations/0004_sync_idempotency_keys.py
+"""Client idempotency keys on the offline-synced tables, unique so a retried upload cannot insert twice."""
+from . import add_column, create_index
+
+TABLES = ('slaughter_records', 'ownership_history', 'payments')
+
+
+def upgrade(conn):
+    for table in TABLES:
+        add_column(conn, table, 'idempotency_key', 'VARCHAR(64)')
+        create_index(conn, f'uq_{table}_idempotency_key', table, ['idempotency_key'], unique=True)
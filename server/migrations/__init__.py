@@ -0,0 +1,84 @@
+# server/migrations/__init__.py
+"""
+Versioned schema migrations.
+
+db.create_all() only creates missing tables; it never adds a column or an
+index to a table that already exists. Every schema change after the first
+release is therefore also written as a migration: a module NNNN_name.py in
+this package defining upgrade(conn). Applied versions are recorded in the
+schema_migrations table, and create_app runs whatever is pending right
+after create_all().
+
+Migrations must be safe on a database that create_all() has just built
+from the current models (columns and indexes already present), so they use
+add_column() / create_index() below, which skip what already exists.
+"""
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+_MODULE = re.compile(r'^(\d{4})_\w+$')
+
+
+def discover():
+    """All migrations as (version, name, module), oldest first."""
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        match = _MODULE.match(info.name)
+        if match:
+            migrations.append((int(match.group(1)), info.name, importlib.import_module(f"{__name__}.{info.name}")))
+    return sorted(migrations, key=lambda m: m[0])
+
+
+def add_column(conn, table, name, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column exists. ddl: type and constraints, e.g. 'FLOAT'."""
+    if name not in {column['name'] for column in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def create_index(conn, name, table, columns, unique=False):
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    ))
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def migrate(engine, log=None):
+    """
+    Apply every pending migration in one transaction and return their names.
+
+    On SQLite the transaction starts with BEGIN IMMEDIATE, so when several
+    web workers start at once one of them migrates and the others wait on
+    the write lock, then find nothing left to do.
+    """
+    done = []
+    with engine.begin() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+        applied = applied_versions(conn)
+        for version, name, module in discover():
+            if version in applied:
+                continue
+            module.upgrade(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :at)"),
+                {'version': version, 'name': name, 'at': datetime.utcnow()},
+            )
+            done.append(name)
+            if log:
+                log(f"Applied migration {name}")
+    return done
@@ -2,8 +2,14 @@
 
 from flask_sqlalchemy import SQLAlchemy
 
-# Initialize SQLAlchemy
-db = SQLAlchemy()
+from .engine import RoutingSession, init_db
+
+# The one SQLAlchemy instance (and engine) shared by every model
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Import models so they are registered with SQLAlchemy
-from .animal import Animal, Owner
+from .animal import Animal, Owner, AnimalImage
+from .payment import Payment
+from .slaughter_record import SlaughterRecord
+from .ownership_history import OwnershipHistory
+from .id_counter import IdCounter
@@ -11,6 +11,9 @@ class Owner(db.Model):
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
     location = db.Column(db.String(100), nullable=False)
+    # Geocoded once from `location` when the owner is created
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
 
     animals = db.relationship('Animal', backref='owner', lazy=True)
 
@@ -33,5 +36,52 @@ class Animal(db.Model):
 
     registered_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Where the animal was last photographed (registration or a successful verify)
+    last_seen_lat = db.Column(db.Float, nullable=True)
+    last_seen_lng = db.Column(db.Float, nullable=True)
+    last_seen_at = db.Column(db.DateTime, nullable=True, index=True)
+
     def __repr__(self):
         return f"<Animal {self.animal_id} owned by {self.owner_id}>"
+
+    def mark_seen(self, lat, lng, when=None):
+        """Record a sighting; the caller commits."""
+        self.last_seen_lat = lat
+        self.last_seen_lng = lng
+        self.last_seen_at = when or datetime.utcnow()
+
+
+class AnimalImage(db.Model):
+    """Index of an animal's views to content-addressed image blobs."""
+    __tablename__ = 'animal_images'
+    __table_args__ = (db.UniqueConstraint('animal_id', 'image_type', name='uq_animal_images_view'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    animal_id = db.Column(db.String(50), nullable=False)
+    image_type = db.Column(db.String(10), nullable=False)  # 'front', 'back', 'left', 'right'
+    blob_hash = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 of the file contents
+    phash = db.Column(db.BigInteger, nullable=True)  # 64-bit perceptual hash, stored signed
+    image_path = db.Column(db.String(255), nullable=False)
+    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<AnimalImage {self.animal_id} {self.image_type} {self.blob_hash[:12]}>"
+
+    @classmethod
+    def index_images(cls, animal_id, image_paths, blob_hashes, phashes=None):
+        """
+        Point (animal_id, view) at the stored blobs, replacing earlier uploads.
+        image_paths / blob_hashes: dicts of view -> path / SHA-256
+        phashes: optional dict of view -> signed 64-bit perceptual hash
+        Caller commits.
+        """
+        existing = {img.image_type: img for img in cls.query.filter_by(animal_id=animal_id).all()}
+        for view, path in image_paths.items():
+            if not path:
+                continue
+            entry = existing.get(view) or cls(animal_id=animal_id, image_type=view)
+            entry.blob_hash = blob_hashes[view]
+            entry.image_path = path
+            entry.phash = (phashes or {}).get(view)
+            entry.uploaded_at = datetime.utcnow()
+            db.session.add(entry)
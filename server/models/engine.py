@@ -0,0 +1,101 @@
+# server/models/engine.py
+
+from functools import partial
+
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from ..config import Config
+
+# Bind key of the second engine that serves reads on GET requests
+READONLY_BIND = 'readonly'
+READ_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+def sqlite_pragmas(read_only=False):
+    """
+    Per-connection SQLite settings:
+        journal_mode=WAL     readers never block the writer and vice versa
+        synchronous=NORMAL   fsync at checkpoints only (safe with WAL)
+        busy_timeout         wait for the write lock instead of failing with "database is locked"
+        mmap_size            read pages straight from the page cache
+        cache_size           negative = KiB of page cache per connection
+        query_only           on the GET engine, so a read path can never write
+    """
+    pragmas = [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', Config.SQLITE_BUSY_TIMEOUT_MS),
+        ('mmap_size', Config.SQLITE_MMAP_SIZE),
+        ('cache_size', -Config.SQLITE_CACHE_SIZE_KB),
+    ]
+    if read_only:
+        pragmas.append(('query_only', 'ON'))
+    return pragmas
+
+
+def _apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def _is_file_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(uri, pool_size=None):
+    """Pool settings for a file database; in-memory SQLite keeps Flask-SQLAlchemy's single static connection."""
+    if make_url(uri).get_backend_name() == 'sqlite' and not _is_file_sqlite(uri):
+        return {}
+    return {
+        'pool_size': pool_size or Config.DB_POOL_SIZE,
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+        'pool_timeout': Config.DB_POOL_TIMEOUT,
+        'pool_pre_ping': make_url(uri).get_backend_name() != 'sqlite',
+    }
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads made while handling a GET (or HEAD/OPTIONS)
+    request to the read-only engine when one is configured. Flushes, and
+    every request with another method, use the primary engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and request.method in READ_METHODS:
+            engine = self._db.engines.get(READONLY_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_db(app, db):
+    """
+    Configure and attach the single shared SQLAlchemy instance to ``app``.
+
+    File-backed SQLite gets a sized connection pool, the WAL pragmas above on
+    every new connection, and (DB_READONLY_GETS) a second, smaller pool of
+    query_only connections used for GET requests.
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri))
+
+    if Config.DB_READONLY_GETS and _is_file_sqlite(uri):
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(READONLY_BIND, {'url': uri, **engine_options(uri, Config.DB_READ_POOL_SIZE)})
+
+    db.init_app(app)
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                pragmas = sqlite_pragmas(read_only=key == READONLY_BIND)
+                event.listen(engine, 'connect', partial(_apply_pragmas, pragmas))
@@ -0,0 +1,14 @@
+# server/models/id_counter.py
+
+from . import db
+
+
+class IdCounter(db.Model):
+    """Next unreserved sequence number per ID prefix (e.g. 'A-NE'); see utils/id_generator.py."""
+    __tablename__ = 'id_counters'
+
+    prefix = db.Column(db.String(20), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f"<IdCounter {self.prefix} next={self.next_value}>"
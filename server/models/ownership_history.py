@@ -1,11 +1,16 @@
 # server/models/ownership_history.py
 from datetime import datetime
-from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from . import db
 
 class OwnershipHistory(db.Model):
     __tablename__ = 'ownership_history'
+    # An animal's history, oldest first
+    __table_args__ = (
+        db.Index('ix_ownership_history_animal_id', 'animal_id', 'timestamp'),
+        # Offline sync replays (server/utils/bulk_sync.py)
+        db.Index('uq_ownership_history_idempotency_key', 'idempotency_key', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     animal_id = db.Column(db.String(50), nullable=False)
@@ -18,6 +23,7 @@ class OwnershipHistory(db.Model):
     changed_by = db.Column(db.String(50), nullable=True)  # Admin or system user ID
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     notes = db.Column(db.Text, nullable=True)  # Optional description or reason
+    idempotency_key = db.Column(db.String(64), nullable=True)  # Client-chosen, for offline sync retries
 
     def to_dict(self):
         return {
@@ -32,6 +38,7 @@ class OwnershipHistory(db.Model):
             "changed_by": self.changed_by,
             "timestamp": self.timestamp.isoformat(),
             "notes": self.notes,
+            "idempotency_key": self.idempotency_key,
         }
 
     @classmethod
@@ -1,11 +1,18 @@
 # server/models/payment.py
 from datetime import datetime
-from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from . import db
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        # PaymentGuard.has_paid: WHERE animal_id = ? AND action_type = ? AND status = ?
+        db.Index('ix_payments_animal_action_status', 'animal_id', 'action_type', 'status'),
+        # PaymentGuard.record_payment de-duplicates callbacks on this (NULLs allowed)
+        db.Index('uq_payments_checkout_request_id', 'checkout_request_id', unique=True),
+        # Offline sync replays (server/utils/bulk_sync.py)
+        db.Index('uq_payments_idempotency_key', 'idempotency_key', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     animal_id = db.Column(db.String(50), nullable=False)
@@ -16,6 +23,13 @@ class Payment(db.Model):
     transaction_id = db.Column(db.String(100), nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     synced = db.Column(db.Boolean, default=False)  # Whether offline payment has been synced
+    action_type = db.Column(db.String(20), nullable=True)  # 'ownership' or 'slaughter'
+    # Mpesa STK callback fields
+    checkout_request_id = db.Column(db.String(100), nullable=True)
+    result_code = db.Column(db.String(10), nullable=True)
+    result_desc = db.Column(db.Text, nullable=True)
+    transaction_date = db.Column(db.DateTime, nullable=True)
+    idempotency_key = db.Column(db.String(64), nullable=True)  # Client-chosen, for offline sync retries
 
     def to_dict(self):
         return {
@@ -28,6 +42,12 @@ class Payment(db.Model):
             "transaction_id": self.transaction_id,
             "timestamp": self.timestamp.isoformat(),
             "synced": self.synced,
+            "action_type": self.action_type,
+            "checkout_request_id": self.checkout_request_id,
+            "result_code": self.result_code,
+            "result_desc": self.result_desc,
+            "transaction_date": self.transaction_date.isoformat() if self.transaction_date else None,
+            "idempotency_key": self.idempotency_key,
         }
 
     def mark_success(self, transaction_id: str):
@@ -1,11 +1,15 @@
 # server/models/slaughter_record.py
 from datetime import datetime
-from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from . import db
 
 class SlaughterRecord(db.Model):
     __tablename__ = 'slaughter_records'
+    __table_args__ = (
+        db.Index('ix_slaughter_records_animal_id', 'animal_id'),
+        # Offline sync replays (server/utils/bulk_sync.py)
+        db.Index('uq_slaughter_records_idempotency_key', 'idempotency_key', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     animal_id = db.Column(db.String(50), nullable=False)
@@ -14,6 +18,7 @@ class SlaughterRecord(db.Model):
     location = db.Column(db.String(255), nullable=True)  # Slaughter location
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     synced = db.Column(db.Boolean, default=False)  # For offline records
+    idempotency_key = db.Column(db.String(64), nullable=True)  # Client-chosen, for offline sync retries
 
     def to_dict(self):
         return {
@@ -24,6 +29,7 @@ class SlaughterRecord(db.Model):
             "location": self.location,
             "timestamp": self.timestamp.isoformat(),
             "synced": self.synced,
+            "idempotency_key": self.idempotency_key,
         }
 
     @classmethod
@@ -1,14 +1,19 @@
 import os
+import json
 from flask import request, jsonify
-from werkzeug.utils import secure_filename
 
 # Relative imports
 from ..models import db
-from ..models.animal import Animal, Owner
+from ..models.animal import Animal, Owner, AnimalImage
 from ..utils.id_generator import generate_animal_id, generate_owner_id
-from ..utils.image_processor import save_images
-from ..utils.facial_recognition.recognizer import recognize_animal
-from ..utils.id_validator import animal_exists  # ✅ Import validator
+from ..config import Config
+from ..utils.image_processor import save_images, read_upload, persist_upload_async, blob_hash
+from ..utils.geocoder import geocode
+from ..utils.image_quality import quality_failures
+from ..utils.facial_recognition.recognizer import recognize_animal, index_animal, record_sighting
+from ..utils.facial_recognition.duplicate_index import DUPLICATE_VIEWS, phash, to_signed, find_duplicates
+from ..utils.facial_recognition.worker_pool import RecognitionBusy, RecognitionTimeout
+from ..utils.id_validator import animal_exists, remember_animal  # ✅ Import validator
 from ..utils.logger import log_event  # optional logging
 
 from . import api_bp
@@ -16,6 +21,20 @@ from . import api_bp
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
 
 
+def _registration_position(form):
+    """(lat, lng) sent with a registration, either as fields or per-view image_<side>_gps JSON."""
+    lat, lng = form.get('latitude', type=float), form.get('longitude', type=float)
+    if lat is not None and lng is not None:
+        return lat, lng
+    for side in ('front', 'back', 'left', 'right'):
+        try:
+            gps = json.loads(form.get(f'image_{side}_gps') or 'null')
+            return float(gps['latitude']), float(gps['longitude'])
+        except (ValueError, TypeError, KeyError):
+            continue
+    return None
+
+
 @api_bp.route('/register', methods=['POST'])
 def register_animal():
     try:
@@ -24,14 +43,42 @@ def register_animal():
         owner_location = request.form.get('owner_location')
         owner_id = request.form.get('owner_id') or generate_owner_id()
 
+        uploads = {view: read_upload(file) for view, file in request.files.items()
+                   if view in ('front', 'back', 'left', 'right') and file}
+
+        # Reject unusable photos before storing or hashing anything
+        if Config.QUALITY_GATE:
+            failures = quality_failures(uploads)
+            if failures:
+                return jsonify({
+                    'success': False,
+                    'error': 'Some photos need to be retaken.',
+                    'quality': failures
+                }), 422
+
+        # Near-duplicate check: the same animal (or photos) registered again
+        phashes = {view: phash(uploads[view]) for view in DUPLICATE_VIEWS if view in uploads}
+        duplicates = find_duplicates(phashes, Config.DUPLICATE_PHASH_RADIUS)
+        if duplicates:
+            log_event(f"Possible duplicate registration of {sorted({d['animal_id'] for d in duplicates})}")
+            if Config.DUPLICATE_POLICY == 'reject':
+                return jsonify({
+                    'success': False,
+                    'error': 'These photos match an animal that is already registered.',
+                    'possible_duplicates': duplicates
+                }), 409
+
         # Save or get owner
         owner = Owner.query.filter_by(owner_id=owner_id).first()
         if not owner:
+            home = geocode(owner_location) or (None, None)
             owner = Owner(
                 owner_id=owner_id,
                 name=owner_name,
                 phone=owner_phone,
-                location=owner_location
+                location=owner_location,
+                latitude=home[0],
+                longitude=home[1]
             )
             db.session.add(owner)
             db.session.commit()
@@ -51,9 +98,24 @@ def register_animal():
             image_left=image_paths['left'],
             image_right=image_paths['right']
         )
+        position = _registration_position(request.form)
+        if position is not None:
+            animal.mark_seen(*position)
 
         db.session.add(animal)
+        AnimalImage.index_images(
+            animal_id, image_paths,
+            {view: blob_hash(path) for view, path in image_paths.items() if path},
+            {view: to_signed(value) for view, value in phashes.items() if value is not None}
+        )
         db.session.commit()
+        remember_animal(animal.animal_id)
+
+        # Make the new animal matchable by /verify
+        try:
+            index_animal(animal.animal_id, image_paths)
+        except Exception as e:
+            log_event(f"Embedding failed for animal {animal.animal_id}: {e}")
 
         return jsonify({
             'success': True,
@@ -62,7 +124,8 @@ def register_animal():
             'owner_id': owner.owner_id,
             'owner_name': owner.name,
             'owner_phone': owner.phone,
-            'owner_location': owner.location
+            'owner_location': owner.location,
+            'possible_duplicates': duplicates
         }), 201
 
     except Exception as e:
@@ -113,25 +176,42 @@ def verify_animal():
         if not timestamp:
             return jsonify({'success': False, 'error': 'Timestamp is required.'}), 400
 
-        # 5️⃣ Save images
-        image_paths = {}
-        for key, file in image_files.items():
-            filename = secure_filename(file.filename)
-            path = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(path)
-            image_paths[key] = path
-
-        # 6️⃣ Perform recognition
-        result = recognize_animal(image_paths)
-
-        # 7️⃣ Log verification attempt
+        # 5️⃣ Read images into memory (decoded by the recognition workers)
+        image_data = {key: read_upload(file) for key, file in image_files.items()}
+
+        # 6️⃣ Reject blurry / dark / tiny photos before spending recognition CPU
+        if Config.QUALITY_GATE:
+            failures = quality_failures(image_data)
+            if failures:
+                return jsonify({
+                    'success': False,
+                    'error': 'Some photos need to be retaken.',
+                    'quality': failures
+                }), 422
+
+        if Config.PERSIST_VERIFY_UPLOADS:
+            for data in image_data.values():
+                persist_upload_async(data, UPLOAD_FOLDER)
+
+        # 7️⃣ Perform recognition (on the recognition worker pool)
+        try:
+            result = recognize_animal(image_data, location=(gps_lat, gps_lng))
+        except RecognitionBusy:
+            return jsonify({'success': False, 'error': 'Recognition service busy, please retry.'}), 503
+        except RecognitionTimeout:
+            return jsonify({'success': False, 'error': 'Recognition timed out, please retry.'}), 504
+
+        # 8️⃣ Log verification attempt
         log_event(f"Verification attempted for animal {animal_id or 'unknown'} with GPS ({gps_lat},{gps_lng})")
 
-        if result:
+        if result and result['animal'] is not None:
             animal, owner = result['animal'], result['owner']
             if not animal_exists(animal.animal_id):
                 return jsonify({'success': False, 'error': 'Animal not found in database.'}), 400
 
+            record_sighting(animal, gps_lat, gps_lng)
+            db.session.commit()
+
             return jsonify({
                 'success': True,
                 'match_found': True,
@@ -1,10 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from server.models.ownership_history import db, OwnershipHistory
 from datetime import datetime
 from server.utils.payment_guard import PaymentGuard  # ✅ Import payment guard
 from server.utils.id_validator import animal_exists     # ✅ Import animal ID validator
+from server.utils.image_processor import unbounded_upload
+from server.utils.bulk_sync import NDJSON, Rejected, owner_details, stream_sync, sync_records
 from sqlalchemy.exc import SQLAlchemyError
 from server.utils.logger import logger  # ✅ Added logger
+from server.utils.facial_recognition.result_cache import invalidate_animal, invalidate_animals
 
 ownership_bp = Blueprint('ownership_bp', __name__, url_prefix='/ownership')
 
@@ -55,6 +58,7 @@ def change_ownership():
         )
         db.session.add(record)
         db.session.commit()
+        invalidate_animal(animal_id)
 
         logger.info(f"Ownership change recorded for animal_id={animal_id}, offline={offline}")
         return jsonify({"success": True, "record": record.to_dict(), "offline": offline})
@@ -75,7 +79,8 @@ def sync_offline_ownership_changes():
             "animal_id": "...",
             "previous_owner_id": "...",
             "new_owner_id": "...",
-            "reason": "Sold"
+            "reason": "Sold",
+            "idempotency_key": "..."  # optional; a retried change is answered from the stored row
         },
         ...
     ]
@@ -85,44 +90,63 @@ def sync_offline_ownership_changes():
         logger.warning("Offline ownership sync attempt with invalid payload")
         return jsonify({"success": False, "message": "Invalid payload"}), 400
 
-    synced = []
-    failed = []
-
     try:
-        # ✅ Wrap entire batch in a single transaction
-        with db.session.begin():
-            for change in changes:
-                animal_id = change.get('animal_id')
-
-                # ✅ Validate animal ID
-                if not animal_exists(animal_id):
-                    failed.append({"change": change, "error": "Invalid animal_id"})
-                    logger.warning(f"Offline ownership change skipped: invalid animal_id {animal_id}")
-                    continue  # Skip this change
-
-                # ✅ Payment check per change
-                if not PaymentGuard.has_paid(animal_id, 'ownership'):
-                    failed.append({"change": change, "error": "Payment not found or not successful"})
-                    logger.warning(f"Offline ownership change skipped for animal_id={animal_id}: payment not found")
-                    continue  # Skip this change
-
-                record = OwnershipHistory(
-                    animal_id=animal_id,
-                    previous_owner_id=change.get('previous_owner_id'),
-                    new_owner_id=change.get('new_owner_id'),
-                    reason=change.get('reason', ''),
-                    timestamp=datetime.utcnow(),
-                    synced=True  # mark as synced immediately
-                )
-                db.session.add(record)
-                synced.append(record.to_dict())
-                logger.info(f"Offline ownership change synced for animal_id={animal_id}")
-
-        # ✅ Return results after successful transaction
-        return jsonify({"success": True, "synced": synced, "failed": failed})
+        # ✅ Batch-validated, inserted and committed in chunks (a failed chunk doesn't undo the others)
+        synced, failed, replayed = _sync_batch(changes)
+
+        logger.info(f"Offline ownership sync: {len(synced)} synced, {len(replayed)} replayed, {len(failed)} failed")
+        return jsonify({
+            "success": True,
+            "synced": [row for _, row in synced + replayed],
+            "replayed": len(replayed),
+            "failed": [{"change": change, "error": error} for change, error in failed],
+        })
 
     except SQLAlchemyError as e:
         db.session.rollback()
         logger.error(f"Failed to sync offline ownership changes: {str(e)}")
-        # Mark all as failed if transaction fails
         return jsonify({"success": False, "synced": [], "failed": changes, "error": str(e)})
+
+
+@ownership_bp.route('/sync_offline/stream', methods=['POST'])
+@unbounded_upload
+def stream_offline_ownership_changes():
+    """
+    Sync offline ownership changes uploaded as NDJSON (one change object per line).
+    Changes are read and processed in batches while the upload arrives; the
+    response streams one result line per change:
+    {"line": 1, "success": true, "change": {...}}
+    {"line": 2, "success": false, "change": {...}, "error": "Invalid animal_id"}
+    {"done": true, "synced": 1, "failed": 1}
+    """
+    logger.info("Offline ownership sync stream started")
+    return Response(stream_with_context(stream_sync(request.stream, _sync_batch, 'change')), mimetype=NDJSON)
+
+
+def _sync_batch(changes):
+    now = datetime.utcnow()
+
+    # ✅ Owner names / phones for the whole batch in one lookup
+    owners = owner_details(
+        owner_id
+        for change in changes if isinstance(change, dict)
+        for owner_id in (change.get('previous_owner_id'), change.get('new_owner_id'))
+    )
+
+    def build_row(change):
+        row = {"animal_id": change['animal_id'], "changed_by": change.get('changed_by'),
+               "timestamp": now, "notes": change.get('reason', '')}
+        for side in ('previous', 'new'):
+            owner_id = change.get(f'{side}_owner_id')
+            name, phone = owners.get(owner_id, (None, None))
+            name = change.get(f'{side}_owner_name') or name
+            phone = change.get(f'{side}_owner_phone') or phone
+            if not owner_id or not name or not phone:
+                raise Rejected(f"Unknown {side} owner")
+            row.update({f'{side}_owner_id': owner_id, f'{side}_owner_name': name,
+                        f'{side}_owner_phone': phone})
+        return row
+
+    synced, failed, replayed = sync_records(changes, OwnershipHistory, build_row, action_type='ownership')
+    invalidate_animals(row["animal_id"] for _, row in synced)
+    return synced, failed, replayed
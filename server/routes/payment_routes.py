@@ -1,8 +1,12 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from server.models.payment import db, Payment
 from server.utils.mpesa_client import MpesaClient
-from server.utils.id_validator import animal_exists  # ✅ Import animal ID validator
+from server.utils.id_validator import IN_CHUNK, animal_exists  # ✅ Import animal ID validator
+from server.utils.image_processor import unbounded_upload
+from server.utils.bulk_sync import NDJSON, Rejected, stored_rows, stream_sync, sync_records
+from server.utils.payment_cache import invalidate_paid
 from datetime import datetime
+from sqlalchemy import update
 from sqlalchemy.exc import SQLAlchemyError
 
 payment_bp = Blueprint('payment_bp', __name__, url_prefix='/payment')
@@ -81,55 +85,139 @@ def sync_offline_payments():
     Endpoint to sync offline payments.
     Expects an array of payment objects:
     [
-        { "animal_id": "...", "amount": ..., "phone_number": "...", "payment_method": "Mpesa" },
+        { "animal_id": "...", "amount": ..., "phone_number": "...", "payment_method": "Mpesa",
+          "idempotency_key": "..." },
         ...
     ]
+    A payment whose idempotency_key was already stored is answered with the
+    stored row and no new STK push (counted in "replayed"), including one
+    still "pending", whose push may still be in flight. Only a payment whose
+    push is recorded as "failed" is pushed again.
     """
     payments = request.get_json()
     if not payments or not isinstance(payments, list):
         return jsonify({"success": False, "message": "Invalid payload"}), 400
 
-    synced = []
-    failed = []
-
     try:
-        # ✅ Wrap entire batch in a single transaction
-        with db.session.begin():
-            for p in payments:
-                animal_id = p.get('animal_id')
-
-                # ✅ Validate animal ID per payment
-                if not animal_exists(animal_id):
-                    failed.append({"payment": p, "error": "Invalid animal_id"})
-                    continue  # Skip invalid payment
-
-                payment = Payment(
-                    animal_id=animal_id,
-                    amount=p.get('amount'),
-                    phone_number=p.get('phone_number'),
-                    payment_method=p.get('payment_method', 'Mpesa'),
-                    status='pending',
-                    timestamp=datetime.utcnow(),
-                    synced=False,
-                )
-                db.session.add(payment)
-
-                # Attempt online payment
-                try:
-                    transaction_id = mpesa_client.stk_push(
-                        phone_number=payment.phone_number,
-                        amount=payment.amount,
-                        reference=f"ANIMAL-{payment.animal_id}"
-                    )
-                    payment.transaction_id = transaction_id
-                    payment.status = 'success'
-                    payment.synced = True
-                    synced.append(payment.to_dict())
-                except Exception as e:
-                    failed.append({"payment": p, "error": f"Mpesa error: {str(e)}"})
-
-        return jsonify({"success": True, "synced": synced, "failed": failed})
+        # ✅ Batch-validated and stored as pending, committed in chunks
+        synced, failed, replayed = _sync_batch(payments)
+        return jsonify({
+            "success": True,
+            "synced": [row for _, row in synced + replayed],
+            "replayed": len(replayed),
+            "failed": [{"payment": p, "error": error} for p, error in failed],
+        })
 
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"success": False, "synced": [], "failed": payments, "error": str(e)})
+
+
+@payment_bp.route('/sync_offline/stream', methods=['POST'])
+@unbounded_upload
+def stream_offline_payments():
+    """
+    Sync offline payments uploaded as NDJSON (one payment object per line).
+    Payments are read and processed in batches while the upload arrives; the
+    response streams one result line per payment:
+    {"line": 1, "success": true, "payment": {...}}
+    {"line": 2, "success": false, "payment": {...}, "error": "Mpesa error: ..."}
+    {"done": true, "synced": 1, "failed": 1}
+    """
+    return Response(stream_with_context(stream_sync(request.stream, _sync_batch, 'payment')), mimetype=NDJSON)
+
+
+def _sync_batch(payments):
+    now = datetime.utcnow()
+
+    def build_row(p):
+        if not p.get('amount') or not p.get('phone_number'):
+            raise Rejected("Missing required fields")
+        return {
+            "animal_id": p['animal_id'],
+            "amount": p['amount'],
+            "phone_number": p['phone_number'],
+            "payment_method": p.get('payment_method', 'Mpesa'),
+            "action_type": p.get('action_type'),
+            "status": 'pending',
+            "timestamp": now,
+            "synced": False,
+        }
+
+    stored, failed, replayed = sync_records(payments, Payment, build_row)
+
+    # A row whose push failed is pushed again once this upload has claimed it back to
+    # pending (a concurrent retry may get there first); pending and paid rows are replayed
+    retries = [(p, row) for p, row in replayed if row['status'] == 'failed']
+    replayed = [(p, row) for p, row in replayed if row['status'] != 'failed']
+    if retries:
+        try:
+            claimed = _claim_failed(sorted({row['id'] for _, row in retries}))
+            current = stored_rows(Payment, (row['idempotency_key'] for _, row in retries if row['id'] not in claimed))
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            failed += [(p, f"Database error: {str(e)}") for p, _ in retries]
+            retries = []
+        pushing = {}  # payment id -> row, so a payment repeated in this upload is pushed once
+        for p, row in retries:
+            if row['id'] not in claimed:
+                replayed.append((p, current.get(row['idempotency_key'], row)))
+            elif row['id'] in pushing:
+                replayed.append((p, pushing[row['id']]))
+            else:
+                pushing[row['id']] = {**row, "status": 'pending'}
+                stored.append((p, pushing[row['id']]))
+
+    # Attempt online payment for each record not yet paid, saving each outcome as soon as it is
+    # known so a crash later in the batch cannot leave a charged payment looking unpaid
+    synced = []
+    for p, row in stored:
+        try:
+            transaction_id = mpesa_client.stk_push(
+                phone_number=row['phone_number'],
+                amount=row['amount'],
+                reference=f"ANIMAL-{row['animal_id']}"
+            )
+        except Exception as e:
+            _save_push_result(row, 'failed')
+            failed.append((p, f"Mpesa error: {str(e)}"))
+            continue
+        error = _save_push_result(row, 'success', transaction_id)
+        if error:
+            # The row stays pending, so a retried upload does not push it again
+            failed.append((p, f"Payment {transaction_id} was sent but not recorded: {error}"))
+            continue
+        synced.append((p, row))
+
+    invalidate_paid(row['animal_id'] for _, row in synced)
+    return synced, failed, replayed
+
+
+def _claim_failed(payment_ids):
+    """
+    Move failed payments back to pending in one transaction; returns the ids
+    this call moved, so only one of several concurrent retries pushes each.
+    """
+    claimed = set()
+    for start in range(0, len(payment_ids), IN_CHUNK):
+        claimed.update(db.session.execute(
+            update(Payment)
+            .where(Payment.id.in_(payment_ids[start:start + IN_CHUNK]), Payment.status == 'failed')
+            .values(status='pending')
+            .returning(Payment.id)
+        ).scalars())
+    db.session.commit()
+    return claimed
+
+
+def _save_push_result(row, status, transaction_id=None):
+    """Commit one STK push outcome to its payment row (and ``row``); returns the error if that fails."""
+    values = {"status": status, "transaction_id": transaction_id, "synced": status == 'success'}
+    try:
+        db.session.execute(update(Payment).where(Payment.id == row['id']).values(**values))
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return str(e)
+    row.update(values)
+    return None
@@ -1,10 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from server.models.slaughter_record import db, SlaughterRecord
 from datetime import datetime
 from server.utils.payment_guard import PaymentGuard  # ✅ Import payment guard
 from server.utils.id_validator import animal_exists     # ✅ Import animal ID validator
+from server.utils.image_processor import unbounded_upload
+from server.utils.bulk_sync import NDJSON, stream_sync, sync_records
 from sqlalchemy.exc import SQLAlchemyError
 from server.utils.logger import logger  # ✅ Added logger
+from server.utils.facial_recognition.result_cache import invalidate_animal, invalidate_animals
 
 slaughter_bp = Blueprint('slaughter_bp', __name__, url_prefix='/slaughter')
 
@@ -55,6 +58,7 @@ def record_slaughter():
         )
         db.session.add(record)
         db.session.commit()
+        invalidate_animal(animal_id)
 
         logger.info(f"Slaughter record created for animal_id={animal_id}, offline={offline}")
         return jsonify({"success": True, "record": record.to_dict(), "offline": offline})
@@ -75,7 +79,8 @@ def sync_offline_slaughter_records():
             "animal_id": "...",
             "owner_id": "...",
             "reason": "...",
-            "location": "..."
+            "location": "...",
+            "idempotency_key": "..."  # optional; a retried record is answered from the stored row
         },
         ...
     ]
@@ -85,45 +90,52 @@ def sync_offline_slaughter_records():
         logger.warning("Offline slaughter sync attempt with invalid payload")
         return jsonify({"success": False, "message": "Invalid payload"}), 400
 
-    synced = []
-    failed = []
-
     try:
-        # ✅ Wrap entire batch in a single transaction
-        with db.session.begin():
-            for r in records:
-                animal_id = r.get('animal_id')
-                owner_id = r.get('owner_id')
-
-                # ✅ Validate animal ID
-                if not animal_exists(animal_id):
-                    failed.append({"record": r, "error": "Invalid animal_id"})
-                    logger.warning(f"Offline slaughter record skipped: invalid animal_id {animal_id}")
-                    continue  # Skip this record
-
-                # ✅ Payment check per record
-                if not PaymentGuard.has_paid(animal_id, 'slaughter'):
-                    failed.append({"record": r, "error": "Payment not found or not successful"})
-                    logger.warning(f"Offline slaughter record skipped for animal_id={animal_id}: payment not found")
-                    continue  # Skip this record
-
-                record = SlaughterRecord(
-                    animal_id=animal_id,
-                    owner_id=owner_id,
-                    reason=r.get('reason', ''),
-                    location=r.get('location', ''),
-                    timestamp=datetime.utcnow(),
-                    synced=True  # mark as synced immediately
-                )
-                db.session.add(record)
-                synced.append(record.to_dict())
-                logger.info(f"Offline slaughter record synced for animal_id={animal_id}")
-
-        # ✅ Return results after successful transaction
-        return jsonify({"success": True, "synced": synced, "failed": failed})
+        # ✅ Batch-validated, inserted and committed in chunks (a failed chunk doesn't undo the others)
+        synced, failed, replayed = _sync_batch(records)
+
+        logger.info(f"Offline slaughter sync: {len(synced)} synced, {len(replayed)} replayed, {len(failed)} failed")
+        return jsonify({
+            "success": True,
+            "synced": [row for _, row in synced + replayed],
+            "replayed": len(replayed),
+            "failed": [{"record": r, "error": error} for r, error in failed],
+        })
 
     except SQLAlchemyError as e:
         db.session.rollback()
         logger.error(f"Failed to sync offline slaughter records: {str(e)}")
-        # Mark all as failed if transaction fails
         return jsonify({"success": False, "synced": [], "failed": records, "error": str(e)})
+
+
+@slaughter_bp.route('/sync_offline/stream', methods=['POST'])
+@unbounded_upload
+def stream_offline_slaughter_records():
+    """
+    Sync offline slaughter records uploaded as NDJSON (one record object per line).
+    Records are read and processed in batches while the upload arrives; the
+    response streams one result line per record:
+    {"line": 1, "success": true, "record": {...}}
+    {"line": 2, "success": false, "record": {...}, "error": "Invalid animal_id"}
+    {"done": true, "synced": 1, "failed": 1}
+    """
+    logger.info("Offline slaughter sync stream started")
+    return Response(stream_with_context(stream_sync(request.stream, _sync_batch, 'record')), mimetype=NDJSON)
+
+
+def _sync_batch(records):
+    now = datetime.utcnow()
+
+    def build_row(r):
+        return {
+            "animal_id": r['animal_id'],
+            "authorized_by": r.get('authorized_by'),
+            "reason": r.get('reason', ''),
+            "location": r.get('location', ''),
+            "timestamp": now,
+            "synced": True,  # mark as synced immediately
+        }
+
+    synced, failed, replayed = sync_records(records, SlaughterRecord, build_row, action_type='slaughter')
+    invalidate_animals(row["animal_id"] for _, row in synced)
+    return synced, failed, replayed
@@ -0,0 +1,23 @@
+# server/tests/conftest.py
+import pytest
+from flask import Flask
+
+from server.models import db, init_db
+
+# ---------- Fixtures ----------
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    A bare app on a file-backed SQLite database, configured like create_app.
+    Test modules that need seed data override this fixture and extend it.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'livestock.db'}"
+    init_db(app, db)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
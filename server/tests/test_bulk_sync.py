@@ -0,0 +1,311 @@
+# server/tests/test_bulk_sync.py
+import io
+import json
+
+import pytest
+from flask import Flask, Response, request, stream_with_context
+from werkzeug.exceptions import ClientDisconnected, RequestEntityTooLarge
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from server.models import db, Animal, Owner, OwnershipHistory, Payment, SlaughterRecord
+from server.utils import bulk_sync, payment_cache
+from server.utils.bulk_sync import Rejected, iter_ndjson, owner_details, stored_rows, stream_sync, sync_records
+from server.utils.image_processor import InMemoryUploadRequest, unbounded_upload
+from server.utils.payment_cache import PaymentClearanceCache, paid_animals
+
+# ---------- Helpers ----------
+
+@pytest.fixture
+def app(app, monkeypatch):
+    """
+    The shared test app with 300 registered animals, the even-numbered ones paid for slaughter.
+    """
+    monkeypatch.setattr(payment_cache, '_cache', PaymentClearanceCache())
+    with app.app_context():
+        owner = Owner(owner_id='O-NE00001', name='Jane', phone='254700000000', location='Nairobi')
+        db.session.add(owner)
+        db.session.flush()
+        db.session.add_all(Animal(animal_id=f"A-NE{i:05d}", owner_id=owner.id, image_front='f',
+                                  image_back='b', image_left='l', image_right='r') for i in range(300))
+        db.session.add_all(Payment(animal_id=f"A-NE{i:05d}", amount=100, phone_number='254700000000',
+                                   action_type='slaughter', status='success') for i in range(0, 300, 2))
+        db.session.commit()
+    return app
+
+
+def _statements(app):
+    """
+    Collect the SQL run on every engine.
+    """
+    statements = []
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+def _slaughter_row(r):
+    return {"animal_id": r['animal_id'], "authorized_by": None, "reason": r.get('reason', ''),
+            "location": '', "timestamp": None, "synced": True}
+
+
+# ---------- Bulk Sync Tests ----------
+
+def test_sync_validates_batch_up_front_and_inserts_in_chunks(app):
+    """
+    Ensure unknown and unpaid animals are refused and accepted rows go in as one INSERT per chunk.
+    """
+    records = [{"animal_id": f"A-NE{i:05d}", "reason": str(i)} for i in range(300)]
+    records += [{"animal_id": 'X-XX00000'}, "not a record", {}]
+    statements = _statements(app)
+
+    with app.test_request_context(method='POST'):
+        synced, failed, _ = sync_records(records * 10, SlaughterRecord, _slaughter_row,
+                                         action_type='slaughter', chunk_size=500)
+        stored = dict(SlaughterRecord.query.with_entities(SlaughterRecord.id, SlaughterRecord.reason))
+
+    assert len(synced) == 1500
+    assert {row['id']: row['reason'] for _, row in synced} == stored
+    assert [row['reason'] for _, row in synced[:3]] == ['0', '2', '4']
+    assert synced[0][1]['synced'] is True
+    assert len(failed) == 1530
+    assert {error for _, error in failed} == {"Invalid animal_id", "Payment not found or not successful"}
+    assert sum(s.lstrip().startswith('INSERT') for s in statements) == 3
+
+
+def test_failed_chunk_leaves_other_chunks_committed(app):
+    """
+    Ensure a chunk that violates a constraint is rolled back alone and Rejected refuses single records.
+    """
+    owners = {'O-NE00001': ('Jane', '254700000000')}
+
+    def build_row(change):
+        if change.get('reject'):
+            raise Rejected("Unknown new owner")
+        name, phone = owners.get(change['new_owner_id'], (None, None))
+        return {"animal_id": change['animal_id'], "previous_owner_id": 'O-NE00001',
+                "previous_owner_name": 'Jane', "previous_owner_phone": '254700000000',
+                "new_owner_id": change['new_owner_id'], "new_owner_name": name,
+                "new_owner_phone": phone, "changed_by": None, "timestamp": None, "notes": None}
+
+    changes = [{"animal_id": f"A-NE{i:05d}", "new_owner_id": 'O-NE00001'} for i in range(10)]
+    changes[4]['new_owner_id'] = 'O-NE99999'  # NOT NULL violation in the second chunk
+    changes[8]['reject'] = True
+
+    with app.test_request_context(method='POST'):
+        synced, failed, _ = sync_records(changes, OwnershipHistory, build_row, chunk_size=3)
+        assert OwnershipHistory.query.count() == 6
+
+    assert [row['animal_id'] for _, row in synced] == [f"A-NE{i:05d}" for i in (0, 1, 2, 6, 7, 9)]
+    assert [change['animal_id'] for change, _ in failed] == [f"A-NE{i:05d}" for i in (3, 4, 5, 8)]
+    assert failed[-1][1] == "Unknown new owner"
+    assert all(error.startswith("Database error") for _, error in failed[:-1])
+
+
+def test_database_errors_after_a_commit_are_reported_per_record(app, monkeypatch):
+    """
+    Ensure an error looking up a failed chunk's keys fails that chunk only, keeping the committed ones reported.
+    """
+    lookups = []
+
+    def flaky_lookup(model, keys):
+        lookups.append(1)
+        if len(lookups) > 1:
+            raise OperationalError("SELECT", {}, Exception("database is locked"))
+        return stored_rows(model, keys)
+
+    def build_row(r):
+        return {**_slaughter_row(r), "animal_id": None if r.get('broken') else r['animal_id']}
+
+    records = [{"animal_id": f"A-NE{i:05d}", "idempotency_key": f"k{i}"} for i in range(6)]
+    records[4]['broken'] = True  # NOT NULL violation in the second chunk
+    monkeypatch.setattr(bulk_sync, 'stored_rows', flaky_lookup)
+
+    with app.test_request_context(method='POST'):
+        synced, failed, replayed = sync_records(records, SlaughterRecord, build_row, chunk_size=3)
+        assert SlaughterRecord.query.count() == 3
+
+    assert [r["idempotency_key"] for r, _ in synced] == ['k0', 'k1', 'k2']
+    assert [r["idempotency_key"] for r, _ in failed] == ['k3', 'k4', 'k5'] and replayed == []
+    assert all(error.startswith("Database error") for _, error in failed)
+
+
+def test_batch_lookups_use_and_fill_caches(app):
+    """
+    Ensure payment clearance and owner details are resolved in one query each and then served from cache.
+    """
+    statements = _statements(app)
+    animal_ids = [f"A-NE{i:05d}" for i in range(300)]
+
+    with app.test_request_context(method='POST'):
+        assert paid_animals(animal_ids, 'slaughter') == set(animal_ids[::2])
+        assert paid_animals(animal_ids, 'slaughter') == set(animal_ids[::2])
+        assert owner_details(['O-NE00001', 'O-NE99999', None]) == {'O-NE00001': ('Jane', '254700000000')}
+
+    assert len(statements) == 2
+    assert payment_cache.get_clearance_cache().stats()['hits'] == 300
+
+
+# ---------- NDJSON Streaming Tests ----------
+
+def test_iter_ndjson_reports_bad_lines_without_buffering_them():
+    """
+    Ensure blank lines are skipped and invalid, non-object and oversized lines come back as errors.
+    """
+    upload = b'{"animal_id": "A"}\n\n[1, 2]\nnot json\n{"reason": "' + b'x' * 100 + b'"}\n{"animal_id": "B"}'
+    results = list(iter_ndjson(io.BytesIO(upload), max_line=64))
+
+    assert results == [
+        (1, {"animal_id": "A"}, None),
+        (3, None, "Invalid record"),
+        (4, None, "Invalid JSON"),
+        (5, None, "Record too large"),
+        (6, {"animal_id": "B"}, None),
+    ]
+
+
+def test_stream_sync_answers_each_batch_before_reading_the_next():
+    """
+    Ensure results for a batch are streamed while the rest of the upload is still unread.
+    """
+    upload = io.BytesIO(b''.join(json.dumps({"animal_id": f"A-NE{i:05d}", "n": i}).encode() + b'\n'
+                                 for i in range(1000)))
+    batches = []
+
+    def sync_batch(records):
+        batches.append(len(records))
+        return ([(r, {"id": r["n"]}) for r in records if r["n"] % 2 == 0],
+                [(r, "Invalid animal_id") for r in records if r["n"] % 2], [])
+
+    results = stream_sync(upload, sync_batch, 'record', batch_size=10)
+    first = [json.loads(next(results)) for _ in range(10)]
+
+    assert batches == [10]
+    assert upload.tell() < 1000
+    assert first[0] == {"line": 1, "success": True, "record": {"id": 0}}
+    assert first[1] == {"line": 2, "success": False, "record": {"animal_id": 'A-NE00001', "n": 1},
+                        "error": "Invalid animal_id"}
+
+    rest = [json.loads(line) for line in results]
+    assert rest[-1] == {"done": True, "synced": 500, "replayed": 0, "failed": 500}
+    assert [r["line"] for r in first + rest[:-1]] == list(range(1, 1001))
+    assert batches == [10] * 100
+
+
+def test_stream_sync_stores_records_batch_by_batch(app):
+    """
+    Ensure an NDJSON upload goes through the same validation and chunked inserts as a JSON array.
+    """
+    upload = io.BytesIO(b''.join(json.dumps({"animal_id": f"A-NE{i:05d}"}).encode() + b'\n'
+                                 for i in range(300)) + b'oops\n')
+
+    with app.test_request_context(method='POST'):
+        sync_batch = lambda records: sync_records(records, SlaughterRecord, _slaughter_row, action_type='slaughter')
+        results = [json.loads(line) for line in stream_sync(upload, sync_batch, 'record', batch_size=64)]
+        assert SlaughterRecord.query.count() == 150
+
+    assert results[-1] == {"done": True, "synced": 150, "replayed": 0, "failed": 151}
+    results = sorted(results[:-1], key=lambda r: r["line"])
+    assert results[-1] == {"line": 301, "success": False, "record": None, "error": "Invalid JSON"}
+    assert all(r["success"] == (r["line"] % 2 == 1) for r in results[:300])
+
+
+def _echo_batch(records):
+    return [(r, r) for r in records], [], []
+
+
+def test_stream_sync_settles_read_records_when_the_upload_breaks():
+    """
+    Ensure a failed read still answers the records already read and ends with an error summary.
+    """
+    class BrokenStream(io.BytesIO):
+        def readline(self, size=-1):
+            if self.tell() >= 72:  # after 8 lines
+                raise ClientDisconnected()
+            return super().readline(size)
+
+    upload = BrokenStream(b''.join(b'{"n": %d}\n' % i for i in range(100)))
+    results = [json.loads(line) for line in stream_sync(upload, _echo_batch, 'record', batch_size=4)]
+
+    assert [r["line"] for r in results[:-1]] == list(range(1, 9))
+    assert results[-1]["done"] is True and results[-1]["synced"] == 8
+    assert results[-1]["error"].startswith("Upload interrupted")
+
+
+def test_streaming_views_are_exempt_from_max_content_length():
+    """
+    Ensure unbounded_upload lifts MAX_CONTENT_LENGTH for its view only.
+    """
+    app = Flask(__name__)
+    app.request_class = InMemoryUploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = 1024
+
+    @app.route('/stream', methods=['POST'])
+    @unbounded_upload
+    def stream():
+        return Response(stream_with_context(stream_sync(request.stream, _echo_batch, 'record')))
+
+    @app.route('/bounded', methods=['POST'])
+    def bounded():
+        return Response(request.stream.read())
+
+    upload = b''.join(b'{"n": %d}\n' % i for i in range(2000))
+
+    with app.test_request_context('/stream', method='POST', data=upload):
+        assert request.max_content_length is None
+        results = [json.loads(line) for line in stream().response]
+    assert results[-1] == {"done": True, "synced": 2000, "replayed": 0, "failed": 0}
+
+    with app.test_request_context('/bounded', method='POST', data=upload):
+        assert request.max_content_length == 1024
+        with pytest.raises(RequestEntityTooLarge):
+            request.stream.read()
+
+
+# ---------- Idempotency Tests ----------
+
+def test_retried_upload_is_answered_from_stored_rows(app):
+    """
+    Ensure a replayed upload inserts nothing, runs one key lookup and returns the rows stored the first time.
+    """
+    records = [{"animal_id": f"A-NE{i:05d}", "reason": str(i), "idempotency_key": f"tablet-7:{i}"}
+               for i in range(0, 100, 2)]
+    records.append(dict(records[0]))  # the same record twice in one upload
+
+    with app.test_request_context(method='POST'):
+        first, failed, replayed = sync_records(records, SlaughterRecord, _slaughter_row, action_type='slaughter')
+        assert (len(first), failed, replayed[0][1]) == (50, [], first[0][1])
+
+        statements = _statements(app)
+        synced, failed, retry = sync_records(records, SlaughterRecord, _slaughter_row, action_type='slaughter')
+        assert len(statements) == 1 and 'idempotency_key IN' in statements[0]
+        assert SlaughterRecord.query.count() == 50
+
+    assert (synced, failed) == ([], [])
+    assert [row for _, row in retry] == [row for _, row in first] + [first[0][1]]
+
+
+def test_invalid_keys_are_refused_and_raced_keys_replayed(app, monkeypatch):
+    """
+    Ensure unusable keys fail their record, and a chunk losing a race on the unique index is replayed, not lost.
+    """
+    lookups = []
+
+    def racing_lookup(model, keys):
+        # The first lookup misses k2, as if another worker stored it just afterwards
+        lookups.append(1)
+        return {} if len(lookups) == 1 else stored_rows(model, keys)
+
+    records = [{"animal_id": f"A-NE{i:05d}", "idempotency_key": f"k{i}"} for i in range(5)]
+    records += [{"animal_id": 'A-NE00000', "idempotency_key": 7}, {"animal_id": 'A-NE00000', "idempotency_key": 'x' * 65}]
+
+    with app.test_request_context(method='POST'):
+        sync_records([{"animal_id": 'A-NE00002', "idempotency_key": 'k2'}], SlaughterRecord, _slaughter_row)
+        monkeypatch.setattr(bulk_sync, 'stored_rows', racing_lookup)
+        synced, failed, replayed = sync_records(records, SlaughterRecord, _slaughter_row)
+        assert SlaughterRecord.query.count() == 5
+
+    assert [r["idempotency_key"] for r, _ in synced] == ['k0', 'k1', 'k3', 'k4']
+    assert [r["idempotency_key"] for r, _ in replayed] == ['k2']
+    assert [error for _, error in failed] == ["Invalid idempotency_key"] * 2
@@ -0,0 +1,180 @@
+# server/tests/test_database.py
+import threading
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import OperationalError
+
+from server.migrations import discover, migrate
+from server.models import db, Animal, Payment, SlaughterRecord, OwnershipHistory
+from server.models.engine import READONLY_BIND
+
+# ---------- Helpers ----------
+
+@pytest.fixture
+def app(app):
+    """
+    The shared test app with the migrations applied.
+    """
+    with app.app_context():
+        migrate(db.engine)
+    return app
+
+
+# ---------- Engine Tests ----------
+
+def test_every_model_shares_one_engine(app):
+    """
+    Ensure payment, slaughter and ownership models use the same SQLAlchemy instance as Animal.
+    """
+    for model in (Payment, SlaughterRecord, OwnershipHistory):
+        assert model.metadata is db.metadata
+
+    with app.app_context():
+        assert {'animals', 'payments', 'slaughter_records', 'ownership_history'} <= set(db.metadata.tables)
+        assert SlaughterRecord.create_record('A-NE00001', reason='test').id == 1
+
+
+def test_sqlite_connections_use_wal_pragmas(app):
+    """
+    Ensure every connection runs in WAL mode with a busy timeout instead of failing on a locked database.
+    """
+    with app.app_context():
+        pragma = lambda name: db.session.execute(text(f"PRAGMA {name}")).scalar()
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1  # NORMAL
+        assert pragma('busy_timeout') > 0
+        assert pragma('cache_size') < 0
+
+
+def test_get_requests_read_on_query_only_connections(app):
+    """
+    Ensure GET reads go to the read-only pool while ORM writes still use the primary engine.
+    """
+    with app.test_request_context('/api/animals', method='GET'):
+        assert db.session.get_bind() is db.engines[READONLY_BIND]
+        with pytest.raises(OperationalError):
+            db.session.execute(text("DELETE FROM payments"))
+        db.session.rollback()
+
+        db.session.add(Payment(animal_id='A-NE00001', amount=10, phone_number='254700000000'))
+        db.session.commit()
+        assert Payment.query.count() == 1
+        db.session.remove()
+
+    with app.test_request_context('/api/register', method='POST'):
+        assert db.session.get_bind() is db.engines[None]
+
+
+def test_concurrent_writers_wait_for_the_lock(app):
+    """
+    Ensure parallel writers queue on the busy timeout instead of raising "database is locked".
+    """
+    errors = []
+
+    def write(n):
+        with app.app_context():
+            try:
+                for i in range(20):
+                    db.session.add(Payment(animal_id=f'A-NE{n:02d}{i:03d}', amount=1, phone_number='254700000000'))
+                    db.session.commit()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with app.app_context():
+        assert Payment.query.count() == 160
+
+
+# ---------- Migration Tests ----------
+
+# Tables as the first release's models created them
+LEGACY_SCHEMA = """
+CREATE TABLE owners (id INTEGER PRIMARY KEY, owner_id VARCHAR(50) NOT NULL UNIQUE, name VARCHAR(100) NOT NULL,
+                     phone VARCHAR(20) NOT NULL, location VARCHAR(100) NOT NULL);
+CREATE TABLE animals (id INTEGER PRIMARY KEY, animal_id VARCHAR(50) NOT NULL UNIQUE,
+                      owner_id INTEGER NOT NULL REFERENCES owners (id), image_front VARCHAR(255) NOT NULL,
+                      image_back VARCHAR(255) NOT NULL, image_left VARCHAR(255) NOT NULL,
+                      image_right VARCHAR(255) NOT NULL, registered_at DATETIME);
+CREATE TABLE animal_images (id INTEGER PRIMARY KEY, animal_id VARCHAR(50) NOT NULL, image_type VARCHAR(10) NOT NULL,
+                            blob_hash VARCHAR(64) NOT NULL, image_path VARCHAR(255) NOT NULL, uploaded_at DATETIME,
+                            CONSTRAINT uq_animal_images_view UNIQUE (animal_id, image_type));
+CREATE INDEX ix_animal_images_blob_hash ON animal_images (blob_hash);
+CREATE TABLE payments (id INTEGER PRIMARY KEY, animal_id VARCHAR(50) NOT NULL, amount FLOAT NOT NULL,
+                       phone_number VARCHAR(20) NOT NULL, payment_method VARCHAR(20) NOT NULL,
+                       status VARCHAR(20) NOT NULL, transaction_id VARCHAR(100), timestamp DATETIME, synced BOOLEAN);
+CREATE TABLE ownership_history (id INTEGER PRIMARY KEY, animal_id VARCHAR(50) NOT NULL,
+                                previous_owner_id VARCHAR(50) NOT NULL, previous_owner_name VARCHAR(100) NOT NULL,
+                                previous_owner_phone VARCHAR(20) NOT NULL, new_owner_id VARCHAR(50) NOT NULL,
+                                new_owner_name VARCHAR(100) NOT NULL, new_owner_phone VARCHAR(20) NOT NULL,
+                                changed_by VARCHAR(50), timestamp DATETIME, notes TEXT);
+CREATE TABLE slaughter_records (id INTEGER PRIMARY KEY, animal_id VARCHAR(50) NOT NULL, authorized_by VARCHAR(50),
+                                reason TEXT, location VARCHAR(255), timestamp DATETIME, synced BOOLEAN);
+"""
+
+
+def _schema(engine):
+    inspector = inspect(engine)
+    return {
+        table: ({c['name'] for c in inspector.get_columns(table)},
+                {i['name'] for i in inspector.get_indexes(table)})
+        for table in inspector.get_table_names() if table != 'schema_migrations'
+    }
+
+
+def test_migrations_bring_a_legacy_database_up_to_the_models(app, tmp_path):
+    """
+    Ensure migrating a first-release database yields the same columns and indexes as create_all.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA.split(';'):
+            if statement.strip():
+                conn.exec_driver_sql(statement)
+
+    assert migrate(engine) == [name for _, name, _ in discover()]
+    assert migrate(engine) == []
+
+    with app.app_context():
+        assert _schema(engine) == _schema(db.engine)
+    engine.dispose()
+
+
+def _plan(query):
+    """SQLite's EXPLAIN QUERY PLAN for an ORM query, as one string."""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+    return ' | '.join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize('query, index', [
+    # PaymentGuard.has_paid
+    (lambda: Payment.query.filter_by(animal_id='A-NE00001', action_type='slaughter', status='success'),
+     'ix_payments_animal_action_status'),
+    # PaymentGuard.record_payment duplicate check
+    (lambda: Payment.query.filter_by(checkout_request_id='ws_CO_0001'), 'uq_payments_checkout_request_id'),
+    # An animal's ownership history in order
+    (lambda: OwnershipHistory.query.filter_by(animal_id='A-NE00001').order_by(OwnershipHistory.timestamp),
+     'ix_ownership_history_animal_id'),
+    (lambda: SlaughterRecord.query.filter_by(animal_id='A-NE00001'), 'ix_slaughter_records_animal_id'),
+    (lambda: Animal.query.filter_by(animal_id='A-NE00001'), 'sqlite_autoindex_animals'),
+    # Offline sync replay lookup (bulk_sync.stored_rows)
+    (lambda: Payment.query.filter_by(idempotency_key='tablet-7:1'), 'uq_payments_idempotency_key'),
+])
+def test_hot_queries_use_an_index(app, query, index):
+    """
+    Ensure each hot lookup searches an index instead of scanning (or sorting) the table.
+    """
+    with app.app_context():
+        plan = _plan(query())
+    assert index in plan
+    assert 'SCAN' not in plan and 'TEMP B-TREE' not in plan
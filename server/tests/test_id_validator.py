@@ -0,0 +1,123 @@
+# server/tests/test_id_validator.py
+import numpy as np
+import pytest
+from sqlalchemy import event
+
+from server.models import db, Animal, Owner
+from server.utils import id_validator
+from server.utils.id_validator import AnimalIdFilter, BloomFilter, animal_exists, animals_exist
+
+# ---------- Helpers ----------
+
+@pytest.fixture
+def app(app):
+    """
+    The shared test app with 1,200 registered animals.
+    """
+    with app.app_context():
+        owner = Owner(owner_id='O-NE00001', name='Jane', phone='254700000000', location='Nairobi')
+        db.session.add(owner)
+        db.session.flush()
+        db.session.add_all(_animal(f"A-NE{i:05d}", owner.id) for i in range(1200))
+        db.session.commit()
+    return app
+
+
+def _animal(animal_id, owner_id):
+    return Animal(animal_id=animal_id, owner_id=owner_id, image_front='f', image_back='b',
+                  image_left='l', image_right='r')
+
+
+def _count_queries(app):
+    """
+    Collect the SQL run on every engine (reads may use the read-only one).
+    """
+    statements = []
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+# ---------- Bloom Filter Tests ----------
+
+def test_bloom_filter_has_no_false_negatives():
+    """
+    Ensure every added key is found and unknown keys are mostly rejected.
+    """
+    bloom = BloomFilter(capacity=20000, error_rate=0.01)
+    added = [f"A-NE{i:06d}" for i in range(20000)]
+    bloom.add(added)
+
+    assert bloom.might_contain(added).all()
+    assert bloom.might_contain([f"B-SW{i:06d}" for i in range(20000)]).mean() < 0.02
+    assert len(bloom.might_contain([])) == 0
+
+
+# ---------- Bulk Validator Tests ----------
+
+def test_bulk_validation_batches_queries(app, monkeypatch):
+    """
+    Ensure a large batch takes one refresh plus one IN query per chunk, and unknown IDs never reach the database.
+    """
+    monkeypatch.setattr(id_validator, '_filter', AnimalIdFilter(capacity=10000, refresh=60))
+    statements = _count_queries(app)
+    batch = [f"A-NE{i:05d}" for i in range(0, 2400, 2)] + [None, '', f"X-XX{0:05d}"] * 100
+
+    with app.app_context():
+        found = animals_exist(batch)
+
+    assert found == {f"A-NE{i:05d}" for i in range(0, 1200, 2)}
+    in_queries = [s for s in statements if ' IN ' in s]
+    assert len(statements) == 1 + len(in_queries)
+    assert len(in_queries) <= 2  # ~600 filter positives / 500 per chunk
+
+    statements.clear()
+    with app.app_context():
+        assert animals_exist([f"B-SW{i:05d}" for i in range(100)]) == set()
+        assert not animal_exists('A-NE99999')
+    # Refresh is throttled; only the filter's rare false positives are looked up
+    assert all(' IN ' in s for s in statements) and len(statements) <= 2
+
+
+def test_registered_animals_are_visible_immediately(app, monkeypatch):
+    """
+    Ensure remember_animal makes a new registration valid before the next refresh, and the filter grows when full.
+    """
+    animal_filter = AnimalIdFilter(capacity=1000, refresh=60)
+    monkeypatch.setattr(id_validator, '_filter', animal_filter)
+
+    with app.app_context():
+        assert animal_exists('A-NE00001')
+        assert animal_filter.capacity >= 2400  # rebuilt past its initial 1,000 IDs
+
+        owner = Owner.query.first()
+        db.session.add(_animal('A-NE09999', owner.id))
+        db.session.commit()
+        id_validator.remember_animal('A-NE09999')
+        assert animal_exists('A-NE09999')
+        assert np.all(animal_filter.bloom.might_contain([f"A-NE{i:05d}" for i in range(1200)]))
+
+
+def test_ids_committed_out_of_order_are_picked_up(app, monkeypatch):
+    """
+    Ensure a row committed below the filter's high-water mark is still found on a later refresh.
+    """
+    animal_filter = AnimalIdFilter(capacity=5000, refresh=0)
+    monkeypatch.setattr(id_validator, '_filter', animal_filter)
+
+    with app.app_context():
+        # Id 1100 is still in flight when the filter loads up to 1200
+        late = db.session.get(Animal, 1100)
+        late_animal_id, owner_id = late.animal_id, late.owner_id
+        db.session.delete(late)
+        db.session.commit()
+        assert not animal_exists(late_animal_id)
+        assert animal_filter.max_id == 1200 and 1100 in animal_filter.gaps
+
+        late = _animal(late_animal_id, owner_id)
+        late.id = 1100
+        db.session.add(late)
+        db.session.commit()
+        assert animal_exists(late_animal_id)
+        assert not animal_filter.gaps
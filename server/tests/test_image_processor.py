@@ -0,0 +1,98 @@
+# server/tests/test_image_processor.py
+from io import BytesIO
+
+import cv2
+import numpy as np
+from werkzeug.datastructures import FileStorage
+
+from server.utils.image_processor import (
+    decode_image, read_upload, persist_upload_async, save_images, store_blob, blob_hash
+)
+
+# ---------- Helpers ----------
+
+def _jpeg_bytes(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode('.jpg', image)
+    assert ok
+    return encoded.tobytes()
+
+
+# ---------- In-Memory Decode Tests ----------
+
+def test_decode_uses_reduced_resolution_for_large_images():
+    """
+    Ensure large photos are decoded at reduced size while keeping min_side.
+    """
+    image = decode_image(_jpeg_bytes(2000, 3000), min_side=480)
+    assert image.shape == (500, 750, 3)
+
+    small = decode_image(_jpeg_bytes(400, 600), min_side=480)
+    assert small.shape == (400, 600, 3)
+
+
+def test_decode_rejects_garbage():
+    """
+    Ensure undecodable bytes yield None instead of raising.
+    """
+    assert decode_image(b"not an image") is None
+
+
+def test_read_upload_and_async_persist(tmp_path):
+    """
+    Ensure upload bytes are read from the request stream and persisted in the background.
+    """
+    data = _jpeg_bytes(100, 100)
+    upload = FileStorage(stream=BytesIO(data), filename="front.jpg")
+    assert read_upload(upload) == data
+
+    digest, path = persist_upload_async(data, str(tmp_path)).result(timeout=5)
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    assert blob_hash(path) == digest
+
+
+# ---------- Content-Addressed Storage Tests ----------
+
+def test_store_blob_is_sharded_and_deduplicated(tmp_path):
+    """
+    Ensure blobs are named by hash two levels deep and identical bytes are stored once.
+    """
+    data = _jpeg_bytes(50, 50)
+    digest, path = store_blob(data, str(tmp_path))
+    assert path == str(tmp_path / digest[:2] / digest[2:4] / f"{digest}.jpg")
+
+    again, same_path = store_blob(data, str(tmp_path))
+    assert (again, same_path) == (digest, path)
+    assert len(list(tmp_path.rglob("*.jpg"))) == 1
+
+
+def test_blob_name_ignores_the_upload_extension(tmp_path):
+    """
+    Ensure the same bytes uploaded as .jpg, .jpeg and .JPG share one blob, named from the decoded format.
+    """
+    data = _jpeg_bytes(40, 40)
+    files = {view: FileStorage(stream=BytesIO(data), filename=name)
+             for view, name in (("front", "a.jpg"), ("back", "b.jpeg"), ("left", "c.JPG"), ("right", "d.jpg"))}
+    paths = save_images(files, 'A-NE00001', str(tmp_path))
+
+    assert len(set(paths.values())) == 1 and paths["front"].endswith(".jpg")
+    ok, png = cv2.imencode('.png', np.zeros((8, 8, 3), dtype=np.uint8))
+    assert store_blob(png.tobytes(), str(tmp_path))[1].endswith(".png")
+
+
+def test_save_images_does_not_collide_across_uploads(tmp_path):
+    """
+    Ensure different animals' same-named uploads no longer overwrite each other.
+    """
+    paths = []
+    for seed in range(2):
+        files = {view: FileStorage(stream=BytesIO(_jpeg_bytes(40, 40, seed=seed)), filename="photo.jpg")
+                 for view in ("front", "back", "left", "right")}
+        paths.append(save_images(files, f"A-NE0000{seed}", str(tmp_path)))
+
+    assert paths[0]["front"] != paths[1]["front"]
+    # All four views of one animal were identical bytes, so they share a blob
+    assert len(set(paths[0].values())) == 1
+    assert len(list(tmp_path.rglob("*.jpg"))) == 2
@@ -0,0 +1,50 @@
+# server/tests/test_image_quality.py
+import cv2
+import numpy as np
+
+from server.benchmarks.bench_pipeline import synthetic_animal_image
+from server.utils.image_quality import assess_image, quality_failures
+
+# ---------- Helpers ----------
+
+def _jpeg(image):
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+# ---------- Quality Gate Tests ----------
+
+def test_sharp_well_exposed_photo_passes():
+    """
+    Ensure a normal photo passes and reports its measurements.
+    """
+    report = assess_image(_jpeg(synthetic_animal_image(1)))
+    assert report['ok'], report['reasons']
+    assert (report['width'], report['height']) == (1440, 1080)
+    assert 40 < report['brightness'] < 220
+
+
+def test_bad_photos_get_a_reason():
+    """
+    Ensure blur, exposure and resolution problems are each named.
+    """
+    image = synthetic_animal_image(1)
+    cases = {
+        'blurry': (cv2.GaussianBlur(image, (0, 0), 6), 'too blurry'),
+        'dark': ((image * 0.12).astype(np.uint8), 'too dark'),
+        'bright': (np.clip(image.astype(np.int16) + 200, 0, 255).astype(np.uint8), 'too bright'),
+        'tiny': (cv2.resize(image, (320, 240)), 'resolution too low'),
+    }
+    for name, (bad, reason) in cases.items():
+        reasons = assess_image(_jpeg(bad))['reasons']
+        assert any(r.startswith(reason) for r in reasons), (name, reasons)
+
+    assert assess_image(b'not an image')['reasons'] == ['not a readable image']
+
+
+def test_quality_failures_lists_only_bad_views():
+    """
+    Ensure the per-view summary only names the views to retake.
+    """
+    good = _jpeg(synthetic_animal_image(1))
+    blurry = _jpeg(cv2.GaussianBlur(synthetic_animal_image(2), (0, 0), 6))
+    assert quality_failures({'front': good, 'back': blurry}) == {'back': ['too blurry']}
@@ -0,0 +1,54 @@
+# server/tests/test_payment_cache.py
+import time
+
+from server.models import db, Payment
+from server.utils import payment_cache
+from server.utils.payment_cache import PaymentClearanceCache
+
+# ---------- PaymentClearanceCache Tests ----------
+
+def test_cache_counts_hits_and_expires_negatives_first():
+    """
+    Ensure answers are served from memory until their TTL, with "not paid" expiring sooner.
+    """
+    cache = PaymentClearanceCache(maxsize=2, ttl=60, negative_ttl=0.05)
+    assert cache.get('A-NE00001', 'slaughter') is None
+
+    cache.put('A-NE00001', 'slaughter', True)
+    cache.put('A-NE00001', 'ownership', False)
+    for _ in range(1000):
+        assert cache.get('A-NE00001', 'slaughter') is True
+    assert cache.get('A-NE00001', 'ownership') is False
+    assert cache.stats() == {'hits': 1001, 'misses': 1, 'animals': 1}
+
+    time.sleep(0.06)
+    assert cache.get('A-NE00001', 'ownership') is None
+    assert cache.get('A-NE00001', 'slaughter') is True
+
+    cache.put('A-NE00002', 'slaughter', True)
+    cache.put('A-NE00003', 'slaughter', True)
+    assert len(cache) == 2 and cache.get('A-NE00001', 'slaughter') is None  # least recently used
+
+
+def test_successful_payment_commit_invalidates(app, monkeypatch):
+    """
+    Ensure a cached "not paid" is dropped once a payment for the animal is committed as successful.
+    """
+    cache = PaymentClearanceCache()
+    monkeypatch.setattr(payment_cache, '_cache', cache)
+    cache.put('A-NE00001', 'slaughter', False)
+    cache.put('A-NE00002', 'slaughter', False)
+
+    with app.app_context():
+        payment = Payment(animal_id='A-NE00001', amount=500, phone_number='254700000000', action_type='slaughter')
+        db.session.add(payment)
+        db.session.commit()
+        assert cache.get('A-NE00001', 'slaughter') is False  # still pending
+
+        payment.status = 'success'
+        db.session.rollback()
+        assert cache.get('A-NE00001', 'slaughter') is False
+
+        payment.mark_success('TX123')
+        assert cache.get('A-NE00001', 'slaughter') is None
+        assert cache.get('A-NE00002', 'slaughter') is False
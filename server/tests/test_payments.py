@@ -185,3 +185,73 @@ def test_duplicate_checkout_request_id_prevented(app):
 
         db.session.delete(first)
         db.session.commit()
+
+
+# ---------- Offline Sync Replay Tests ----------
+
+class _Crash(BaseException):
+    """
+    The web worker dying part way through a push loop.
+    """
+
+
+class _StubMpesa:
+    """
+    Records every STK push; a reference listed in ``outcomes`` raises that exception instead.
+    """
+
+    def __init__(self):
+        self.pushes = []
+        self.outcomes = {}
+
+    def stk_push(self, phone_number, amount, reference):
+        self.pushes.append(reference)
+        if reference in self.outcomes:
+            raise self.outcomes[reference]
+        return f"TX-{len(self.pushes)}"
+
+
+def test_replayed_offline_payments_are_never_pushed_twice(app, monkeypatch):
+    """
+    Ensure a replay pushes only payments recorded as failed (once), never ones an interrupted upload left pending.
+    """
+    from server.models import Animal, Owner
+    from server.routes import payment_routes
+    from server.utils import id_validator, payment_cache
+    from server.utils.id_validator import AnimalIdFilter
+    from server.utils.payment_cache import PaymentClearanceCache
+
+    mpesa = _StubMpesa()
+    monkeypatch.setattr(payment_routes, 'mpesa_client', mpesa)
+    monkeypatch.setattr(id_validator, '_filter', AnimalIdFilter(refresh=0))
+    monkeypatch.setattr(payment_cache, '_cache', PaymentClearanceCache())
+    payments = [{"animal_id": f"A-NE{i:05d}", "amount": 100, "phone_number": "254700000000",
+                 "idempotency_key": f"tablet-7:{i}"} for i in range(4)]
+
+    with app.test_request_context(method='POST'):
+        owner = Owner(owner_id='O-NE00001', name='Jane', phone='254700000000', location='Nairobi')
+        db.session.add(owner)
+        db.session.flush()
+        db.session.add_all(Animal(animal_id=f"A-NE{i:05d}", owner_id=owner.id, image_front='f', image_back='b',
+                                  image_left='l', image_right='r') for i in range(4))
+        db.session.commit()
+
+        # The first upload: A-NE00001's push fails, the worker dies pushing A-NE00002
+        mpesa.outcomes = {'ANIMAL-A-NE00001': Exception("Request cancelled by user"), 'ANIMAL-A-NE00002': _Crash()}
+        with pytest.raises(_Crash):
+            payment_routes._sync_batch(payments)
+        db.session.rollback()
+        statuses = dict(Payment.query.with_entities(Payment.idempotency_key, Payment.status))
+        assert statuses == {'tablet-7:0': 'success', 'tablet-7:1': 'failed',
+                            'tablet-7:2': 'pending', 'tablet-7:3': 'pending'}
+
+        # The tablet retries the whole upload, with one payment in it twice
+        mpesa.outcomes = {}
+        synced, failed, replayed = payment_routes._sync_batch(payments + [payments[1]])
+        statuses = dict(Payment.query.with_entities(Payment.idempotency_key, Payment.status))
+
+    assert mpesa.pushes == ['ANIMAL-A-NE00000', 'ANIMAL-A-NE00001', 'ANIMAL-A-NE00002', 'ANIMAL-A-NE00001']
+    assert [p['idempotency_key'] for p, _ in synced] == ['tablet-7:1'] and failed == []
+    assert sorted(row['status'] for _, row in replayed) == ['pending', 'pending', 'success', 'success']
+    assert statuses == {'tablet-7:0': 'success', 'tablet-7:1': 'success',
+                        'tablet-7:2': 'pending', 'tablet-7:3': 'pending'}
@@ -0,0 +1,805 @@
+# server/tests/test_recognition.py
+import hashlib
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from server.utils.facial_recognition.embedding_index import EmbeddingIndex, VIEWS
+from server.utils.facial_recognition.embedding_store import EmbeddingStore
+from server.utils.facial_recognition.ann_index import IVFIndex
+from server.utils.facial_recognition.quantized_index import QuantizedEmbeddingIndex
+from server.config import Config
+from server.utils.facial_recognition.fusion import fused_match
+from server.utils.facial_recognition.geo_index import GeoIndex, geohash
+from server.utils.facial_recognition import recognizer
+from server.utils.facial_recognition.recognizer import match_embeddings
+from server.utils.facial_recognition.duplicate_index import (
+    MultiIndexHash, find_duplicates, from_signed, hamming, phash, to_signed,
+)
+from server.utils.facial_recognition.detection_cache import Detection, DetectionCache, content_key
+from server.utils.facial_recognition.result_cache import RecognitionResultCache, dhash, image_set_key
+from server.utils.facial_recognition import model_loader, model_versions, worker_pool
+from server.utils.facial_recognition.preprocessor import preprocess_image, preprocess_batch
+from server.utils.facial_recognition.worker_pool import RecognitionPool, RecognitionBusy, RecognitionTimeout
+
+# ---------- Helpers ----------
+
+@pytest.fixture
+def gallery():
+    """
+    Random unit-scale embeddings for 200 animals x 4 views.
+    """
+    rng = np.random.default_rng(0)
+    animal_ids = [f"A-NE{i:05d}" for i in range(200)]
+    embeddings = {a: rng.normal(scale=0.1, size=(4, 128)).astype(np.float32) for a in animal_ids}
+    return embeddings
+
+
+def _noisy(vectors, scale=0.005, seed=1):
+    rng = np.random.default_rng(seed)
+    return vectors + rng.normal(scale=scale, size=vectors.shape).astype(np.float32)
+
+
+# ---------- EmbeddingIndex Tests ----------
+
+def test_index_stores_rows_contiguously(gallery):
+    """
+    Ensure every view becomes one row in a single float32 matrix.
+    """
+    index = EmbeddingIndex.from_dict(gallery)
+    assert len(index) == 800
+    assert index.vectors.dtype == np.float32
+    assert index.vectors.flags['C_CONTIGUOUS']
+    assert index.animal_ids[index.labels[4]] == "A-NE00001"
+    assert [VIEWS[v] for v in index.views[:4]] == list(VIEWS)
+
+
+def test_search_matches_brute_force(gallery):
+    """
+    Ensure batched top-k agrees with a per-row Python distance loop.
+    """
+    index = EmbeddingIndex.from_dict(gallery)
+    query = _noisy(gallery["A-NE00042"])
+
+    distances, rows = index.search(query, k=3)
+    expected = np.array([[np.linalg.norm(q - v) for v in index.vectors] for q in query])
+    assert np.allclose(distances, np.sort(expected, axis=1)[:, :3], atol=1e-4)
+    assert set(index.labels[rows[:, 0]]) == {42}
+
+
+def test_match_returns_best_animal_first(gallery):
+    """
+    Ensure multi-view matching ranks the true animal first.
+    """
+    for metric in ('l2', 'cosine'):
+        index = EmbeddingIndex.from_dict(gallery, metric=metric)
+        ranked = index.match(_noisy(gallery["A-NE00123"]), query_views=list(VIEWS))
+        assert ranked[0][0] == "A-NE00123"
+        assert ranked[0][1] < ranked[1][1]
+
+
+def test_index_grows_past_initial_capacity():
+    """
+    Ensure appends beyond the preallocated capacity keep earlier rows intact.
+    """
+    index = EmbeddingIndex(dim=4, capacity=2)
+    for i in range(10):
+        index.add(f"A{i}", np.full((4, 4), i, dtype=np.float32))
+    assert len(index) == 40
+    assert np.all(index.vectors[:4] == 0)
+    assert index.match(np.full((1, 4), 7, dtype=np.float32))[0][0] == "A7"
+
+
+def test_empty_index_has_no_matches():
+    """
+    Ensure searching an empty gallery yields no candidates.
+    """
+    index = EmbeddingIndex()
+    assert index.match(np.zeros((4, 128), dtype=np.float32)) == []
+
+
+# ---------- Fusion Tests ----------
+
+def test_fused_match_scores_remaining_views_on_shortlist(gallery):
+    """
+    Ensure fusion finds the animal while only scanning the lead view fully.
+    """
+    index = EmbeddingIndex.from_dict(gallery)
+    query = _noisy(gallery["A-NE00077"])
+
+    result = fused_match(index, query, list(VIEWS), threshold=0.6, shortlist=10)
+    assert result["animal_id"] == "A-NE00077"
+    assert result["views_scored"][0] == "front"
+    assert result["shortlist"] <= 10
+
+
+def test_fused_match_exits_early(gallery):
+    """
+    Ensure a confident lead view stops scoring and a hopeless one is rejected.
+    """
+    index = EmbeddingIndex.from_dict(gallery)
+
+    confident = fused_match(index, _noisy(gallery["A-NE00005"]), list(VIEWS),
+                            threshold=0.6, accept_distance=0.2, accept_margin=0.1)
+    assert confident["animal_id"] == "A-NE00005"
+    assert confident["views_scored"] == ["front"]
+
+    stranger = np.full((4, 128), 5.0, dtype=np.float32)
+    rejected = fused_match(index, stranger, list(VIEWS), threshold=0.6)
+    assert rejected["animal_id"] is None
+    assert rejected["views_scored"] == ["front"]
+
+
+# ---------- EmbeddingStore Tests ----------
+
+def test_store_round_trip_is_memory_mapped(tmp_path, gallery):
+    """
+    Ensure appended embeddings come back through a read-only memory map.
+    """
+    store = EmbeddingStore(str(tmp_path))
+    for animal_id, vectors in list(gallery.items())[:50]:
+        store.append(animal_id, vectors, VIEWS)
+
+    index = store.load_index()
+    assert len(index) == 200
+    assert isinstance(index.vectors, np.memmap)
+    assert not index.vectors.flags['WRITEABLE']
+    assert np.array_equal(index.vectors[4:8], gallery["A-NE00001"])
+    assert index.match(_noisy(gallery["A-NE00007"]), query_views=list(VIEWS))[0][0] == "A-NE00007"
+
+
+def test_store_refresh_sees_other_writers(tmp_path, gallery):
+    """
+    Ensure a reader picks up rows appended by a separate store instance (another worker).
+    """
+    reader = EmbeddingStore(str(tmp_path))
+    writer = EmbeddingStore(str(tmp_path))
+    writer.append("A-NE00000", gallery["A-NE00000"], VIEWS)
+
+    index = reader.load_index()
+    assert len(index) == 4
+
+    writer.append("A-NE00001", gallery["A-NE00001"], VIEWS)
+    assert reader.has_new_rows(len(index))
+    index = reader.load_index()
+    assert len(index) == 8
+    assert index.animal_ids[index.labels[-1]] == "A-NE00001"
+
+
+def test_store_discards_torn_append(tmp_path, gallery):
+    """
+    Ensure a partially written append is ignored and overwritten by the next one.
+    """
+    store = EmbeddingStore(str(tmp_path))
+    store.append("A-NE00000", gallery["A-NE00000"], VIEWS)
+
+    # Simulate a writer dying after the vectors landed but before the IDs
+    with open(store.vectors_path, 'ab') as f:
+        f.write(gallery["A-NE00001"].tobytes())
+    assert store.committed_rows() == 4
+
+    store.append("A-NE00002", gallery["A-NE00002"], VIEWS)
+    index = store.load_index()
+    assert len(index) == 8
+    assert np.array_equal(index.vectors[4:], gallery["A-NE00002"])
+
+
+# ---------- IVFIndex Tests ----------
+
+@pytest.fixture
+def clustered_index():
+    """
+    5,000 animals drawn around 50 centres so coarse quantization is meaningful.
+    """
+    rng = np.random.default_rng(3)
+    centres = rng.normal(size=(50, 128)).astype(np.float32)
+    index = EmbeddingIndex()
+    for i in range(5000):
+        base = centres[i % 50]
+        index.add(f"A-{i:05d}", base + rng.normal(scale=0.3, size=(4, 128)).astype(np.float32))
+    return index
+
+
+def test_ivf_recall_against_exact(clustered_index):
+    """
+    Ensure approximate search keeps high recall and improves with nprobe.
+    """
+    ivf = IVFIndex.train(clustered_index, nlist=64, nprobe=2)
+    queries = clustered_index.vectors[::997][:16]
+
+    low = ivf.recall(queries, k=10)
+    ivf.nprobe = 16
+    high = ivf.recall(queries, k=10)
+    assert high >= low
+    assert high >= 0.9
+
+    ranked = ivf.match(clustered_index.vectors[40:44], query_views=list(VIEWS))
+    assert ranked[0][0] == "A-00010"
+
+
+def test_ivf_incremental_insert_and_persistence(tmp_path, clustered_index):
+    """
+    Ensure rows added after training are searchable and survive save/load.
+    """
+    ivf = IVFIndex.train(clustered_index, nlist=32, nprobe=4)
+    new_vectors = np.full((4, 128), 9.0, dtype=np.float32)
+    clustered_index.add("A-NEW", new_vectors)
+    assert ivf.sync() == 4
+    assert ivf.match(new_vectors)[0][0] == "A-NEW"
+
+    path = str(tmp_path / "ivf.npz")
+    ivf.save(path)
+    clustered_index.add("A-NEWER", new_vectors * 2)
+    loaded = IVFIndex.load(path, clustered_index)
+    assert loaded.indexed_rows == len(clustered_index)
+    assert loaded.nprobe == 4
+    assert loaded.match(new_vectors * 2)[0][0] == "A-NEWER"
+
+
+def test_requests_serve_exact_search_until_the_ivf_index_is_built(model_state, monkeypatch, gallery):
+    """
+    Ensure get_index never trains IVF itself, and picks up the index once build_ivf_index writes it.
+    """
+    from server.build_ivf_index import build
+
+    monkeypatch.setattr(recognizer, '_stores', {})
+    monkeypatch.setattr(recognizer, '_indexes', {})
+    monkeypatch.setattr(recognizer, '_anns', {})
+    monkeypatch.setattr(Config, 'RECOGNITION_SEARCH_MODE', 'ivf')
+    monkeypatch.setattr(Config, 'IVF_NLIST', 4)
+    store = recognizer.get_store()
+    store.append_many((f"A-{i:05d}", _noisy(gallery['A-NE00000'], seed=i), list(VIEWS)) for i in range(40))
+
+    with monkeypatch.context() as m:
+        m.setattr(IVFIndex, 'train', classmethod(lambda cls, *args, **kwargs: pytest.fail("trained on a request")))
+        assert isinstance(recognizer.get_index(), EmbeddingIndex)
+
+    assert build(log=lambda message: None)
+    assert isinstance(recognizer.get_index(), IVFIndex)
+    assert len(recognizer.get_index()) == 160
+
+
+# ---------- Model Loading / Worker Pool Tests ----------
+
+def test_models_are_loaded_once(monkeypatch):
+    """
+    Ensure repeated load_dlib_models calls reuse the first deserialised pair of each version.
+    """
+    calls = []
+    monkeypatch.setattr(model_loader, '_models', {})
+    monkeypatch.setattr(model_loader, '_read_models', lambda models_dir: calls.append(models_dir) or ('sp', models_dir))
+
+    assert model_loader.load_dlib_models('dlib-v1') == ('sp', model_loader.model_dir('dlib-v1'))
+    assert model_loader.load_dlib_models('dlib-v1') == ('sp', model_loader.model_dir('dlib-v1'))
+    assert model_loader.load_dlib_models('dlib-v2')[1].endswith(os.path.join('models', 'dlib-v2'))
+    assert len(calls) == 2
+
+
+def test_pool_bounds_queue_and_times_out():
+    """
+    Ensure slow jobs time out and keep their slot until they really finish.
+    """
+    pool = RecognitionPool(max_workers=1, max_pending=1, timeout=5, initializer=None)
+    try:
+        assert pool.submit(abs, -3) == 3
+
+        with pytest.raises(RecognitionTimeout):
+            pool.submit(time.sleep, 1.0, timeout=0.05)
+        with pytest.raises(RecognitionBusy):
+            pool.submit(abs, -1)
+
+        time.sleep(1.5)
+        assert pool.submit(abs, -4) == 4
+    finally:
+        pool.shutdown()
+
+
+def test_rollback_waits_for_the_warm_pool_instead_of_cold_workers(model_state, monkeypatch):
+    """
+    Ensure a version the current workers never preloaded is only sent to the warmed-up replacement pool.
+    """
+    class WarmingPool:
+        def __init__(self, versions):
+            self.versions, self.timeout = tuple(versions), 5
+
+        def warm_up(self):
+            if not warmed.wait(5):
+                raise RuntimeError("models failed to load")
+
+        def shutdown(self, **kwargs):
+            pass
+
+    warmed = threading.Event()
+    monkeypatch.setattr(worker_pool, '_new_pool', WarmingPool)
+    monkeypatch.setattr(worker_pool, '_pool', WarmingPool(['dlib-v2']))  # rolled back from dlib-v2 to dlib-v1
+    monkeypatch.setattr(worker_pool, '_replacing', None)
+
+    assert worker_pool.get_pool('dlib-v2').versions == ('dlib-v2',)  # not swapped yet
+    threading.Timer(0.1, warmed.set).start()
+    assert worker_pool.get_pool('dlib-v1').versions == ('dlib-v1',)
+
+    worker_pool._pool.timeout = 0.05
+    with pytest.raises(RecognitionBusy):
+        worker_pool.get_pool('dlib-v3')  # no pool will ever preload it
+
+
+# ---------- Preprocessing Tests ----------
+
+def test_preprocess_batch_matches_single_image_path():
+    """
+    Ensure batched preprocessing fills the given buffer with the same values as preprocess_image.
+    """
+    rng = np.random.default_rng(5)
+    views = [rng.integers(0, 256, size=(300 + 20 * i, 400, 3), dtype=np.uint8) for i in range(4)]
+    out = np.empty((4, 160, 160, 3), dtype=np.float32)
+
+    result = preprocess_batch(views, out=out)
+    assert result is out
+    for i, view in enumerate(views):
+        assert np.allclose(result[i], preprocess_image(view), atol=1e-6)
+
+    with pytest.raises(ValueError):
+        preprocess_batch(views, out=np.empty((3, 160, 160, 3), dtype=np.float32))
+
+
+# ---------- Result Cache Tests ----------
+
+def _photo(seed):
+    """A smooth synthetic 'animal' photo: random blobs on a gradient background."""
+    rng = np.random.default_rng(seed)
+    image = np.tile(np.linspace(40, 200, 320, dtype=np.uint8)[None, :, None], (240, 1, 3))
+    for _ in range(6):
+        centre = (int(rng.integers(0, 320)), int(rng.integers(0, 240)))
+        colour = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        cv2.circle(image, centre, int(rng.integers(20, 60)), colour, -1)
+    return cv2.imencode('.jpg', image)[1].tobytes(), image
+
+
+def test_dhash_survives_recompression():
+    """
+    Ensure a re-encoded retry of the same photo hashes identically, unlike a different photo.
+    """
+    data, image = _photo(1)
+    recompressed = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes()
+    other, _ = _photo(2)
+
+    assert dhash(data) == dhash(recompressed)
+    assert dhash(data) != dhash(other)
+
+
+def test_result_cache_lru_ttl_and_invalidation(tmp_path):
+    """
+    Ensure hits, TTL expiry, LRU eviction and cross-worker invalidation all behave.
+    """
+    log = str(tmp_path / "invalidations.log")
+    cache = RecognitionResultCache(maxsize=2, ttl=60, invalidation_log=log)
+    other_worker = RecognitionResultCache(maxsize=2, ttl=60, invalidation_log=log)
+
+    key = image_set_key({view: _photo(i)[0] for i, view in enumerate(VIEWS)})
+    cache.put(key, "A-NE00001", 0.3)
+    other_worker.put(key, "A-NE00001", 0.3)
+    assert cache.get(key) == ("A-NE00001", 0.3)
+    assert cache.hits == 1
+
+    cache.invalidate_animal("A-NE00001")
+    assert cache.get(key) is None
+    assert other_worker.get(key) is None
+
+    cache.put("k1", None)
+    cache.put("k2", "A2")
+    cache.put("k3", "A3")
+    assert cache.get("k1") is None  # evicted
+    cache.invalidate_negatives()
+    assert cache.get("k2") == ("A2", None)
+
+    expiring = RecognitionResultCache(ttl=0)
+    expiring.put("k", "A1")
+    time.sleep(0.01)
+    assert expiring.get("k") is None
+
+
+def test_invalidation_log_is_rotated_and_rotation_clears_other_workers(tmp_path):
+    """
+    Ensure the shared log stays bounded and a worker that misses lines to a rotation drops its entries.
+    """
+    log = str(tmp_path / "invalidations.log")
+    cache = RecognitionResultCache(invalidation_log=log, max_log_bytes=200)
+    other_worker = RecognitionResultCache(invalidation_log=log, max_log_bytes=200)
+    other_worker.put("k1", "A-NE00001")
+    other_worker.put("k2", "B-SW00002")
+    cache.invalidate_animal("A-NE00001")
+    assert other_worker.get("k1") is None
+    assert other_worker.get("k2") == ("B-SW00002", None)
+
+    for i in range(100):
+        cache.invalidate_animal(f"A-NE{i:05d}")
+        assert os.path.getsize(log) <= 200 + 16
+    assert other_worker.get("k2") is None  # cleared: its line may have been rotated away
+
+    other_worker.put("k3", "A-NE00003")
+    cache.invalidate_animal("A-NE00003")
+    assert other_worker.get("k3") is None
+
+
+# ---------- Geo Pruning Tests ----------
+
+def test_geohash_matches_reference_encoding():
+    """
+    Ensure cells are standard geohashes.
+    """
+    assert geohash(57.64911, 10.40744, 6) == 'u4pruy'
+    assert geohash(-1.2921, 36.8219, 5) == 'kzf0t'
+
+
+def test_geo_index_radius_query():
+    """
+    Ensure radius queries return animals near any of their positions and nothing farther.
+    """
+    geo = GeoIndex()
+    geo.update('A-NE00001', [(-1.2921, 36.8219)])                        # Nairobi
+    geo.update('A-NE00002', [(0.5143, 35.2698)])                         # Eldoret
+    geo.update('A-NE00003', [(3.1190, 35.5973), (None, None)])           # Lodwar
+    geo.add_position('A-NE00003', -1.30, 36.80)                          # ...last seen in Nairobi
+
+    assert geo.candidates(-1.29, 36.82, 10) == {'A-NE00001', 'A-NE00003'}
+    assert geo.candidates(0.52, 35.27, 10) == {'A-NE00002'}
+    assert geo.candidates(0.0, 36.0, 400) == {'A-NE00001', 'A-NE00002', 'A-NE00003'}
+
+    geo.remove('A-NE00001')
+    assert geo.candidates(-1.29, 36.82, 10) == {'A-NE00003'}
+
+
+def test_match_searches_nearby_animals_first(gallery, monkeypatch):
+    """
+    Ensure nearby animals are searched on their own, and the search widens when none match.
+    """
+    monkeypatch.setattr(Config, 'GEO_SEARCH_RADII_KM', (10.0, 50.0))
+    monkeypatch.setattr(Config, 'GEO_MAX_CANDIDATE_FRACTION', 0.5)
+    index = EmbeddingIndex.from_dict(gallery)
+    geo = GeoIndex()
+    for i, animal_id in enumerate(gallery):
+        # Animals spread ~1 km apart along the equator
+        geo.update(animal_id, [(0.0, i * 0.0089)])
+
+    searched = []
+    original_subset = EmbeddingIndex.subset
+    monkeypatch.setattr(EmbeddingIndex, 'subset', lambda self, rows: searched.append(len(rows)) or original_subset(self, rows))
+
+    # A query for an animal within 10 km matches in the first ring
+    query = _noisy(gallery['A-NE00003'])
+    assert match_embeddings(index, query, list(VIEWS), location=(0.0, 0.0), geo=geo)[0] == 'A-NE00003'
+    assert searched == [11 * 4]
+
+    # One ~100 km away is found by the full search after both rings miss
+    searched.clear()
+    query = _noisy(gallery['A-NE00120'])
+    assert match_embeddings(index, query, list(VIEWS), location=(0.0, 0.0), geo=geo)[0] == 'A-NE00120'
+    assert searched == [11 * 4, 51 * 4]
+
+
+# ---------- Benchmark Suite Tests ----------
+
+def test_pipeline_benchmark_reports_every_stage():
+    """
+    Ensure a tiny offline run reports percentiles per stage and matches its synthetic queries.
+    """
+    from server.benchmarks.bench_pipeline import run
+
+    report = run(stages=('decode', 'preprocess', 'crop', 'match', 'quantization'), gallery=400, iterations=5,
+                 height=240, width=320, log=lambda *_: None)
+
+    assert report['meta']['gallery_rows'] == 400
+    for stage in ('decode', 'preprocess', 'crop', 'match'):
+        stats = report['stages'][stage]
+        assert stats['n'] == 5
+        assert 0 < stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms']
+        assert stats['throughput_per_s'] > 0
+    assert report['stages']['match']['top1_accuracy'] == 1.0
+    assert report['stages']['quantization']['recall_at_1'] == 1.0
+    assert report['stages']['quantization']['memory_ratio'] > 3.5
+
+
+# ---------- Detection Cache Tests ----------
+
+def _detection(seed=0):
+    rng = np.random.default_rng(seed)
+    return Detection(
+        (10, 20, 110, 120),
+        rng.integers(0, 150, size=(68, 2)).astype(np.int32),
+        rng.integers(0, 256, size=(150, 150, 3), dtype=np.uint8),
+    )
+
+
+def test_detection_cache_round_trip_and_versioning(tmp_path):
+    """
+    Ensure detections persist by content hash and entries from another detector version miss.
+    """
+    cache = DetectionCache(str(tmp_path))
+    key = 'ab' * 32
+    assert cache.get(key) is None
+
+    cache.put(key, _detection())
+    hit = cache.get(key)
+    assert hit.bbox == (10, 20, 110, 120)
+    assert np.array_equal(hit.landmarks, _detection().landmarks)
+    assert np.array_equal(hit.chip, _detection().chip)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    assert DetectionCache(str(tmp_path), version='other-model').get(key) is None
+
+
+def test_content_key_uses_blob_name_or_file_hash(tmp_path):
+    """
+    Ensure blob names are trusted as keys and other files are hashed.
+    """
+    digest = hashlib.sha256(b'photo').hexdigest()
+    blob = tmp_path / f"{digest}.jpg"
+    blob.write_bytes(b'not actually read')
+    legacy = tmp_path / 'A-NE12345_front.jpg'
+    legacy.write_bytes(b'photo')
+
+    assert content_key(str(blob)) == digest
+    assert content_key(str(legacy)) == digest
+
+
+def test_stored_images_skip_detection_when_cached(tmp_path, monkeypatch):
+    """
+    Ensure a cached image is embedded from its chip without decoding or detecting again.
+    """
+    path = tmp_path / 'front.jpg'
+    path.write_bytes(_photo(0)[0])
+    cache = DetectionCache(str(tmp_path / 'detections'))
+    monkeypatch.setattr(recognizer, 'get_detection_cache', lambda: cache)
+
+    detected = []
+    monkeypatch.setattr(recognizer, 'detect_face', lambda image, version=None: detected.append(image.shape) or _detection())
+    monkeypatch.setattr(recognizer, 'embed_chip', lambda chip, version=None: np.full(128, chip.mean(), dtype=np.float32))
+
+    first, views = recognizer.compute_view_embeddings({'front': str(path)})
+    monkeypatch.setattr(recognizer.cv2, 'imread', lambda *_: pytest.fail("image decoded on a cache hit"))
+    second, _ = recognizer.compute_view_embeddings({'front': str(path)})
+
+    assert views == ['front'] and len(detected) == 1
+    assert np.array_equal(first, second)
+
+
+# ---------- Duplicate Index Tests ----------
+
+def test_phash_tolerates_resize_and_recompression():
+    """
+    Ensure a resized, recompressed copy stays within a few bits and a different photo does not.
+    """
+    data, image = _photo(3)
+    smaller = cv2.resize(image, (240, 180), interpolation=cv2.INTER_AREA)
+    copy = cv2.imencode('.jpg', smaller, [cv2.IMWRITE_JPEG_QUALITY, 60])[1].tobytes()
+
+    original = phash(data)
+    assert hamming(original, [phash(copy)])[0] <= 4
+    assert hamming(original, [phash(_photo(4)[0])])[0] > 12
+
+
+def test_multi_index_hash_matches_brute_force():
+    """
+    Ensure radius search returns exactly the brute-force neighbours, merged or still in the tail.
+    """
+    rng = np.random.default_rng(0)
+    stored = rng.integers(0, 2 ** 63, size=20000, dtype=np.uint64) * np.uint64(2)
+    queries = stored[:50] ^ np.uint64(0b1011)                                 # 3 bits away
+    index = MultiIndexHash(tail_limit=5000)
+    index.add_many((i, int(h)) for i, h in enumerate(stored[:18000]))
+    for i, h in enumerate(stored[18000:], start=18000):
+        index.add(i, int(h))                                                 # some stay in the tail
+    assert len(index) == 20000
+
+    for q in queries:
+        expected = sorted((int(d), i) for i, d in enumerate(hamming(int(q), stored)) if d <= 6)
+        assert [(d, key) for key, d in index.search(int(q), 6)] == expected
+
+
+def test_find_duplicates_reports_front_and_side_views():
+    """
+    Ensure matches are reported per uploaded view and back views are ignored.
+    """
+    index = MultiIndexHash()
+    index.add(('A-NE00001', 'front'), 0xFFFF0000FFFF0000)
+    index.add(('A-NE00001', 'left'), 0x0F0F0F0F0F0F0F0F)
+
+    found = find_duplicates({'front': 0xFFFF0000FFFF0001, 'back': 0x0F0F0F0F0F0F0F0F, 'right': None}, 6, index=index)
+    assert found == [{'animal_id': 'A-NE00001', 'view': 'front', 'matched_view': 'front', 'distance': 1}]
+    assert to_signed(0xFFFF0000FFFF0000) < 0 and from_signed(to_signed(0xFFFF0000FFFF0000)) == 0xFFFF0000FFFF0000
+
+
+# ---------- Quantized Index Tests ----------
+
+def test_quantized_search_agrees_with_float32(gallery):
+    """
+    Ensure int8 asymmetric distances stay close to exact ones and rank the same top match.
+    """
+    exact = EmbeddingIndex.from_dict(gallery)
+    quantized = QuantizedEmbeddingIndex.from_index(exact)
+    queries = _noisy(np.concatenate([gallery[a] for a in list(gallery)[:20]]), scale=0.02)
+
+    assert np.allclose(quantized.distances(queries), exact.distances(queries), atol=0.01)
+    _, exact_rows = exact.search(queries, k=1)
+    _, quant_rows = quantized.search(queries, k=1)
+    assert np.array_equal(exact_rows, quant_rows)
+    assert quantized.nbytes * 3.5 < len(exact) * 128 * 4
+
+    rows = exact.rows_for([3])
+    assert np.allclose(quantized.distances_to_rows(queries[0], rows), exact.distances_to_rows(queries[0], rows), atol=0.01)
+
+
+def test_store_serves_quantized_rows_and_upgrades_old_stores(tmp_path, gallery):
+    """
+    Ensure the store keeps int8 codes in step and rebuilds them for stores written without them.
+    """
+    store = EmbeddingStore(str(tmp_path))
+    for animal_id in list(gallery)[:10]:
+        store.append(animal_id, gallery[animal_id], list(VIEWS))
+
+    index = store.load_index(quantized=True)
+    assert isinstance(index, QuantizedEmbeddingIndex) and len(index) == 40
+    assert index.match(gallery['A-NE00004'], query_views=list(VIEWS))[0][0] == 'A-NE00004'
+
+    # A store from before quantization existed: codes are rebuilt on first use
+    os.remove(store.codes_path)
+    os.remove(store.scales_path)
+    store.append('A-NE00010', gallery['A-NE00010'], list(VIEWS))
+    index = EmbeddingStore(str(tmp_path)).load_index(quantized=True)
+    assert len(index) == 44
+    assert np.allclose(index.reconstruct(slice(None)), store.load_index().vectors, atol=0.002)
+
+
+# ---------- Model Version Tests ----------
+
+@pytest.fixture
+def model_state(tmp_path, monkeypatch):
+    """
+    A fresh model state file and embedding store root under tmp_path.
+    """
+    monkeypatch.setattr(Config, 'EMBEDDING_STORE_DIR', str(tmp_path))
+    monkeypatch.setattr(Config, 'MODEL_STATE_PATH', '')
+    monkeypatch.setattr(Config, 'RECOGNITION_MODEL_VERSION', 'dlib-v1')
+    monkeypatch.setattr(model_versions, '_state', None)
+    monkeypatch.setattr(model_versions, '_state_stamp', None)
+    return tmp_path
+
+
+def test_model_state_pending_then_activate(model_state):
+    """
+    Ensure a pending version is dual-written until it is activated.
+    """
+    assert model_versions.write_versions() == ['dlib-v1']
+
+    model_versions.set_pending_version('dlib-v2')
+    assert model_versions.active_version() == 'dlib-v1'
+    assert model_versions.write_versions() == ['dlib-v1', 'dlib-v2']
+
+    model_versions.activate_version('dlib-v2')
+    assert model_versions.get_model_state() == {'active': 'dlib-v2', 'pending': None}
+    assert os.path.exists(model_state / 'model_state.json')
+
+
+def test_store_rejects_another_model_version(tmp_path, gallery):
+    """
+    Ensure embeddings from two model versions never end up in the same store.
+    """
+    store = EmbeddingStore(str(tmp_path), model_version='dlib-v1')
+    store.append('A-NE00000', gallery['A-NE00000'], list(VIEWS))
+    assert len(EmbeddingStore(str(tmp_path), model_version='dlib-v1').load_index()) == 4
+
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), model_version='dlib-v2')
+
+
+def test_registration_writes_every_version_during_upgrade(model_state, monkeypatch, gallery):
+    """
+    Ensure a pending upgrade embeds new animals into both stores while verifies stay on the active one.
+    """
+    monkeypatch.setattr(recognizer, '_stores', {})
+    monkeypatch.setattr(recognizer, '_indexes', {})
+    monkeypatch.setattr(Config, 'RECOGNITION_WORKERS', 0)
+    monkeypatch.setattr(recognizer, 'preload_async', lambda versions: None)
+    scale = {'dlib-v1': 1.0, 'dlib-v2': 2.0}
+    monkeypatch.setattr(recognizer, 'compute_view_embeddings',
+                        lambda images, version=None: (gallery[images['id']] * scale[version], list(VIEWS)))
+
+    model_versions.set_pending_version('dlib-v2')
+    recognizer.index_animal('A-NE00001', {'id': 'A-NE00001'})
+
+    assert recognizer.store_dir('dlib-v2') == str(model_state / 'dlib-v2')
+    assert np.allclose(recognizer.get_index(version='dlib-v1').vectors, gallery['A-NE00001'])
+    assert np.allclose(recognizer.get_index(version='dlib-v2').vectors, gallery['A-NE00001'] * 2)
+    assert len(recognizer.get_index()) == 4
+
+
+def test_registration_survives_a_failed_pending_embedding(model_state, monkeypatch, gallery):
+    """
+    Ensure a busy pool for the pending version neither fails the registration nor skips the cache invalidation.
+    """
+    monkeypatch.setattr(recognizer, '_stores', {})
+    monkeypatch.setattr(recognizer, '_indexes', {})
+
+    def embed_views(images, version=None):
+        if version == 'dlib-v2':
+            raise RecognitionBusy("Recognition queue is full")
+        return gallery[images['id']], list(VIEWS)
+
+    invalidations = []
+    monkeypatch.setattr(recognizer, 'embed_views', embed_views)
+    monkeypatch.setattr(recognizer, 'get_result_cache',
+                        lambda: type('Cache', (), {'invalidate_negatives': lambda self: invalidations.append(1)})())
+
+    model_versions.set_pending_version('dlib-v2')
+    assert recognizer.index_animal('A-NE00001', {'id': 'A-NE00001'}) == list(VIEWS)
+    assert len(recognizer.get_index(version='dlib-v1')) == 4
+    assert len(recognizer.get_index(version='dlib-v2')) == 0
+    assert invalidations == [1]
+
+
+class _InlinePool:
+    """
+    Stands in for the backfill's process pool, running jobs in this process.
+    """
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, jobs, chunksize=1):
+        return map(fn, jobs)
+
+
+def test_backfill_checkpoints_failures_and_retries_them_first(app, model_state, monkeypatch, gallery):
+    """
+    Ensure a failed animal is kept in the checkpoint and the next run embeds it without moving last_id back.
+    """
+    from server import backfill_embeddings
+    from server.models import db, Animal, Owner
+
+    broken = {'A-NE00002'}
+    invalidations = []
+
+    def embed(job):
+        animal_id, paths, _ = job
+        if animal_id in broken:
+            return animal_id, None, [], len(paths)
+        return animal_id, gallery[animal_id], list(VIEWS), len(paths)
+
+    monkeypatch.setattr(recognizer, '_stores', {})
+    monkeypatch.setattr(backfill_embeddings, '_embed', embed)
+    monkeypatch.setattr(backfill_embeddings, 'ProcessPoolExecutor', _InlinePool)
+    monkeypatch.setattr(backfill_embeddings, 'get_result_cache',
+                        lambda: type('Cache', (), {'publish_negatives_invalidation': lambda self: invalidations.append(1)})())
+    checkpoint = str(model_state / 'backfill.checkpoint.json')
+
+    with app.app_context():
+        owner = Owner(owner_id='O-NE00001', name='Jane', phone='254700000000', location='Nairobi')
+        db.session.add(owner)
+        db.session.flush()
+        db.session.add_all(Animal(animal_id=f"A-NE{i:05d}", owner_id=owner.id, image_front='f', image_back='b',
+                                  image_left='l', image_right='r') for i in range(5))
+        db.session.commit()
+
+        first = backfill_embeddings.run(batch_size=2, checkpoint=checkpoint, log=lambda message: None)
+        state = backfill_embeddings.load_checkpoint(checkpoint)
+        assert (first['animals'], first['failed']) == (5, 1)
+        assert (state['last_id'], state['failed_ids'], state['animals']) == (5, ['A-NE00002'], 4)
+
+        broken.clear()
+        second = backfill_embeddings.run(batch_size=2, checkpoint=checkpoint, log=lambda message: None)
+        state = backfill_embeddings.load_checkpoint(checkpoint)
+
+    assert (second['animals'], second['failed']) == (1, 0)
+    assert (state['last_id'], state['failed_ids'], state['animals']) == (5, [], 5)
+    assert sorted(recognizer.get_store().load_index().animal_ids) == [f"A-NE{i:05d}" for i in range(5)]
+    assert len(invalidations) == 4  # once per page that stored embeddings
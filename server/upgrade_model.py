@@ -0,0 +1,90 @@
+# server/upgrade_model.py
+"""
+Switch recognition to a new model version without downtime.
+
+    1. load the new version's models once (fails fast on missing/corrupt files)
+    2. mark it pending: web workers start preloading it on fresh recognition
+       pools in the background, and new registrations are embedded with both
+       the active and the pending version
+    3. backfill every existing animal into the new version's store
+    4. check the new store covers every animal in the active one
+    5. activate it: every worker matches verifies against the new store from
+       its next request on; the old store is left untouched for a rollback
+
+Model files go in server/utils/facial_recognition/models/<version>/.
+
+    python -m server.upgrade_model dlib-v2 --workers 8
+    python -m server.upgrade_model dlib-v1 --activate-only   # roll back
+    python -m server.upgrade_model --abort                   # drop a pending upgrade
+"""
+import argparse
+import sys
+
+from server.app import create_app
+from server.backfill_embeddings import default_checkpoint, run as backfill
+from server.utils.facial_recognition.model_loader import load_dlib_models, model_dir
+from server.utils.facial_recognition.model_versions import (
+    activate_version, clear_pending_version, get_model_state, set_pending_version,
+)
+from server.utils.facial_recognition.recognizer import get_store
+
+
+def missing_animals(version, reference):
+    """Animal IDs in the ``reference`` version's store that ``version``'s store lacks."""
+    covered = set(get_store(version).load_index().animal_ids)
+    return set(get_store(reference).load_index().animal_ids) - covered
+
+
+def upgrade(version, workers=None, batch_size=500, activate_only=False, log=print):
+    """Run the whole upgrade; returns True once ``version`` is active."""
+    state = get_model_state()
+    if state['active'] == version:
+        log(f"{version} is already active")
+        return True
+
+    log(f"Loading {version} from {model_dir(version)}")
+    load_dlib_models(version)
+
+    if not activate_only:
+        set_pending_version(version)
+        log(f"{version} is pending; new registrations are now embedded with {state['active']} and {version}")
+        backfill(batch_size, workers, default_checkpoint(version), model_version=version, log=log)
+        # Registrations that were in flight when the version became pending
+        backfill(batch_size, workers, None, model_version=version, log=log)
+
+    missing = missing_animals(version, state['active'])
+    if missing:
+        log(f"Not activating {version}: {len(missing)} animals of {state['active']} are missing, "
+            f"e.g. {sorted(missing)[:5]}")
+        return False
+
+    activate_version(version)
+    log(f"{version} is now active")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('version', nargs='?', help='model version to switch to')
+    parser.add_argument('--workers', type=int, default=None, help='backfill embedding processes (default: all cores)')
+    parser.add_argument('--batch-size', type=int, default=500, help='Animal rows per backfill page')
+    parser.add_argument('--activate-only', action='store_true',
+                        help="skip the backfill; activate if the version's store is already complete")
+    parser.add_argument('--abort', action='store_true', help='cancel a pending upgrade (stops dual-writing)')
+    args = parser.parse_args()
+
+    if args.abort:
+        clear_pending_version()
+        print("Pending model version cleared")
+        return
+    if not args.version:
+        parser.error('a model version is required')
+
+    app = create_app()
+    with app.app_context():
+        ok = upgrade(args.version, args.workers, args.batch_size, args.activate_only)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
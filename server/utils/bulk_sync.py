@@ -0,0 +1,302 @@
+# server/utils/bulk_sync.py
+
+import json
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.exceptions import HTTPException
+
+from ..config import Config
+from ..models import db
+from .id_validator import IN_CHUNK, animals_exist
+from .payment_cache import paid_animals
+
+# Longest idempotency_key accepted (the column is VARCHAR(64), e.g. a UUID or a hex digest)
+IDEMPOTENCY_KEY_LENGTH = 64
+
+
+class Rejected(ValueError):
+    """Raised by a row builder to turn one record away with a message."""
+
+
+def serialize(model, row):
+    """A stored row as the model's to_dict() would render it, without building the ORM object."""
+    out = {}
+    for column in model.__table__.columns:
+        value = row.get(column.key)
+        out[column.key] = value.isoformat() if isinstance(value, datetime) else value
+    return out
+
+
+def owner_details(owner_ids):
+    """{owner_id: (name, phone)} for the registered owners among ``owner_ids``, via chunked IN queries."""
+    from ..models.animal import Owner
+
+    owner_ids = sorted({o for o in owner_ids if isinstance(o, str) and o})
+    details = {}
+    for start in range(0, len(owner_ids), IN_CHUNK):
+        chunk = owner_ids[start:start + IN_CHUNK]
+        details.update((row.owner_id, (row.name, row.phone)) for row in
+                       Owner.query.with_entities(Owner.owner_id, Owner.name, Owner.phone)
+                       .filter(Owner.owner_id.in_(chunk)))
+    return details
+
+
+def insert_chunks(model, rows, chunk_size=None):
+    """
+    Insert row dicts (all with the same keys) as multi-row INSERTs, chunk_size
+    rows per transaction. A chunk that fails is rolled back on its own and
+    the rest continue.
+
+    Yields (rows, ids, error) per chunk: ids in row order on success,
+    None and the error message after a rollback.
+    """
+    chunk_size = chunk_size or Config.SYNC_CHUNK_SIZE
+    table = model.__table__
+    # Ids are assigned in row order within a multi-row INSERT, but RETURNING may list
+    # them in any order; sort_by_parameter_order would make SQLite insert row by row
+    statement = insert(table).returning(table.c.id)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            ids = sorted(db.session.execute(statement, chunk).scalars())
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            yield chunk, None, str(e)
+            continue
+        yield chunk, ids, None
+
+
+def stored_rows(model, keys):
+    """{idempotency_key: stored row dict} for the keys already applied to model's table."""
+    table = model.__table__
+    keys = sorted({k for k in keys if k is not None})
+    stored = {}
+    for start in range(0, len(keys), IN_CHUNK):
+        chunk = keys[start:start + IN_CHUNK]
+        for row in db.session.execute(table.select().where(table.c.idempotency_key.in_(chunk))).mappings():
+            stored[row['idempotency_key']] = serialize(model, row)
+    return stored
+
+
+def _idempotency_key(record):
+    """The record's idempotency key, None without one; Rejected if it is not a usable string."""
+    key = record.get('idempotency_key') if isinstance(record, dict) else None
+    if key is not None and not (isinstance(key, str) and 0 < len(key) <= IDEMPOTENCY_KEY_LENGTH):
+        raise Rejected("Invalid idempotency_key")
+    return key
+
+
+def sync_records(records, model, build_row, action_type=None, chunk_size=None):
+    """
+    Ingest an offline upload in bulk.
+
+    Records may carry a client-chosen ``idempotency_key``. Keys already
+    stored are found with one indexed lookup and those records are answered
+    with the stored row instead of being applied again, so a client retrying
+    an upload after a timeout costs one query. A key repeated within the
+    upload is applied once.
+
+    Validation of the rest runs over the whole batch up front: animal IDs
+    are resolved with one animals_exist() call and, when ``action_type`` is
+    given, payment clearance with one paid_animals() call. build_row(record)
+    then maps each accepted record to a column dict (raising Rejected to
+    refuse it), and the rows are inserted with insert_chunks().
+
+    Returns (synced, failed, replayed): synced and replayed are lists of
+    (record, stored row dict), failed a list of (record, error message),
+    each in upload order. Once chunks start being committed, database errors
+    are reported against the records they affect and never raised, so the
+    caller always learns which records were stored.
+    """
+    records = list(records)
+    keys = []
+    for record in records:
+        try:
+            keys.append(_idempotency_key(record))
+        except Rejected as e:
+            keys.append(e)
+    stored = stored_rows(model, (k for k in keys if isinstance(k, str)))
+
+    # Entries are (upload position, record, row or error) until sorted back into upload order
+    synced, failed, replayed = [], [], []
+    pending, repeats, seen = [], [], set()
+    for i, (record, key) in enumerate(zip(records, keys)):
+        if isinstance(key, Rejected):
+            failed.append((i, record, str(key)))
+        elif key in stored:
+            replayed.append((i, record, stored[key]))
+        elif key is not None and key in seen:
+            repeats.append((i, record, key))
+        else:
+            seen.add(key)
+            pending.append((i, record, key))
+
+    animal_ids = [r.get('animal_id') if isinstance(r, dict) else None for _, r, _ in pending]
+    registered = animals_exist(animal_ids)
+    paid = paid_animals(registered, action_type) if action_type else None
+
+    outcomes = {}  # idempotency key -> stored row dict or error message, for repeats
+    accepted, rows = [], []
+    for (i, record, key), animal_id in zip(pending, animal_ids):
+        if animal_id not in registered:
+            error = "Invalid animal_id"
+        elif paid is not None and animal_id not in paid:
+            error = "Payment not found or not successful"
+        else:
+            try:
+                row = build_row(record)
+            except Rejected as e:
+                error = str(e)
+            else:
+                row['idempotency_key'] = key
+                accepted.append((i, record))
+                rows.append(row)
+                continue
+        failed.append((i, record, error))
+        outcomes[key] = error
+
+    def settle(batch, chunk, ids, error, retry):
+        if error is None:
+            for (i, record), row, row_id in zip(batch, chunk, ids):
+                stored_row = serialize(model, {**row, 'id': row_id})
+                synced.append((i, record, stored_row))
+                outcomes[row['idempotency_key']] = stored_row
+            return
+        # A concurrent retry of the same upload may have stored some keys first
+        try:
+            raced = stored_rows(model, (row['idempotency_key'] for row in chunk)) if retry else {}
+        except SQLAlchemyError:
+            db.session.rollback()
+            raced = {}
+        left = []
+        for (i, record), row in zip(batch, chunk):
+            key = row['idempotency_key']
+            if key in raced:
+                replayed.append((i, record, raced[key]))
+                outcomes[key] = raced[key]
+            elif raced:
+                left.append(((i, record), row))
+            else:
+                failed.append((i, record, f"Database error: {error}"))
+                outcomes[key] = f"Database error: {error}"
+        if left:
+            batch, chunk = [b for b, _ in left], [row for _, row in left]
+            for chunk, ids, error in insert_chunks(model, chunk, len(chunk)):
+                settle(batch, chunk, ids, error, retry=False)
+
+    position = 0
+    for chunk, ids, error in insert_chunks(model, rows, chunk_size):
+        batch = accepted[position:position + len(chunk)]
+        position += len(chunk)
+        settle(batch, chunk, ids, error, retry=True)
+
+    for i, record, key in repeats:
+        outcome = outcomes.get(key)
+        if isinstance(outcome, dict):
+            replayed.append((i, record, outcome))
+        else:
+            failed.append((i, record, outcome))
+
+    return tuple([(record, value) for _, record, value in sorted(entries, key=lambda e: e[0])]
+                 for entries in (synced, failed, replayed))
+
+
+# ---------- NDJSON streaming ----------
+
+NDJSON = 'application/x-ndjson'
+
+
+def iter_ndjson(stream, max_line=None):
+    """
+    Yield (line number, record, error) for each non-blank line of an NDJSON
+    stream, reading one line at a time. Lines over ``max_line`` bytes are
+    skipped without being held in memory; they and lines that are not a
+    JSON object come back with an error instead of a record.
+    """
+    max_line = max_line or Config.SYNC_MAX_RECORD_BYTES
+    number = 0
+    while True:
+        line = stream.readline(max_line + 1)
+        if not line:
+            return
+        number += 1
+        if len(line) > max_line and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line + 1)
+            yield number, None, "Record too large"
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Invalid record"
+            continue
+        yield number, record, None
+
+
+def stream_sync(stream, sync_batch, key, batch_size=None):
+    """
+    Ingest an NDJSON upload in batches of ``batch_size`` records, yielding one
+    NDJSON result line per record as each batch is decided, then a summary line.
+
+    sync_batch(records) -> (synced, failed, replayed) as returned by
+    sync_records(); a result line carries the line number, the stored row
+    (or the uploaded record and an error) under ``key``, and "replayed" when
+    the row was stored by an earlier upload. Memory is bounded by the batch size,
+    whatever the size of the upload. If reading the upload fails part way
+    (client disconnect, a size limit), the records already read are still
+    settled and the summary line carries an "error".
+    """
+    batch_size = batch_size or Config.SYNC_CHUNK_SIZE
+    totals = {"synced": 0, "replayed": 0, "failed": 0}
+
+    def decide(batch):
+        try:
+            synced, failed, replayed = sync_batch([record for _, record in batch])
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            synced, failed, replayed = [], [(record, f"Database error: {e}") for _, record in batch], []
+        # Parsed records are distinct objects, so identity maps them back to their lines
+        lines = {id(record): number for number, record in batch}
+        results = [{"line": lines[id(record)], "success": True, key: row} for record, row in synced]
+        results += [{"line": lines[id(record)], "success": True, key: row, "replayed": True}
+                    for record, row in replayed]
+        results += [{"line": lines[id(record)], "success": False, key: record, "error": error}
+                    for record, error in failed]
+        totals["synced"] += len(synced)
+        totals["replayed"] += len(replayed)
+        totals["failed"] += len(failed)
+        for result in sorted(results, key=lambda r: r["line"]):
+            yield json.dumps(result) + '\n'
+
+    batch, interrupted = [], None
+    records = iter_ndjson(stream)
+    while True:
+        try:
+            number, record, error = next(records)
+        except StopIteration:
+            break
+        except (HTTPException, OSError) as e:
+            # Body over a size limit, client gone, ... : settle what was read and say so
+            interrupted = getattr(e, 'description', None) or str(e)
+            break
+        if error is not None:
+            totals["failed"] += 1
+            yield json.dumps({"line": number, "success": False, key: None, "error": error}) + '\n'
+            continue
+        batch.append((number, record))
+        if len(batch) >= batch_size:
+            yield from decide(batch)
+            batch = []
+    if batch:
+        yield from decide(batch)
+    if interrupted is not None:
+        totals["error"] = f"Upload interrupted: {interrupted}"
+    yield json.dumps({"done": True, **totals}) + '\n'
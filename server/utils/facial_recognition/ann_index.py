@@ -0,0 +1,217 @@
+# server/utils/facial_recognition/ann_index.py
+
+import os
+
+import numpy as np
+
+from .embedding_index import VIEW_CODES
+
+
+def kmeans(vectors, n_clusters, n_iter=20, seed=0, chunk_size=65536):
+    """
+    Plain Lloyd's k-means in NumPy. Assignment is done in chunks so memory
+    stays bounded for large training samples.
+
+    Returns (n_clusters, dim) float32 centroids.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = _nearest(vectors, centroids, chunk_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters from random points so every list stays useful
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+
+    return centroids
+
+
+def _nearest(vectors, centroids, chunk_size=65536):
+    """Index of the nearest centroid (squared L2) for every vector."""
+    c_sq = np.einsum('ij,ij->i', centroids, centroids)
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        # ||x||^2 is constant per row, so it does not affect the argmin
+        out[start:start + chunk_size] = np.argmin(c_sq[None, :] - 2.0 * (chunk @ centroids.T), axis=1)
+    return out
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate search over an EmbeddingIndex.
+
+    A coarse k-means quantizer splits the gallery into ``nlist`` cells. A query
+    only scores the rows in its ``nprobe`` nearest cells, so cost falls roughly
+    by nlist / nprobe while the exact index remains available for checking
+    recall. Row vectors are not copied: inverted lists hold row numbers into
+    the base index (typically a memory-mapped EmbeddingStore).
+
+    Knobs:
+        nlist   number of cells (more cells = faster, needs more training data)
+        nprobe  cells scanned per query (higher = better recall, slower)
+    """
+
+    def __init__(self, base, centroids, lists, nprobe=8, indexed_rows=0):
+        self.base = base
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.lists = lists
+        self.nprobe = nprobe
+        self.indexed_rows = indexed_rows
+        self.saved_rows = indexed_rows  # rows covered by the last save()/load()
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.base)
+
+    @property
+    def animal_ids(self):
+        return self.base.animal_ids
+
+    @classmethod
+    def train(cls, base, nlist=1024, nprobe=8, sample_size=None, n_iter=20, seed=0):
+        """
+        Train the coarse quantizer on a sample of ``base`` and index every row.
+        """
+        n = len(base)
+        if n < nlist:
+            raise ValueError(f"Need at least {nlist} rows to train {nlist} cells, have {n}")
+
+        sample_size = min(n, sample_size or nlist * 64)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n, sample_size, replace=False))
+        sample = _normalised(base, base.reconstruct(sample_rows))
+
+        centroids = kmeans(sample, nlist, n_iter=n_iter, seed=seed)
+        index = cls(base, centroids, [np.empty(0, dtype=np.int64) for _ in range(nlist)], nprobe=nprobe)
+        index.sync()
+        return index
+
+    def sync(self, chunk_size=65536):
+        """
+        Assign any base rows appended since the last call (e.g. by /api/register)
+        to their nearest cell. Costs O(new rows x nlist).
+        """
+        end = len(self.base)
+        if end <= self.indexed_rows:
+            return 0
+
+        added = end - self.indexed_rows
+        new_rows = np.arange(self.indexed_rows, end, dtype=np.int64)
+        vectors = _normalised(self.base, self.base.reconstruct(slice(self.indexed_rows, end)))
+        cells = _nearest(vectors, self.centroids, chunk_size)
+
+        order = np.argsort(cells, kind='stable')
+        cells, new_rows = cells[order], new_rows[order]
+        bounds = np.searchsorted(cells, np.arange(self.nlist + 1))
+        for cell in np.flatnonzero(np.diff(bounds)):
+            self.lists[cell] = np.concatenate([self.lists[cell], new_rows[bounds[cell]:bounds[cell + 1]]])
+
+        self.indexed_rows = end
+        return added
+
+    def search(self, queries, k=5, query_views=None, nprobe=None):
+        """
+        Approximate top-k with the same contract as EmbeddingIndex.search.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n = len(queries)
+        distances = np.full((n, k), np.inf, dtype=np.float32)
+        rows_out = np.zeros((n, k), dtype=np.int64)
+
+        probe = _normalised(self.base, queries)
+        c_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        cell_dist = c_sq[None, :] - 2.0 * (probe @ self.centroids.T)
+        cells = np.argpartition(cell_dist, nprobe - 1, axis=1)[:, :nprobe]
+
+        for q in range(n):
+            rows = np.concatenate([self.lists[c] for c in cells[q]])
+            if query_views is not None and len(rows):
+                rows = rows[self.base.views[rows] == VIEW_CODES[query_views[q]]]
+            if len(rows) == 0:
+                continue
+
+            # Sorted rows read the memory-mapped gallery sequentially
+            rows = np.sort(rows)
+            dist = self.base.distances_to_rows(queries[q], rows)
+            top = min(k, len(rows))
+            best = np.argpartition(dist, top - 1)[:top]
+            best = best[np.argsort(dist[best])]
+            distances[q, :top] = dist[best]
+            rows_out[q, :top] = rows[best]
+
+        return distances, rows_out
+
+    def match(self, queries, query_views=None, k=10):
+        """Approximate counterpart of EmbeddingIndex.match."""
+        return self.base.rank(*self.search(queries, k=k, query_views=query_views))
+
+    def recall(self, queries, k=10, query_views=None):
+        """
+        Fraction of the exact top-k rows that the approximate search also returns.
+        Use this to tune nprobe against the brute-force baseline.
+        """
+        _, exact = self.base.search(queries, k=k, query_views=query_views)
+        _, approx = self.search(queries, k=k, query_views=query_views)
+        hits = sum(len(np.intersect1d(e, a)) for e, a in zip(exact, approx))
+        return hits / exact.size if exact.size else 1.0
+
+    # ---------- Persistence ----------
+
+    def save(self, path):
+        """Write centroids and inverted lists atomically to ``path`` (.npz)."""
+        sizes = np.array([len(rows) for rows in self.lists], dtype=np.int64)
+        rows = np.concatenate(self.lists) if self.lists else np.empty(0, dtype=np.int64)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                offsets=np.concatenate([[0], np.cumsum(sizes)]),
+                rows=rows,
+                indexed_rows=np.int64(self.indexed_rows),
+                nprobe=np.int64(self.nprobe),
+            )
+        os.replace(tmp_path, path)
+        self.saved_rows = self.indexed_rows
+
+    @classmethod
+    def load(cls, path, base, nprobe=None):
+        """
+        Load a saved index over ``base`` and catch up on rows appended since it
+        was written.
+        """
+        with np.load(path) as data:
+            offsets = data['offsets']
+            rows = data['rows']
+            lists = [rows[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+            index = cls(
+                base,
+                data['centroids'],
+                lists,
+                nprobe=nprobe or int(data['nprobe']),
+                indexed_rows=int(data['indexed_rows']),
+            )
+
+        if index.indexed_rows > len(base):
+            raise ValueError("IVF index covers more rows than the embedding store holds")
+        index.sync()
+        return index
+
+
+def _normalised(base, vectors):
+    """Cosine galleries are clustered on the unit sphere; L2 galleries as-is."""
+    if base.metric == 'cosine':
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors
@@ -0,0 +1,109 @@
+# server/utils/facial_recognition/detection_cache.py
+
+import hashlib
+import os
+import re
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+# Bump when the detector, landmark model or chip geometry changes;
+# entries written by another version are treated as misses.
+DETECTOR_VERSION = 'dlib-hog+sp68/chip150-pad0.25'
+CHIP_SIZE = 150
+CHIP_PADDING = 0.25
+
+Detection = namedtuple('Detection', ['bbox', 'landmarks', 'chip'])
+Detection.__doc__ = """
+bbox: (left, top, right, bottom) face box in the original image
+landmarks: (68, 2) int32 landmark coordinates
+chip: (CHIP_SIZE, CHIP_SIZE, 3) uint8 RGB aligned face crop
+"""
+
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+def content_key(path):
+    """
+    Cache key for an image file: the SHA-256 already in a content-addressed
+    blob name, otherwise the SHA-256 of the file's bytes.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if _SHA256.match(stem):
+        return stem
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """
+    Persistent face detection results keyed by image content hash.
+
+    Each entry is a small .npz holding the face box, the 68 landmarks and the
+    aligned face chip, sharded like the image blobs (<dir>/ab/<hash>.npz).
+    Embedding a cached image needs only the chip, so re-embedding the whole
+    registry with a new descriptor model skips decoding, detection and
+    landmarking.
+    """
+
+    def __init__(self, directory, version=DETECTOR_VERSION):
+        self.directory = directory
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.npz")
+
+    def get(self, key):
+        """Return the cached Detection, or None (missing, unreadable or from another detector version)."""
+        try:
+            with np.load(self.path(key), allow_pickle=False) as data:
+                if str(data['version']) != self.version:
+                    raise KeyError('version')
+                detection = Detection(tuple(int(v) for v in data['bbox']), data['landmarks'], data['chip'])
+        except (OSError, KeyError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return detection
+
+    def put(self, key, detection):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                version=np.array(self.version),
+                bbox=np.asarray(detection.bbox, dtype=np.int32),
+                landmarks=np.asarray(detection.landmarks, dtype=np.int32),
+                chip=np.ascontiguousarray(detection.chip, dtype=np.uint8),
+            )
+        # Readers never see a half-written entry
+        os.replace(tmp_path, path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_detection_cache():
+    """Return the shared detection cache, or None when DETECTION_CACHE_DIR is unset."""
+    global _cache
+    if _cache is None:
+        from ...config import Config
+
+        if not Config.DETECTION_CACHE_DIR:
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = DetectionCache(Config.DETECTION_CACHE_DIR)
+    return _cache
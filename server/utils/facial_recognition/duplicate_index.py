@@ -0,0 +1,195 @@
+# server/utils/facial_recognition/duplicate_index.py
+
+import threading
+
+import cv2
+import numpy as np
+
+# Views compared for re-registration; the back view says too little on its own
+DUPLICATE_VIEWS = ('front', 'left', 'right')
+
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def phash(image):
+    """
+    64-bit DCT perceptual hash of a BGR/grayscale image, encoded bytes or a path.
+
+    Encoded images are decoded at 1/4 resolution in grayscale; the hash only
+    looks at the lowest 8x8 frequencies of a 32x32 thumbnail. Returns an int,
+    or None if the image cannot be decoded.
+    """
+    if isinstance(image, str):
+        image = cv2.imread(image, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        image = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+
+    if image is None:
+        return None
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    small = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    # Median of the AC terms; the DC term only encodes overall brightness
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def to_signed(value):
+    """Store a 64-bit hash in a signed BIGINT column."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_signed(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def hamming(a, hashes):
+    """Bit distance from one 64-bit hash to an array of them."""
+    xor = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(a))
+    return _POPCOUNT8[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class MultiIndexHash:
+    """
+    Hamming-radius search over 64-bit perceptual hashes (multi-index hashing).
+
+    Each hash is split into ``chunks`` 16-bit substrings, and every substring
+    has a table sorted by value. By the pigeonhole principle, a hash within
+    ``radius`` bits of the query matches it in at least one substring within
+    radius // chunks bits. A query therefore looks up a few hundred buckets
+    by binary search, then checks those candidates' full Hamming distance,
+    instead of scanning every stored image.
+
+    New hashes go to a small unsorted tail, which is scanned directly and
+    merged into the sorted tables once it grows past ``tail_limit``.
+    """
+
+    def __init__(self, chunks=4, tail_limit=4096):
+        if 64 % chunks:
+            raise ValueError("chunks must divide 64")
+        self.chunks = chunks
+        self.bits = 64 // chunks
+        self.tail_limit = tail_limit
+        self.keys = []  # entry -> caller's key, e.g. (animal_id, view)
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._sorted = [(np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64))] * chunks
+        self._tail = []  # (hash, entry) not yet in the sorted tables
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _chunk(self, hashes, c):
+        mask = np.uint64((1 << self.bits) - 1)
+        return (np.asarray(hashes, dtype=np.uint64) >> np.uint64(c * self.bits)) & mask
+
+    def add(self, key, value):
+        with self._lock:
+            self._tail.append((value, len(self.keys)))
+            self.keys.append(key)
+            if len(self._tail) >= self.tail_limit:
+                self._merge()
+
+    def add_many(self, items):
+        """items: iterable of (key, hash)"""
+        with self._lock:
+            for key, value in items:
+                self._tail.append((value, len(self.keys)))
+                self.keys.append(key)
+            if len(self._tail) >= self.tail_limit:
+                self._merge()
+
+    def _merge(self):
+        if not self._tail:
+            return
+        values = np.array([v for v, _ in self._tail], dtype=np.uint64)
+        self._hashes = np.concatenate([self._hashes, values])
+        self._tail = []
+        entries = np.arange(len(self._hashes), dtype=np.int64)
+        tables = []
+        for c in range(self.chunks):
+            chunk = self._chunk(self._hashes, c)
+            order = np.argsort(chunk, kind='stable')
+            tables.append((chunk[order], entries[order]))
+        self._sorted = tables
+
+    def _probes(self, value, flips):
+        """Every chunk value within ``flips`` bits of value."""
+        probes = [value]
+        for _ in range(flips):
+            probes = {p ^ (1 << b) for p in probes for b in range(self.bits)} | set(probes)
+        return np.fromiter(probes, dtype=np.uint64)
+
+    def search(self, value, radius):
+        """Return [(key, distance)] for stored hashes within ``radius`` bits, nearest first."""
+        flips = radius // self.chunks
+        with self._lock:
+            candidates = [np.array([e for _, e in self._tail], dtype=np.int64)]
+            hashes = [np.array([v for v, _ in self._tail], dtype=np.uint64)]
+            for c, (values, entries) in enumerate(self._sorted):
+                if len(values) == 0:
+                    continue
+                probes = self._probes(int(self._chunk([value], c)[0]), flips)
+                starts = np.searchsorted(values, probes, side='left')
+                ends = np.searchsorted(values, probes, side='right')
+                candidates.extend(entries[a:b] for a, b in zip(starts, ends) if b > a)
+            merged = np.unique(np.concatenate(candidates[1:])) if len(candidates) > 1 else candidates[0][:0]
+            hashes.append(self._hashes[merged])
+            keys = self.keys
+
+        entries = np.concatenate([candidates[0], merged])
+        distances = hamming(value, np.concatenate(hashes))
+        keep = np.flatnonzero(distances <= radius)
+        keep = keep[np.lexsort((entries[keep], distances[keep]))]
+        return [(keys[e], int(d)) for e, d in zip(entries[keep], distances[keep])]
+
+
+_index = None
+_index_state = {'max_id': 0}
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index():
+    """
+    Return this worker's pHash index over stored front/side images, first
+    loading any AnimalImage rows registered since the last call.
+    """
+    global _index
+    from ...models.animal import AnimalImage
+
+    with _index_lock:
+        if _index is None:
+            _index = MultiIndexHash()
+        rows = (
+            AnimalImage.query
+            .with_entities(AnimalImage.id, AnimalImage.animal_id, AnimalImage.image_type, AnimalImage.phash)
+            .filter(AnimalImage.id > _index_state['max_id'])
+            .order_by(AnimalImage.id)
+            .all()
+        )
+        _index.add_many(
+            ((row.animal_id, row.image_type), from_signed(row.phash))
+            for row in rows if row.phash is not None and row.image_type in DUPLICATE_VIEWS
+        )
+        if rows:
+            _index_state['max_id'] = rows[-1].id
+    return _index
+
+
+def find_duplicates(hashes, radius, index=None):
+    """
+    Registered animals whose stored front/side images are near-duplicates of
+    the given views. hashes: dict of view -> pHash (None values are skipped).
+    Returns [{'animal_id', 'view', 'matched_view', 'distance'}], closest first.
+    """
+    index = index if index is not None else get_duplicate_index()
+    found = []
+    for view, value in hashes.items():
+        if value is None or view not in DUPLICATE_VIEWS:
+            continue
+        for (animal_id, matched_view), distance in index.search(value, radius):
+            found.append({'animal_id': animal_id, 'view': view,
+                          'matched_view': matched_view, 'distance': distance})
+    return sorted(found, key=lambda d: d['distance'])
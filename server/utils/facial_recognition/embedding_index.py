@@ -0,0 +1,295 @@
+# server/utils/facial_recognition/embedding_index.py
+
+import numpy as np
+
+# dlib's ResNet face model produces 128-d descriptors
+EMBEDDING_DIM = 128
+
+# Each registered animal is photographed from four sides
+VIEWS = ('front', 'back', 'left', 'right')
+VIEW_CODES = {view: code for code, view in enumerate(VIEWS)}
+
+
+class EmbeddingIndex:
+    """
+    In-memory matching engine over every registered animal's per-view embeddings.
+
+    All rows live in one contiguous float32 matrix. Two parallel arrays map each
+    row to the animal it belongs to (an ordinal into ``animal_ids``) and to the
+    view it was computed from, so a query is a single batched matrix product
+    followed by a top-k partition rather than a Python loop over a dict.
+
+    Rows are kept exactly as given (with their L2 norms alongside) so the same
+    matrix can be memory-mapped from an EmbeddingStore whatever the metric.
+
+    metric: 'l2' (dlib convention, match when distance < ~0.6) or 'cosine'
+    """
+
+    # Per-row backing arrays, grown together by _reserve()
+    _ARRAYS = ('_vectors', '_norms', '_labels', '_views')
+
+    def __init__(self, dim=EMBEDDING_DIM, metric='l2', capacity=1024):
+        if metric not in ('l2', 'cosine'):
+            raise ValueError(f"Unsupported metric: {metric}")
+
+        self.dim = dim
+        self.metric = metric
+        self._size = 0
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        self._norms = np.empty(capacity, dtype=np.float32)
+        self._labels = np.empty(capacity, dtype=np.int32)
+        self._views = np.empty(capacity, dtype=np.int8)
+
+        self.animal_ids = []   # ordinal -> animal_id
+        self._ordinals = {}    # animal_id -> ordinal
+        self._by_label = None  # (row order sorted by label, sorted labels), built lazily
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        return self._vectors[:self._size]
+
+    @property
+    def labels(self):
+        return self._labels[:self._size]
+
+    @property
+    def views(self):
+        return self._views[:self._size]
+
+    @classmethod
+    def from_dict(cls, known_embeddings_dict, dim=EMBEDDING_DIM, metric='l2'):
+        """
+        Build an index from a mapping of animal_id -> embedding.
+
+        Values may be a single vector, a (n_views, dim) array, or a dict of
+        view name -> vector.
+        """
+        index = cls(dim=dim, metric=metric, capacity=max(1, len(known_embeddings_dict) * len(VIEWS)))
+        for animal_id, embeddings in known_embeddings_dict.items():
+            if isinstance(embeddings, dict):
+                index.add(animal_id, list(embeddings.values()), views=list(embeddings.keys()))
+            else:
+                index.add(animal_id, embeddings)
+        return index
+
+    def _reserve(self, extra):
+        """Grow the backing arrays geometrically so appends stay amortised O(1)."""
+        needed = self._size + extra
+        capacity = getattr(self, self._ARRAYS[0]).shape[0]
+        if needed <= capacity:
+            return
+
+        new_capacity = max(needed, capacity * 2)
+        for name in self._ARRAYS:
+            old = getattr(self, name)
+            new = np.empty((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    @classmethod
+    def from_arrays(cls, vectors, norms, labels, views, animal_ids, metric='l2'):
+        """
+        Wrap existing arrays (e.g. read-only memory maps) without copying them.
+        A later add() copies everything into private memory first.
+        """
+        index = cls(dim=vectors.shape[1], metric=metric, capacity=1)
+        index._vectors = vectors
+        index._norms = norms
+        index._labels = labels
+        index._views = views
+        index._size = vectors.shape[0]
+        index.animal_ids = animal_ids
+        index._ordinals = None  # built on first add()
+        index._by_label = None
+        return index
+
+    def _prepare(self, embeddings):
+        """Cast to a 2-D float32 array and check its dimension."""
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {embeddings.shape[1]}")
+        return embeddings
+
+    def ordinal(self, animal_id):
+        """Return the ordinal for animal_id, allocating one if it is new."""
+        if self._ordinals is None:
+            self.animal_ids = list(self.animal_ids)
+            self._ordinals = {a: i for i, a in enumerate(self.animal_ids)}
+        ordinal = self._ordinals.get(animal_id)
+        if ordinal is None:
+            ordinal = len(self.animal_ids)
+            self._ordinals[animal_id] = ordinal
+            self.animal_ids.append(animal_id)
+        return ordinal
+
+    def ordinals_of(self, animal_ids):
+        """Sorted ordinals of the given animal IDs that are in the index (unknown IDs are skipped)."""
+        if self._ordinals is None:
+            self.animal_ids = list(self.animal_ids)
+            self._ordinals = {a: i for i, a in enumerate(self.animal_ids)}
+        found = [self._ordinals[a] for a in animal_ids if a in self._ordinals]
+        return np.array(sorted(found), dtype=np.int64)
+
+    def subset(self, rows):
+        """
+        A small index over the given rows only, sharing this index's ordinals
+        and animal_ids so its matches resolve the same way.
+        """
+        rows = np.asarray(rows)
+        return EmbeddingIndex.from_arrays(
+            self._vectors[rows], self._norms[rows], self._labels[rows], self._views[rows],
+            self.animal_ids, metric=self.metric,
+        )
+
+    def add(self, animal_id, embeddings, views=None):
+        """
+        Append one animal's embeddings.
+
+        embeddings: (n, dim) array-like, one row per view
+        views: view names for each row (defaults to front/back/left/right order)
+        """
+        embeddings = self._prepare(embeddings)
+        n = embeddings.shape[0]
+        if views is None:
+            views = VIEWS[:n]
+        if len(views) != n:
+            raise ValueError("views must have one entry per embedding row")
+
+        self._reserve(n)
+        start, end = self._size, self._size + n
+        self._write_rows(start, end, embeddings)
+        self._labels[start:end] = self.ordinal(animal_id)
+        self._views[start:end] = [VIEW_CODES[v] for v in views]
+        self._size = end
+        self._by_label = None
+
+    def _write_rows(self, start, end, embeddings):
+        self._vectors[start:end] = embeddings
+        self._norms[start:end] = np.linalg.norm(embeddings, axis=1)
+
+    def reconstruct(self, rows):
+        """Float32 vectors of the given rows (a slice, index array or list)."""
+        return np.asarray(self._vectors[:self._size][rows], dtype=np.float32)
+
+    def rows_for(self, ordinals, view=None):
+        """
+        Gallery rows belonging to the given animal ordinals, optionally only
+        those from one view. Uses a label-sorted row order built once per index
+        (near O(n) since stores append an animal's views contiguously).
+        """
+        if self._by_label is None:
+            order = np.argsort(self.labels, kind='stable')
+            self._by_label = (order, self.labels[order])
+        order, sorted_labels = self._by_label
+
+        ordinals = np.asarray(ordinals)
+        starts = np.searchsorted(sorted_labels, ordinals, side='left')
+        ends = np.searchsorted(sorted_labels, ordinals, side='right')
+        if len(ordinals) == 0 or not (ends - starts).any():
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate([order[a:b] for a, b in zip(starts, ends)])
+        if view is not None:
+            rows = rows[self.views[rows] == VIEW_CODES[view]]
+        return np.sort(rows)
+
+    def distances(self, queries):
+        """
+        Distance from every query row to every gallery row, shape (n_queries, n_rows).
+        Computed as one matrix product over the contiguous gallery.
+        """
+        queries = self._prepare(queries)
+        norms = self._norms[:self._size]
+        q_norms = np.linalg.norm(queries, axis=1)
+
+        if self.metric == 'cosine':
+            queries = queries / np.maximum(q_norms, 1e-12)[:, None]
+            dist = queries @ self.vectors.T
+            dist /= np.maximum(norms, 1e-12)[None, :]
+            np.subtract(1.0, dist, out=dist)
+            return dist
+
+        dist = queries @ self.vectors.T
+        dist *= -2.0
+        dist += (q_norms ** 2)[:, None]
+        dist += (norms ** 2)[None, :]
+        np.maximum(dist, 0.0, out=dist)
+        return np.sqrt(dist, out=dist)
+
+    def distances_to_rows(self, query, rows):
+        """Distance from a single query vector to a subset of gallery rows."""
+        query = self._prepare(query)[0]
+        vectors = self._vectors[rows]
+        norms = self._norms[rows]
+        q_norm = np.linalg.norm(query)
+
+        if self.metric == 'cosine':
+            dist = vectors @ (query / max(q_norm, 1e-12))
+            dist /= np.maximum(norms, 1e-12)
+            return 1.0 - dist
+
+        dist = vectors @ query
+        dist *= -2.0
+        dist += q_norm ** 2
+        dist += norms ** 2
+        np.maximum(dist, 0.0, out=dist)
+        return np.sqrt(dist, out=dist)
+
+    def search(self, queries, k=5, query_views=None):
+        """
+        Batched top-k search.
+
+        queries: (n_queries, dim) array
+        query_views: optional view name per query; when given, each query only
+            competes against gallery rows from the same view.
+
+        Returns (distances, rows), both shaped (n_queries, k') with k' = min(k, len(self)),
+        sorted nearest-first. Unreachable slots have distance inf.
+        """
+        if self._size == 0:
+            n = np.atleast_2d(queries).shape[0]
+            return np.empty((n, 0), dtype=np.float32), np.empty((n, 0), dtype=np.int64)
+
+        dist = self.distances(queries)
+        if query_views is not None:
+            codes = np.array([VIEW_CODES[v] for v in query_views], dtype=np.int8)
+            dist[self.views[None, :] != codes[:, None]] = np.inf
+
+        k = min(k, self._size)
+        rows = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(dist, rows, axis=1)
+        order = np.argsort(top, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    def match(self, queries, query_views=None, k=10):
+        """
+        Rank candidate animals for a set of query views.
+
+        Each query contributes its best distance to every animal in its top-k;
+        animals missing from a query's shortlist are charged that query's k-th
+        distance. The fused score is the mean over queries.
+
+        Returns a list of (animal_id, fused_distance), best first.
+        """
+        return self.rank(*self.search(queries, k=k, query_views=query_views))
+
+    def rank(self, distances, rows):
+        """Fuse per-query top-k (distances, rows) from any searcher into ranked animals."""
+        if rows.shape[1] == 0:
+            return []
+
+        labels = self._labels[rows]
+        candidates = np.unique(labels)
+
+        # Best distance per (query, candidate); default to each query's worst top-k distance
+        per_query = np.repeat(distances[:, -1:], len(candidates), axis=1)
+        cols = np.searchsorted(candidates, labels)
+        query_idx = np.broadcast_to(np.arange(rows.shape[0])[:, None], cols.shape)
+        np.minimum.at(per_query, (query_idx, cols), distances)
+
+        fused = per_query.mean(axis=0)
+        order = np.argsort(fused)
+        return [(self.animal_ids[candidates[i]], float(fused[i])) for i in order]
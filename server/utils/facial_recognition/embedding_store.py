@@ -0,0 +1,264 @@
+# server/utils/facial_recognition/embedding_store.py
+
+import os
+import threading
+
+import numpy as np
+
+from .embedding_index import EmbeddingIndex, EMBEDDING_DIM, VIEW_CODES
+from .quantized_index import QuantizedEmbeddingIndex, quantize
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer deployments only
+    fcntl = None
+
+
+# Fixed-width ID sidecar record: NUL-padded animal_id plus a view code
+ID_RECORD = np.dtype([('animal_id', 'S63'), ('view', 'i1')])
+
+
+class EmbeddingStore:
+    """
+    Persistent, append-only gallery shared by every WSGI worker.
+
+    Layout inside ``directory``:
+        embeddings.f32  raw float32 rows, ``dim`` values each
+        norms.f32       float32 L2 norm per row
+        embeddings.ids  fixed-width ID_RECORD per row (the ID sidecar)
+        codes.i8        int8 quantized rows (derived; see QuantizedEmbeddingIndex)
+        scales.f32      float32 quantization scale per row
+        MODEL_VERSION   model version every row was computed with
+
+    Writers append under an exclusive file lock; readers memory-map the
+    vector and norm files read-only, so all workers share the same pages
+    through the OS cache instead of holding private copies of the gallery.
+    Every file is fixed-width, so the committed row count is simply the
+    shortest of the three and a torn append is discarded by truncation.
+
+    The quantized pair is derived from the float rows. Writers keep it in
+    step, and stores created before it existed are caught up on first use,
+    so readers can map either representation.
+    """
+
+    def __init__(self, directory, dim=EMBEDDING_DIM, model_version=None):
+        self.directory = directory
+        self.dim = dim
+        self.model_version = model_version
+        self.vectors_path = os.path.join(directory, 'embeddings.f32')
+        self.norms_path = os.path.join(directory, 'norms.f32')
+        self.ids_path = os.path.join(directory, 'embeddings.ids')
+        self.codes_path = os.path.join(directory, 'codes.i8')
+        self.scales_path = os.path.join(directory, 'scales.f32')
+        self.lock_path = os.path.join(directory, '.lock')
+        os.makedirs(directory, exist_ok=True)
+        if model_version is not None:
+            self._check_model_version(model_version)
+
+        # Row widths in bytes for each file
+        self._widths = (
+            (self.vectors_path, dim * 4),
+            (self.norms_path, 4),
+            (self.ids_path, ID_RECORD.itemsize),
+        )
+        self._quantized_widths = (
+            (self.codes_path, dim),
+            (self.scales_path, 4),
+        )
+
+        # Incrementally parsed view of the ID sidecar
+        self._labels = np.empty(0, dtype=np.int32)
+        self._views = np.empty(0, dtype=np.int8)
+        self._animal_ids = []
+        self._ordinals = {}
+        self._read_lock = threading.Lock()
+
+    def __len__(self):
+        return self.committed_rows()
+
+    def _check_model_version(self, model_version):
+        """Tag a new store with its model version; refuse to open one computed by another model."""
+        path = os.path.join(self.directory, 'MODEL_VERSION')
+        with _FileLock(self.lock_path):
+            if not os.path.exists(path):
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(model_version)
+                return
+            with open(path, encoding='utf-8') as f:
+                tagged = f.read().strip()
+        if tagged != model_version:
+            raise ValueError(f"Embedding store {self.directory} holds {tagged} embeddings, not {model_version}")
+
+    def committed_rows(self):
+        """Rows present in all three files; anything past this is a torn append."""
+        return self._rows(self._widths)
+
+    def _rows(self, widths):
+        rows = []
+        for path, width in widths:
+            try:
+                rows.append(os.path.getsize(path) // width)
+            except OSError:
+                return 0
+        return min(rows)
+
+    # ---------- Writing ----------
+
+    def append(self, animal_id, embeddings, views):
+        """
+        Append one animal's per-view embeddings.
+
+        embeddings: (n, dim) array-like
+        views: view name for each row
+        """
+        self.append_many([(animal_id, embeddings, views)])
+
+    def append_many(self, entries):
+        """
+        Append several animals in one locked write.
+
+        entries: iterable of (animal_id, embeddings, views)
+        """
+        vectors, records = [], []
+        for animal_id, embeddings, views in entries:
+            embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+            if embeddings.shape[1] != self.dim:
+                raise ValueError(f"Expected embeddings of dimension {self.dim}, got {embeddings.shape[1]}")
+            if len(views) != embeddings.shape[0]:
+                raise ValueError("views must have one entry per embedding row")
+            encoded = animal_id.encode('utf-8')
+            if len(encoded) > ID_RECORD['animal_id'].itemsize:
+                raise ValueError(f"animal_id too long for embedding store: {animal_id}")
+
+            vectors.append(embeddings)
+            records.extend((encoded, VIEW_CODES[view]) for view in views)
+
+        if not records:
+            return
+
+        vectors = np.ascontiguousarray(np.concatenate(vectors))
+        norms = np.linalg.norm(vectors, axis=1).astype(np.float32)
+        ids = np.array(records, dtype=ID_RECORD)
+        codes, scales = quantize(vectors)
+
+        with _FileLock(self.lock_path):
+            rows = self.committed_rows()
+            self._sync_quantized(rows)
+            widths = self._widths + self._quantized_widths
+            for (path, width), data in zip(widths, (vectors, norms, ids, codes, scales)):
+                _append(path, width, rows, data)
+
+    def _sync_quantized(self, rows, chunk_rows=65536):
+        """
+        Bring the quantized files to exactly ``rows`` rows, quantizing float
+        rows they are missing (older stores, or a torn append). Caller holds the lock.
+        """
+        done = self._rows(self._quantized_widths)
+        sizes = [os.path.getsize(p) if os.path.exists(p) else 0 for p, _ in self._quantized_widths]
+        if all(size == rows * w for size, (_, w) in zip(sizes, self._quantized_widths)):
+            return
+        done = min(done, rows)
+        vectors = self._map(self.vectors_path, (rows, self.dim))
+        for start in range(done, rows, chunk_rows):
+            end = min(start + chunk_rows, rows)
+            codes, scales = quantize(vectors[start:end])
+            for (path, width), data in zip(self._quantized_widths, (codes, scales)):
+                _append(path, width, start, data)
+        for path, width in self._quantized_widths:
+            with open(path, 'ab') as f:
+                f.truncate(rows * width)
+
+    # ---------- Reading ----------
+
+    def has_new_rows(self, known_rows):
+        """Cheap staleness check: a few stat() calls, no reads."""
+        return self.committed_rows() != known_rows
+
+    def _read_new_ids(self, rows):
+        """Parse ID records between the last parsed row and ``rows``."""
+        start = len(self._labels)
+        if rows <= start:
+            return
+
+        records = np.fromfile(
+            self.ids_path, dtype=ID_RECORD, count=rows - start, offset=start * ID_RECORD.itemsize
+        )
+        unique_ids, inverse = np.unique(records['animal_id'], return_inverse=True)
+
+        ordinals = np.empty(len(unique_ids), dtype=np.int32)
+        for i, raw in enumerate(unique_ids):
+            animal_id = raw.decode('utf-8')
+            ordinal = self._ordinals.get(animal_id)
+            if ordinal is None:
+                ordinal = len(self._animal_ids)
+                self._ordinals[animal_id] = ordinal
+                self._animal_ids.append(animal_id)
+            ordinals[i] = ordinal
+
+        self._labels = np.concatenate([self._labels, ordinals[inverse]])
+        self._views = np.concatenate([self._views, records['view']])
+
+    def _map(self, path, shape, dtype=np.float32):
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+    def load_index(self, metric='l2', quantized=False):
+        """
+        Return an EmbeddingIndex backed by read-only memory maps of the store.
+        Only ID records not seen before are parsed, so refreshing after an
+        append costs O(new rows).
+
+        quantized=True maps the int8 codes instead of the float32 rows
+        (a QuantizedEmbeddingIndex, ~3.8x less memory).
+        """
+        with self._read_lock:
+            rows = self.committed_rows()
+            self._read_new_ids(rows)
+            norms = self._map(self.norms_path, (rows,))
+            if not quantized:
+                vectors = self._map(self.vectors_path, (rows, self.dim))
+                return EmbeddingIndex.from_arrays(
+                    vectors, norms, self._labels[:rows], self._views[:rows],
+                    self._animal_ids, metric=metric
+                )
+
+            if self._rows(self._quantized_widths) < rows:
+                with _FileLock(self.lock_path):
+                    self._sync_quantized(rows)
+            codes = self._map(self.codes_path, (rows, self.dim), dtype=np.int8)
+            scales = self._map(self.scales_path, (rows,))
+            return QuantizedEmbeddingIndex.from_arrays(
+                codes, scales, norms, self._labels[:rows], self._views[:rows],
+                self._animal_ids, metric=metric
+            )
+
+
+def _append(path, width, rows, data):
+    """Append data after the first ``rows`` fixed-width rows of path, dropping anything beyond them."""
+    with open(path, 'ab') as f:
+        if f.tell() != rows * width:
+            f.truncate(rows * width)
+        f.write(data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class _FileLock:
+    """Exclusive advisory lock on a file, held for the duration of a with block."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
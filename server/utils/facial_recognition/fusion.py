@@ -0,0 +1,99 @@
+# server/utils/facial_recognition/fusion.py
+
+import numpy as np
+
+# Views ordered from most to least discriminative; the first one present is
+# matched against the whole gallery, the rest only against its shortlist.
+DEFAULT_VIEW_ORDER = ('front', 'left', 'right', 'back')
+
+
+def fused_match(index, embeddings, views, threshold, shortlist=50,
+                accept_distance=None, accept_margin=0.1, view_order=DEFAULT_VIEW_ORDER):
+    """
+    Multi-view matching with shortlist pruning and early exit.
+
+    1. The most discriminative view is searched against the full gallery (or
+       the IVF index) and the ``shortlist`` nearest animals are kept.
+    2. Remaining views are scored only against the shortlisted animals' rows.
+    3. After each view the fused score (mean distance over views scored so
+       far) is checked:
+         - accept early when the best candidate is within ``accept_distance``
+           and leads the runner-up by ``accept_margin``;
+         - reject early when even a perfect score on every remaining view
+           could not bring the best candidate under ``threshold``.
+
+    Args:
+        index: EmbeddingIndex or IVFIndex
+        embeddings: (n_views, dim) query embeddings
+        views: view name per embedding row
+        threshold: maximum fused distance for a match
+
+    Returns:
+        dict with 'animal_id', 'distance', 'views_scored' and 'shortlist'
+        (None for animal_id when nothing matches), or None if there is
+        nothing to search.
+    """
+    base = getattr(index, 'base', index)
+    if len(index) == 0 or len(views) == 0:
+        return None
+
+    rank = {view: i for i, view in enumerate(view_order)}
+    order = sorted(range(len(views)), key=lambda i: rank.get(views[i], len(view_order)))
+    total = len(order)
+
+    # Stage 1: one full scan for the lead view
+    first = order[0]
+    distances, rows = index.search(embeddings[first:first + 1], k=shortlist, query_views=[views[first]])
+    reachable = np.isfinite(distances[0])
+    if not reachable.any():
+        return None
+
+    labels = base.labels[rows[0][reachable]]
+    candidates, first_idx = np.unique(labels, return_index=True)
+    # Rows come back nearest-first, so the first occurrence is each animal's best distance
+    sums = distances[0][reachable][first_idx].astype(np.float64)
+    counts = np.ones(len(candidates), dtype=np.int64)
+    scored = [views[first]]
+
+    def decision():
+        fused = sums / counts
+        best = int(np.argmin(fused))
+        if accept_distance is not None and fused[best] <= accept_distance:
+            runner_up = np.partition(fused, 1)[1] if len(fused) > 1 else np.inf
+            if runner_up - fused[best] >= accept_margin:
+                return 'accept'
+        # Remaining views can add at best 0 distance each
+        if (sums / total).min() > threshold:
+            return 'reject'
+        return None
+
+    outcome = decision()
+
+    # Stage 2: remaining views against the shortlist only
+    for i in order[1:]:
+        if outcome is not None:
+            break
+
+        view_rows = base.rows_for(candidates, view=views[i])
+        if len(view_rows) == 0:
+            continue
+
+        dist = base.distances_to_rows(embeddings[i], view_rows)
+        per_animal = np.full(len(candidates), np.inf)
+        np.minimum.at(per_animal, np.searchsorted(candidates, base.labels[view_rows]), dist)
+
+        has_view = np.isfinite(per_animal)
+        sums[has_view] += per_animal[has_view]
+        counts[has_view] += 1
+        scored.append(views[i])
+        outcome = decision()
+
+    fused = sums / counts
+    best = int(np.argmin(fused))
+    matched = outcome != 'reject' and fused[best] <= threshold
+    return {
+        'animal_id': base.animal_ids[candidates[best]] if matched else None,
+        'distance': float(fused[best]),
+        'views_scored': scored,
+        'shortlist': len(candidates),
+    }
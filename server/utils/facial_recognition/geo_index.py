@@ -0,0 +1,137 @@
+# server/utils/facial_recognition/geo_index.py
+
+import math
+
+import numpy as np
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_KM_PER_DEG_LAT = 111.32
+EARTH_RADIUS_KM = 6371.0
+
+
+def _cell_size(precision):
+    """(lat_bits, lng_bits, cell height, cell width in degrees) of a geohash cell."""
+    lat_bits = 5 * precision // 2
+    lng_bits = 5 * precision - lat_bits
+    return lat_bits, lng_bits, 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def _cell_hash(i, j, precision):
+    """Geohash of the cell at lat index i, lng index j (bits interleaved lng-first)."""
+    lat_bits, lng_bits, _, _ = _cell_size(precision)
+    bits = 0
+    for k in range(5 * precision):
+        if k % 2 == 0:
+            lng_bits -= 1
+            bits = (bits << 1) | ((j >> lng_bits) & 1)
+        else:
+            lat_bits -= 1
+            bits = (bits << 1) | ((i >> lat_bits) & 1)
+    return ''.join(_BASE32[(bits >> shift) & 31] for shift in range(5 * (precision - 1), -1, -5))
+
+
+def _cell_index(lat, lng, precision):
+    lat_bits, lng_bits, height, width = _cell_size(precision)
+    i = min(int((lat + 90.0) // height), (1 << lat_bits) - 1)
+    j = int((lng + 180.0) // width) % (1 << lng_bits)
+    return i, j
+
+
+def geohash(lat, lng, precision=6):
+    """Standard geohash string of a point (precision 6 is ~1.2 x 0.6 km)."""
+    return _cell_hash(*_cell_index(lat, lng, precision), precision)
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distance in km from one point to arrays of points."""
+    lat, lng = math.radians(lat), math.radians(lng)
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoIndex:
+    """
+    Geohash grid over where each animal is expected to be found.
+
+    An animal may have several positions (its owner's geocoded home and the
+    place it was last verified). Every position is filed under all geohash
+    prefixes up to ``precision``, so a radius query can pick whichever cell
+    size covers the search circle with at most ``max_cells`` cells, then
+    filter the few candidates by exact great-circle distance.
+    """
+
+    def __init__(self, precision=6, max_cells=64):
+        self.precision = precision
+        self.max_cells = max_cells
+        self._positions = {}  # animal_id -> tuple of (lat, lng)
+        self._cells = [dict() for _ in range(precision + 1)]  # [prefix length][geohash] -> set of animal_ids
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, animal_id):
+        return animal_id in self._positions
+
+    def update(self, animal_id, positions):
+        """Replace an animal's known positions; (lat, lng) pairs with a None coordinate are ignored."""
+        self.remove(animal_id)
+        positions = tuple({(float(lat), float(lng)) for lat, lng in positions
+                           if lat is not None and lng is not None})
+        if not positions:
+            return
+        self._positions[animal_id] = positions
+        for lat, lng in positions:
+            full = geohash(lat, lng, self.precision)
+            for p in range(1, self.precision + 1):
+                self._cells[p].setdefault(full[:p], set()).add(animal_id)
+
+    def add_position(self, animal_id, lat, lng):
+        """Add one more position (e.g. a fresh sighting) to an animal's set."""
+        self.update(animal_id, self._positions.get(animal_id, ()) + ((lat, lng),))
+
+    def remove(self, animal_id):
+        for lat, lng in self._positions.pop(animal_id, ()):
+            full = geohash(lat, lng, self.precision)
+            for p in range(1, self.precision + 1):
+                ids = self._cells[p].get(full[:p])
+                if ids is not None:
+                    ids.discard(animal_id)
+                    if not ids:
+                        del self._cells[p][full[:p]]
+
+    def _covering_cells(self, lat, lng, radius_km):
+        """Geohashes (finest precision within max_cells) covering the circle's bounding box."""
+        dlat = radius_km / _KM_PER_DEG_LAT
+        dlng = radius_km / (_KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        lat_min, lat_max = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+
+        for p in range(self.precision, 0, -1):
+            lat_bits, lng_bits, _, _ = _cell_size(p)
+            i0, j0 = _cell_index(lat_min, lng - min(dlng, 180.0), p)
+            i1, j1 = _cell_index(lat_max, lng + min(dlng, 180.0), p)
+            rows = i1 - i0 + 1
+            cols = (1 << lng_bits) if dlng >= 180.0 else (j1 - j0) % (1 << lng_bits) + 1
+            if rows * cols <= self.max_cells or p == 1:
+                return [
+                    _cell_hash(i, (j0 + dj) % (1 << lng_bits), p)
+                    for i in range(i0, i1 + 1) for dj in range(cols)
+                ], p
+
+    def candidates(self, lat, lng, radius_km):
+        """Animal IDs with a known position within radius_km of (lat, lng)."""
+        cells, p = self._covering_cells(lat, lng, radius_km)
+        found = set()
+        for cell in cells:
+            found |= self._cells[p].get(cell, set())
+        if not found:
+            return set()
+
+        ids, lats, lngs = [], [], []
+        for animal_id in found:
+            for plat, plng in self._positions[animal_id]:
+                ids.append(animal_id)
+                lats.append(plat)
+                lngs.append(plng)
+        within = haversine_km(lat, lng, np.array(lats), np.array(lngs)) <= radius_km
+        return {animal_id for animal_id, ok in zip(ids, within) if ok}
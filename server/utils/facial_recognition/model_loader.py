@@ -1,18 +1,66 @@
 import os
-import dlib
+import threading
 
 BASE_DIR = os.path.dirname(__file__)
 
-def load_dlib_models():
+SHAPE_PREDICTOR_FILE = "shape_predictor_68_face_landmarks.dat"
+FACE_REC_MODEL_FILE = "dlib_face_recognition_resnet_model_v1.dat"
+
+# Deserialised once per process and version; dlib models are read-only after loading
+_models = {}
+_models_lock = threading.Lock()
+
+
+def model_dir(version):
+    """
+    Directory holding a model version's two .dat files: models/<version>/.
+    The default version may also live directly in models/ (the original layout).
     """
-    Loads Dlib's shape predictor and face recognition model.
-    Assumes models are stored inside: server/utils/facial_recognition/models/
+    from .model_versions import DEFAULT_MODEL_VERSION
+
+    versioned = os.path.join(BASE_DIR, "models", version)
+    if version == DEFAULT_MODEL_VERSION and not os.path.isdir(versioned):
+        return os.path.join(BASE_DIR, "models")
+    return versioned
+
+
+def load_dlib_models(version=None):
     """
+    Loads Dlib's shape predictor and face recognition model for a model
+    version (default: the active one).
+    Models are stored inside: server/utils/facial_recognition/models/<version>/
+
+    Each version is deserialised on its first call only; later calls in the
+    same process return the cached pair.
+    """
+    if version is None:
+        from .model_versions import active_version
+
+        version = active_version()
+
+    models = _models.get(version)
+    if models is not None:
+        return models
+
+    with _models_lock:
+        if version not in _models:
+            _models[version] = _read_models(model_dir(version))
+    return _models[version]
+
+
+def preload_async(versions):
+    """Load any of ``versions`` not yet in memory on a background thread (warm-up)."""
+    missing = [v for v in versions if v not in _models]
+    if missing:
+        threading.Thread(target=lambda: [load_dlib_models(v) for v in missing], daemon=True).start()
+
 
-    models_dir = os.path.join(BASE_DIR, "models")
+def _read_models(models_dir):
+    # Imported lazily so the rest of the package works without dlib installed
+    import dlib
 
-    shape_predictor_path = os.path.join(models_dir, "shape_predictor_68_face_landmarks.dat")
-    face_rec_model_path = os.path.join(models_dir, "dlib_face_recognition_resnet_model_v1.dat")
+    shape_predictor_path = os.path.join(models_dir, SHAPE_PREDICTOR_FILE)
+    face_rec_model_path = os.path.join(models_dir, FACE_REC_MODEL_FILE)
 
     if not os.path.exists(shape_predictor_path):
         raise FileNotFoundError(f"Missing Dlib model: {shape_predictor_path}")
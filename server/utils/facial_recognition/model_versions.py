@@ -0,0 +1,92 @@
+# server/utils/facial_recognition/model_versions.py
+
+import json
+import os
+import threading
+
+from ...config import Config
+
+# The ResNet/landmark pair that shipped in models/ before versioning existed
+DEFAULT_MODEL_VERSION = 'dlib-v1'
+
+_state = None
+_state_stamp = None
+_state_lock = threading.Lock()
+
+
+def state_path():
+    return Config.MODEL_STATE_PATH or os.path.join(Config.EMBEDDING_STORE_DIR, 'model_state.json')
+
+
+def get_model_state():
+    """
+    The deployment's model versions, shared by every worker through a small
+    JSON file:
+        active   version whose embeddings verifies are matched against
+        pending  version being warmed up and backfilled, or None
+
+    Re-read only when the file changes (one stat() per call).
+    """
+    global _state, _state_stamp
+    path = state_path()
+    try:
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    except OSError:
+        stamp = None
+
+    if stamp != _state_stamp or _state is None:
+        with _state_lock:
+            state = {'active': Config.RECOGNITION_MODEL_VERSION or DEFAULT_MODEL_VERSION, 'pending': None}
+            if stamp is not None:
+                with open(path, encoding='utf-8') as f:
+                    state.update(json.load(f))
+            _state, _state_stamp = state, stamp
+    return dict(_state)
+
+
+def active_version():
+    return get_model_state()['active']
+
+
+def pending_version():
+    return get_model_state()['pending']
+
+
+def write_versions():
+    """Versions new registrations must be embedded with: the active one, then any pending one."""
+    state = get_model_state()
+    versions = [state['active']]
+    if state['pending'] and state['pending'] != state['active']:
+        versions.append(state['pending'])
+    return versions
+
+
+def _write_state(state):
+    """Replace the state file atomically so readers see the old or the new state, never a mix."""
+    path = state_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def set_pending_version(version):
+    """Start dual-writing (and warming up) ``version`` alongside the active one."""
+    state = get_model_state()
+    state['pending'] = version
+    _write_state(state)
+
+
+def activate_version(version):
+    """Atomically make ``version`` the one verifies use, ending any pending upgrade."""
+    _write_state({'active': version, 'pending': None})
+
+
+def clear_pending_version():
+    state = get_model_state()
+    state['pending'] = None
+    _write_state(state)
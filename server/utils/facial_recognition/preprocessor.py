@@ -1,3 +1,5 @@
+import threading
+
 import cv2
 import numpy as np
 
@@ -29,6 +31,56 @@ def preprocess_image(image, target_size=(160, 160)):
     # Return the normalized image
     return img_normalized
 
+_scratch = threading.local()
+
+
+def _scratch_buffers(target_size):
+    """Per-thread uint8 buffers reused across calls for resize/colour conversion."""
+    width, height = target_size
+    buffers = getattr(_scratch, 'buffers', None)
+    if buffers is None or buffers[0].shape[:2] != (height, width):
+        buffers = (np.empty((height, width, 3), dtype=np.uint8),
+                   np.empty((height, width, 3), dtype=np.uint8))
+        _scratch.buffers = buffers
+    return buffers
+
+
+def preprocess_batch(images, target_size=(160, 160), out=None):
+    """
+    Preprocess several views (e.g. front/back/left/right) into one NHWC tensor.
+
+    Produces the same values as preprocess_image for each view, but writes
+    straight into a preallocated float32 buffer instead of allocating a new
+    array at every step. Each view is resized first (so colour conversion
+    touches 160x160 pixels, not the full photo) into reused scratch buffers.
+
+    Args:
+        images (list of numpy.ndarray): BGR images, any sizes.
+        target_size (tuple): Desired output size (width, height).
+        out (numpy.ndarray): Optional (N, height, width, 3) float32 buffer to fill.
+
+    Returns:
+        out (numpy.ndarray): (N, height, width, 3) float32 RGB tensor in [0, 1].
+    """
+    width, height = target_size
+    shape = (len(images), height, width, 3)
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    elif out.shape != shape or out.dtype != np.float32:
+        raise ValueError(f"out must be a float32 array of shape {shape}")
+
+    resized, rgb = _scratch_buffers(target_size)
+    scale = np.float32(1.0 / 255.0)
+    for i, image in enumerate(images):
+        cv2.resize(image, target_size, dst=resized)
+        cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=rgb)
+        # Cast then scale in place; a mixed-type multiply would buffer a temporary
+        np.copyto(out[i], rgb, casting='unsafe')
+        np.multiply(out[i], scale, out=out[i])
+
+    return out
+
+
 def crop_face(image, face_rect):
     """
     Crop the detected face region from the image.
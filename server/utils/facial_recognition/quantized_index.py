@@ -0,0 +1,131 @@
+# server/utils/facial_recognition/quantized_index.py
+
+import numpy as np
+
+from .embedding_index import EmbeddingIndex, EMBEDDING_DIM
+
+
+def quantize(vectors):
+    """
+    Symmetric per-vector int8 quantization.
+
+    Each row is scaled so its largest absolute component maps to 127.
+    Returns (codes int8 (n, dim), scales float32 (n,)), with
+    vectors ~= codes * scales[:, None].
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None])
+    return np.clip(codes, -127, 127).astype(np.int8), scales.astype(np.float32)
+
+
+class QuantizedEmbeddingIndex(EmbeddingIndex):
+    """
+    EmbeddingIndex over int8 codes with one float32 scale per row.
+
+    A row takes dim + 8 bytes (code, scale, norm) instead of 4 * dim, about
+    3.8x less for 128-d descriptors. Distances are asymmetric: queries stay
+    float32 and only the gallery side is quantized, which keeps most of the
+    accuracy. Norms are those of the original float vectors, so for L2 the
+    only approximation is the query/row dot product.
+
+    Scoring converts the int8 codes to float32 in fixed-size chunks, so the
+    full float gallery is never rebuilt in memory.
+    """
+
+    _ARRAYS = ('_codes', '_scales', '_norms', '_labels', '_views')
+    CHUNK_ROWS = 65536
+
+    def __init__(self, dim=EMBEDDING_DIM, metric='l2', capacity=1024):
+        super().__init__(dim=dim, metric=metric, capacity=1)
+        del self._vectors
+        self._codes = np.empty((capacity, dim), dtype=np.int8)
+        self._scales = np.empty(capacity, dtype=np.float32)
+        self._norms = np.empty(capacity, dtype=np.float32)
+        self._labels = np.empty(capacity, dtype=np.int32)
+        self._views = np.empty(capacity, dtype=np.int8)
+
+    @classmethod
+    def from_arrays(cls, codes, scales, norms, labels, views, animal_ids, metric='l2'):
+        """Wrap existing arrays (e.g. memory-mapped store files) without copying them."""
+        index = cls(dim=codes.shape[1], metric=metric, capacity=1)
+        index._codes = codes
+        index._scales = scales
+        index._norms = norms
+        index._labels = labels
+        index._views = views
+        index._size = codes.shape[0]
+        index.animal_ids = animal_ids
+        index._ordinals = None
+        index._by_label = None
+        return index
+
+    @classmethod
+    def from_index(cls, index):
+        """Quantize a float EmbeddingIndex (chunk by chunk)."""
+        codes = np.empty((len(index), index.dim), dtype=np.int8)
+        scales = np.empty(len(index), dtype=np.float32)
+        for start in range(0, len(index), cls.CHUNK_ROWS):
+            end = min(start + cls.CHUNK_ROWS, len(index))
+            codes[start:end], scales[start:end] = quantize(index.reconstruct(slice(start, end)))
+        return cls.from_arrays(codes, scales, np.asarray(index._norms[:len(index)]), index.labels,
+                               index.views, index.animal_ids, metric=index.metric)
+
+    @property
+    def vectors(self):
+        """Dequantized float32 rows (materialises the whole gallery; prefer reconstruct)."""
+        return self.reconstruct(slice(None))
+
+    @property
+    def nbytes(self):
+        """Bytes per gallery row that scoring touches (codes, scales, norms)."""
+        return sum(getattr(self, name)[:self._size].nbytes for name in ('_codes', '_scales', '_norms'))
+
+    def _write_rows(self, start, end, embeddings):
+        self._codes[start:end], self._scales[start:end] = quantize(embeddings)
+        self._norms[start:end] = np.linalg.norm(embeddings, axis=1)
+
+    def reconstruct(self, rows):
+        codes = self._codes[:self._size][rows]
+        scales = self._scales[:self._size][rows]
+        return codes.astype(np.float32) * np.asarray(scales, dtype=np.float32)[..., None]
+
+    def subset(self, rows):
+        rows = np.asarray(rows)
+        return QuantizedEmbeddingIndex.from_arrays(
+            self._codes[rows], self._scales[rows], self._norms[rows], self._labels[rows], self._views[rows],
+            self.animal_ids, metric=self.metric,
+        )
+
+    def _dots(self, queries, codes, scales):
+        """queries (q, dim) . dequantized rows -> (q, n), without dequantizing all rows at once."""
+        out = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), self.CHUNK_ROWS):
+            end = min(start + self.CHUNK_ROWS, len(codes))
+            out[:, start:end] = queries @ codes[start:end].astype(np.float32).T
+        out *= np.asarray(scales, dtype=np.float32)[None, :]
+        return out
+
+    def _finish(self, dots, q_norms, norms):
+        if self.metric == 'cosine':
+            dots /= np.maximum(q_norms, 1e-12)[:, None]
+            dots /= np.maximum(norms, 1e-12)[None, :]
+            np.subtract(1.0, dots, out=dots)
+            return dots
+
+        dots *= -2.0
+        dots += (q_norms ** 2)[:, None]
+        dots += (norms ** 2)[None, :]
+        np.maximum(dots, 0.0, out=dots)
+        return np.sqrt(dots, out=dots)
+
+    def distances(self, queries):
+        queries = self._prepare(queries)
+        dots = self._dots(queries, self._codes[:self._size], self._scales[:self._size])
+        return self._finish(dots, np.linalg.norm(queries, axis=1), self._norms[:self._size])
+
+    def distances_to_rows(self, query, rows):
+        query = self._prepare(query)[:1]
+        dots = self._dots(query, self._codes[rows], self._scales[rows])
+        return self._finish(dots, np.linalg.norm(query, axis=1), self._norms[rows])[0]
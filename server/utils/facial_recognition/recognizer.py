@@ -1,27 +1,430 @@
 # server/utils/facial_recognition/recognizer.py
 
+import os
+import threading
+import time
+from datetime import datetime
+
 import cv2
 import numpy as np
 
-def recognize_animal(candidate_image, known_embeddings_dict=None):
+from ...config import Config
+from ..image_processor import decode_image
+from ..logger import setup_logger
+from .embedding_index import EmbeddingIndex, VIEWS
+from .embedding_store import EmbeddingStore
+from .ann_index import IVFIndex
+from .fusion import fused_match
+from .detection_cache import CHIP_PADDING, CHIP_SIZE, Detection, content_key, get_detection_cache
+from .geo_index import GeoIndex
+from .result_cache import get_result_cache, image_set_key
+from .model_loader import load_dlib_models, preload_async
+from .model_versions import DEFAULT_MODEL_VERSION, active_version, write_versions
+from .worker_pool import get_pool
+
+logger = setup_logger(__name__)
+
+_stores = {}   # model version -> EmbeddingStore
+_indexes = {}  # model version -> EmbeddingIndex over that store
+_anns = {}     # model version -> (IVFIndex, mtime of the file it was loaded from)
+_geo = None
+_geo_state = {'max_id': 0, 'seen_since': datetime.min, 'refreshed': 0.0}
+_index_lock = threading.Lock()
+_face_detector = None
+
+
+def store_dir(version):
+    """
+    Embeddings of each model version live in their own store:
+    EMBEDDING_STORE_DIR/<version>/, except the default version, which keeps
+    the original location so existing stores need no migration.
+    """
+    if version == DEFAULT_MODEL_VERSION:
+        return Config.EMBEDDING_STORE_DIR
+    return os.path.join(Config.EMBEDDING_STORE_DIR, version)
+
+
+def get_store(version=None):
+    """Return the shared on-disk embedding store of a model version (default: the active one)."""
+    version = version or active_version()
+    store = _stores.get(version)
+    if store is None:
+        with _index_lock:
+            store = _stores.get(version)
+            if store is None:
+                store = _stores[version] = EmbeddingStore(store_dir(version), model_version=version)
+    return store
+
+
+def get_index(exact=False, version=None):
+    """
+    Return an index over a model version's store (default: the active one),
+    remapping it when another worker (or this one) has appended rows since
+    the last call.
+
+    With RECOGNITION_SEARCH_MODE='ivf' this is an approximate IVFIndex over the
+    same rows once one has been built (exact search until then); pass exact=True to get the brute-force index (e.g. to check recall).
+    RECOGNITION_QUANTIZED maps the int8 codes instead of the float32 rows.
+    """
+    version = version or active_version()
+    store = get_store(version)
+    index = _indexes.get(version)
+    if index is None or store.has_new_rows(len(index)):
+        with _index_lock:
+            index = _indexes.get(version)
+            if index is None or store.has_new_rows(len(index)):
+                index = _indexes[version] = store.load_index(metric=Config.RECOGNITION_METRIC,
+                                                             quantized=Config.RECOGNITION_QUANTIZED)
+
+    if exact or Config.RECOGNITION_SEARCH_MODE != 'ivf':
+        return index
+
+    ann = _get_ann(index, version)
+    return ann if ann is not None else index
+
+
+def ivf_path(version):
+    return os.path.join(store_dir(version), 'ivf.npz')
+
+
+def _get_ann(base, version):
+    """
+    The version's persisted IVF index over ``base``; None until one has been
+    built. Training takes far longer than a request may, so it is left to
+    ``python -m server.build_ivf_index``: requests only load the file (again
+    when it is rebuilt) and catch it up on rows appended since.
+    """
+    path = ivf_path(version)
+    try:
+        built = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    with _index_lock:
+        ann, loaded = _anns.get(version, (None, None))
+        if ann is None or loaded != built:
+            ann = IVFIndex.load(path, base, nprobe=Config.IVF_NPROBE)
+            _anns[version] = (ann, built)
+        elif ann.base is not base:
+            ann.base = base
+            ann.sync()
+
+    return ann
+
+
+def get_geo_index():
+    """
+    Return this worker's GeoIndex of animal positions (owner's geocoded home
+    plus last sighting), picking up new registrations and sightings from the
+    database at most every GEO_INDEX_REFRESH seconds.
+    """
+    global _geo
+    now = time.monotonic()
+    if _geo is not None and now - _geo_state['refreshed'] < Config.GEO_INDEX_REFRESH:
+        return _geo
+
+    from ...models import db
+    from ...models.animal import Animal, Owner
+    from ..geocoder import geocode
+
+    with _index_lock:
+        if _geo is None:
+            _geo = GeoIndex()
+        elif now - _geo_state['refreshed'] < Config.GEO_INDEX_REFRESH:
+            return _geo
+
+        rows = (
+            db.session.query(Animal.id, Animal.animal_id, Animal.last_seen_lat, Animal.last_seen_lng,
+                             Animal.last_seen_at, Owner.location, Owner.latitude, Owner.longitude)
+            .join(Owner, Animal.owner_id == Owner.id)
+            .filter(db.or_(Animal.id > _geo_state['max_id'], Animal.last_seen_at > _geo_state['seen_since']))
+            .all()
+        )
+        for row in rows:
+            home = (row.latitude, row.longitude)
+            if home[0] is None:
+                # Owners created before geocoding existed
+                home = geocode(row.location) or (None, None)
+            _geo.update(row.animal_id, [home, (row.last_seen_lat, row.last_seen_lng)])
+            _geo_state['max_id'] = max(_geo_state['max_id'], row.id)
+            if row.last_seen_at is not None:
+                _geo_state['seen_since'] = max(_geo_state['seen_since'], row.last_seen_at)
+        _geo_state['refreshed'] = now
+    return _geo
+
+
+def record_sighting(animal, lat, lng):
+    """Remember where an animal was just verified so nearby searches find it first (caller commits)."""
+    animal.mark_seen(lat, lng)
+    if _geo is not None:
+        _geo.add_position(animal.animal_id, lat, lng)
+
+
+def _load_image(image):
+    """Accept a file path, encoded image bytes or a BGR numpy array; return the array or None."""
+    if isinstance(image, str):
+        return cv2.imread(image)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return decode_image(image, min_side=Config.DECODE_MIN_SIDE)
+    return image
+
+
+def detect_face(image, version=None):
+    """
+    Detect and align the face in one BGR image with a model version's
+    landmark predictor (default: the active version).
+    Falls back to the whole frame when no face is detected.
+    Returns a Detection (box, 68 landmarks, aligned RGB chip).
+    """
+    global _face_detector
+    import dlib
+
+    if _face_detector is None:
+        _face_detector = dlib.get_frontal_face_detector()
+
+    shape_predictor, _ = load_dlib_models(version)
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    faces = _face_detector(rgb, 1)
+    if faces:
+        face_rect = faces[0]
+    else:
+        face_rect = dlib.rectangle(0, 0, rgb.shape[1] - 1, rgb.shape[0] - 1)
+
+    shape = shape_predictor(rgb, face_rect)
+    landmarks = np.array([(p.x, p.y) for p in shape.parts()], dtype=np.int32)
+    chip = dlib.get_face_chip(rgb, shape, size=CHIP_SIZE, padding=CHIP_PADDING)
+    bbox = (face_rect.left(), face_rect.top(), face_rect.right(), face_rect.bottom())
+    return Detection(bbox, landmarks, np.asarray(chip, dtype=np.uint8))
+
+
+def embed_chip(chip, version=None):
+    """128-d descriptor of an aligned face chip using a model version's ResNet."""
+    _, face_rec_model = load_dlib_models(version)
+    return np.asarray(face_rec_model.compute_face_descriptor(chip), dtype=np.float32)
+
+
+def compute_embedding(image, version=None):
+    """Compute a 128-d descriptor for one BGR image (detect, align, embed)."""
+    return embed_chip(detect_face(image, version).chip, version)
+
+
+def _embed_stored(path, cache, version=None):
+    """
+    Embed a stored image file through the detection cache: a hit embeds the
+    cached chip without decoding the image; a miss detects and fills the cache.
+    Returns None if the file cannot be read.
+    """
+    try:
+        key = content_key(path)
+    except OSError:
+        return None
+
+    detection = cache.get(key)
+    if detection is None:
+        image = cv2.imread(path)
+        if image is None:
+            return None
+        detection = detect_face(image, version)
+        cache.put(key, detection)
+    return embed_chip(detection.chip, version)
+
+
+def compute_view_embeddings(images, version=None):
+    """
+    images: dict of view -> path, encoded bytes or BGR array
+    version: model version to embed with (default: the active one)
+    Returns (embeddings (n, 128), views) for the views that could be read.
+    Stored files (paths) go through the detection cache.
+    """
+    cache = get_detection_cache()
+    embeddings, views = [], []
+    for view in VIEWS:
+        source = images.get(view)
+        if isinstance(source, str) and cache is not None:
+            embedding = _embed_stored(source, cache, version)
+        else:
+            image = _load_image(source)
+            embedding = compute_embedding(image, version) if image is not None else None
+        if embedding is None:
+            continue
+        embeddings.append(embedding)
+        views.append(view)
+
+    if not embeddings:
+        return np.empty((0, 0), dtype=np.float32), []
+    return np.stack(embeddings), views
+
+
+def embed_views(images, version=None):
+    """
+    compute_view_embeddings, run on the recognition worker pool when one is
+    configured (RECOGNITION_WORKERS > 0) so the request thread only waits.
+    May raise RecognitionBusy / RecognitionTimeout.
+    """
+    version = version or active_version()
+    if Config.RECOGNITION_WORKERS > 0:
+        return get_pool(version).submit(compute_view_embeddings, images, version)
+    # Inline mode: load a pending version's models in the background, not on a request
+    preload_async(write_versions())
+    return compute_view_embeddings(images, version)
+
+
+def index_animal(animal_id, image_paths, index=None):
+    """
+    Embed a newly registered animal's views. They are appended to the shared
+    store (picked up by every worker on its next verify) unless an in-memory
+    index is given.
+
+    While a model upgrade is pending the animal is embedded with both the
+    active and the pending version, so the new store stays complete once the
+    backfill has finished. Only the active version can fail the call; an
+    animal missing from the pending store is filled in by the upgrade's
+    catch-up backfill and coverage check.
+    """
+    if index is not None:
+        embeddings, views = embed_views(image_paths)
+        if views:
+            index.add(animal_id, embeddings, views=views)
+        return views
+
+    active, *pending = write_versions()
+    embeddings, views = embed_views(image_paths, active)
+    if views:
+        get_store(active).append(animal_id, embeddings, views)
+        # Earlier "no match" answers may now match this animal
+        get_result_cache().invalidate_negatives()
+
+    for version in pending:
+        try:
+            pending_embeddings, pending_views = embed_views(image_paths, version)
+            if pending_views:
+                get_store(version).append(animal_id, pending_embeddings, pending_views)
+        except Exception as e:
+            logger.warning(f"Could not embed {animal_id} with pending model {version}: {e}")
+    return views
+
+
+def recognize_animal(candidate_image, known_embeddings_dict=None, index=None, location=None):
     """
-    Dummy animal recognizer using OpenCV only.
-    Currently, this is a placeholder that always returns None (no match).
+    Match the candidate against the registered gallery.
 
     Args:
-        candidate_image: image file path or BGR numpy array
-        known_embeddings_dict: dict mapping Animal ID -> embedding (optional)
+        candidate_image: image path, encoded bytes, BGR numpy array, or a dict of
+            view -> any of those
+        known_embeddings_dict: optional dict mapping Animal ID -> embedding(s);
+            when given, it is searched instead of the shared index
+        index: optional EmbeddingIndex to search
+        location: optional (lat, lng) of the photos; animals known to be
+            nearby are searched first (see match_embeddings)
 
     Returns:
-        None, meaning no match found.
-    """
-    # Load image if a path is provided
-    if isinstance(candidate_image, str):
-        candidate_image = cv2.imread(candidate_image)
-        if candidate_image is None:
-            return None  # Invalid image path
-
-    # Placeholder logic:
-    # In the future, you can compute embeddings or use template matching
-    # For now, always return None (no match)
-    return None
+        None if nothing is within the match threshold, otherwise a dict with
+        'animal_id', 'distance', and the 'animal' / 'owner' records.
+    """
+    # Read once so the query is embedded with the same model as the gallery it is matched against
+    version = active_version()
+    if known_embeddings_dict is not None:
+        index = EmbeddingIndex.from_dict(known_embeddings_dict, metric=Config.RECOGNITION_METRIC)
+    elif index is None:
+        index = get_index(version=version)
+
+    if len(index) == 0:
+        return None
+
+    # Retries of the same photo set are answered from the perceptual-hash cache
+    cache = cache_key = None
+    if known_embeddings_dict is None and isinstance(candidate_image, dict):
+        cache = get_result_cache()
+        cache_key = image_set_key(candidate_image)
+        if cache_key is not None:
+            # Distances from another model version are not comparable
+            cache_key = (version,) + cache_key
+        cached = cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            return _resolve(*cached) if cached[0] is not None else None
+
+    if isinstance(candidate_image, dict):
+        embeddings, views = embed_views(candidate_image, version)
+    else:
+        # A single unlabelled image is compared against every view
+        embeddings, _ = embed_views({'front': candidate_image}, version)
+        views = None
+
+    if embeddings.size == 0:
+        return None
+
+    geo = None
+    if location is not None and known_embeddings_dict is None and Config.GEO_SEARCH_RADII_KM:
+        geo = get_geo_index()
+
+    match = match_embeddings(index, embeddings, views, location=location, geo=geo)
+    if cache_key is not None:
+        cache.put(cache_key, *(match or (None, None)))
+    if match is None:
+        return None
+    return _resolve(*match)
+
+
+def _resolve(animal_id, distance):
+    """Attach the current Animal / Owner rows to a match."""
+    from ...models.animal import Animal
+
+    animal = Animal.query.filter_by(animal_id=animal_id).first()
+    return {
+        'animal_id': animal_id,
+        'distance': distance,
+        'animal': animal,
+        'owner': animal.owner if animal else None,
+    }
+
+
+def match_embeddings(index, embeddings, views=None, location=None, geo=None):
+    """
+    Return (animal_id, fused_distance) for the best match within the threshold,
+    or None.
+
+    With a location and a GeoIndex, only animals within each of
+    GEO_SEARCH_RADII_KM of the location are searched, widening until one
+    matches; the whole gallery is searched last (or as soon as a radius
+    covers more than GEO_MAX_CANDIDATE_FRACTION of it).
+    """
+    if location is not None and geo is not None:
+        base = getattr(index, 'base', index)
+        searched = 0
+        for radius in Config.GEO_SEARCH_RADII_KM:
+            ordinals = base.ordinals_of(geo.candidates(location[0], location[1], radius))
+            if len(ordinals) > Config.GEO_MAX_CANDIDATE_FRACTION * len(base.animal_ids):
+                break
+            if len(ordinals) == searched:
+                continue  # ring added nobody new
+            searched = len(ordinals)
+            match = _match_in(base.subset(base.rows_for(ordinals)), embeddings, views)
+            if match is not None:
+                return match
+
+    return _match_in(index, embeddings, views)
+
+
+def _match_in(index, embeddings, views):
+    """
+    Labelled views go through the shortlist/early-exit fusion engine;
+    unlabelled queries are ranked against every view.
+    """
+    threshold = Config.RECOGNITION_MATCH_THRESHOLD
+
+    if views:
+        result = fused_match(
+            index, embeddings, views, threshold,
+            shortlist=Config.RECOGNITION_SHORTLIST,
+            accept_distance=Config.RECOGNITION_EARLY_ACCEPT,
+            accept_margin=Config.RECOGNITION_ACCEPT_MARGIN,
+        )
+        if result is None or result['animal_id'] is None:
+            return None
+        return result['animal_id'], result['distance']
+
+    ranked = index.match(embeddings, k=Config.RECOGNITION_TOP_K)
+    if not ranked or ranked[0][1] > threshold:
+        return None
+    return ranked[0]
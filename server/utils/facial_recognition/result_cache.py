@@ -0,0 +1,265 @@
+# server/utils/facial_recognition/result_cache.py
+
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from .embedding_index import VIEWS
+
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash of a BGR/grayscale image, encoded image bytes or a file path.
+
+    Encoded images are decoded at 1/8 resolution in grayscale, which is all
+    a 9x8 gradient hash needs. Returns a 64-bit int, or None if undecodable.
+    """
+    if isinstance(image, str):
+        image = cv2.imread(image, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        image = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+
+    if image is None:
+        return None
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def image_set_key(images):
+    """Cache key for a set of views: the dHash of each view in canonical order."""
+    key = []
+    for view in VIEWS:
+        if view not in images:
+            continue
+        digest = dhash(images[view])
+        if digest is None:
+            return None
+        key.append((view, digest))
+    return tuple(key) or None
+
+
+class RecognitionResultCache:
+    """
+    LRU + TTL cache of recognition outcomes keyed by perceptual hashes.
+
+    Stores only (animal_id, distance) -- animal_id None for "no match" -- so
+    the caller still loads fresh Animal/Owner rows. Entries for an animal are
+    dropped when its ownership or slaughter status changes; "no match" entries
+    are dropped whenever a new animal is registered.
+
+    When ``invalidation_log`` is set, invalidations are also appended to that
+    file and replayed by every other worker's cache on its next lookup. Once
+    the log passes ``max_log_bytes`` the writer swaps in an empty file; a
+    worker that sees the swap clears its whole cache, since it may have
+    missed the last lines of the old log.
+    """
+
+    _NEGATIVE = '\x00no-match'
+
+    def __init__(self, maxsize=10000, ttl=300.0, invalidation_log=None, max_log_bytes=1024 * 1024):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.invalidation_log = invalidation_log
+        self.max_log_bytes = max_log_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, animal_id, distance)
+        self._by_animal = {}           # animal_id -> set of keys
+        self._lock = threading.Lock()
+        self._log_inode, self._log_identity, self._log_offset = self._start_log()
+
+    def get(self, key):
+        """Return (animal_id, distance) or None on a miss."""
+        self._replay_log()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, animal_id, distance=None):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, animal_id, distance)
+            self._by_animal.setdefault(animal_id or self._NEGATIVE, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_animal(self, animal_id):
+        """Drop cached matches for animal_id here and (via the log) in other workers."""
+        self.invalidate_animals([animal_id])
+
+    def invalidate_animals(self, animal_ids):
+        """Batch form of invalidate_animal: one log write for the whole set."""
+        animal_ids = set(animal_ids)
+        for animal_id in animal_ids:
+            self._invalidate_local(animal_id)
+        self._append_log(animal_ids)
+
+    def invalidate_negatives(self):
+        """Drop cached "no match" results, e.g. after a new registration."""
+        self.invalidate_animal(self._NEGATIVE)
+
+    def publish_negatives_invalidation(self):
+        """
+        Only append the "no match" invalidation to the shared log, for the web
+        workers to replay. For processes that add animals but serve no
+        verifies themselves (e.g. the backfill CLI), whose own cache is empty.
+        """
+        self._append_log({self._NEGATIVE})
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_animal.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ---------- Internals ----------
+
+    def _drop(self, key):
+        _, animal_id, _ = self._entries.pop(key)
+        keys = self._by_animal.get(animal_id or self._NEGATIVE)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_animal[animal_id or self._NEGATIVE]
+
+    def _invalidate_local(self, animal_id):
+        with self._lock:
+            for key in list(self._by_animal.get(animal_id, ())):
+                self._drop(key)
+
+    def _log_stat(self):
+        """(inode, size) of the invalidation log, (None, 0) if there is none."""
+        if not self.invalidation_log:
+            return None, 0
+        try:
+            st = os.stat(self.invalidation_log)
+        except OSError:
+            return None, 0
+        return st.st_ino, st.st_size
+
+    def _open_log(self):
+        """
+        The log opened for reading with its identity (inode, header line) and
+        size, or None. Identity includes the header so a rotated log that
+        happens to reuse an old inode number is still told apart.
+        """
+        if not self.invalidation_log:
+            return None
+        try:
+            f = open(self.invalidation_log, 'rb')
+        except OSError:
+            return None
+        st = os.fstat(f.fileno())
+        header = f.readline(64)
+        return f, (st.st_ino, header if header.startswith(b'#') else b''), st.st_size
+
+    def _start_log(self):
+        """Skip whatever the log already holds; this cache is empty anyway."""
+        opened = self._open_log()
+        if opened is None:
+            return None, None, 0
+        f, identity, size = opened
+        f.close()
+        return identity[0], identity, size
+
+    def _append_log(self, animal_ids):
+        if not self.invalidation_log or not animal_ids:
+            return
+        os.makedirs(os.path.dirname(self.invalidation_log), exist_ok=True)
+        lines = ''.join(animal_id.replace('\n', ' ') + '\n' for animal_id in animal_ids)
+        for _ in range(3):
+            # A single O_APPEND write keeps lines from different workers intact
+            with open(self.invalidation_log, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                written = os.fstat(f.fileno())
+            if self._log_stat()[0] == written.st_ino:
+                break
+            # Rotated while writing: workers already on the new log would miss these lines
+        if written.st_size > self.max_log_bytes:
+            self._rotate_log()
+
+    def _rotate_log(self):
+        """Swap in an empty log (atomic rename, so readers see one or the other)."""
+        directory = os.path.dirname(self.invalidation_log)
+        fd, path = tempfile.mkstemp(dir=directory, prefix='.cache_invalidations.')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(f"#{secrets.token_hex(8)}\n")
+        os.replace(path, self.invalidation_log)
+
+    def _replay_log(self):
+        """Apply invalidations written by other workers since the last lookup."""
+        inode, size = self._log_stat()
+        if inode is None or (inode == self._log_inode and size == self._log_offset):
+            return
+        opened = self._open_log()
+        if opened is None:
+            return
+        f, identity, size = opened
+        with f:
+            if self._log_identity is None:
+                # There was no log when we last looked, so all of it is new
+                self._log_offset = 0
+            elif identity != self._log_identity or size < self._log_offset:
+                # Rotated: lines added to the old log after our last read never reach us
+                self.clear()
+                self._log_inode, self._log_identity, self._log_offset = identity[0], identity, size
+                return
+            self._log_inode, self._log_identity = identity[0], identity
+            f.seek(self._log_offset)
+            chunk = f.read(size - self._log_offset)
+        end = chunk.rfind(b'\n') + 1
+        self._log_offset += end
+        for animal_id in set(chunk[:end].decode('utf-8').splitlines()):
+            if not animal_id.startswith('#'):
+                self._invalidate_local(animal_id)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return this worker's result cache."""
+    global _cache
+    if _cache is None:
+        from ...config import Config
+
+        with _cache_lock:
+            if _cache is None:
+                _cache = RecognitionResultCache(
+                    maxsize=Config.RESULT_CACHE_SIZE,
+                    ttl=Config.RESULT_CACHE_TTL,
+                    invalidation_log=os.path.join(Config.EMBEDDING_STORE_DIR, 'cache_invalidations.log'),
+                )
+    return _cache
+
+
+def invalidate_animal(animal_id):
+    """Forget cached verify results for an animal whose status changed."""
+    get_result_cache().invalidate_animal(animal_id)
+
+
+def invalidate_animals(animal_ids):
+    """Batch form of invalidate_animal for offline sync uploads."""
+    get_result_cache().invalidate_animals(animal_ids)
@@ -0,0 +1,167 @@
+# server/utils/facial_recognition/worker_pool.py
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from .model_loader import load_dlib_models
+from .model_versions import write_versions
+
+
+class RecognitionBusy(Exception):
+    """Raised when the recognition queue is full; the caller should retry later."""
+
+
+class RecognitionTimeout(Exception):
+    """Raised when a recognition job does not finish within the allowed time."""
+
+
+def init_recognition_worker(versions=None):
+    """Runs once in every worker process: pay the model load cost up front."""
+    for version in versions or (None,):
+        load_dlib_models(version)
+
+
+def _ready():
+    return os.getpid()
+
+
+class RecognitionPool:
+    """
+    Dedicated process pool for CPU-heavy recognition work.
+
+    Each worker process loads the dlib models exactly once (in its
+    initializer). Request handlers submit jobs and wait with a timeout; at
+    most ``max_pending`` jobs may be queued or running, beyond which submit()
+    fails fast with RecognitionBusy instead of piling up requests.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, timeout=10.0, initializer=init_recognition_worker,
+                 versions=None):
+        self.versions = tuple(versions or ())
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.max_pending = max_pending or self.max_workers * 2
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # spawn: forking a threaded web worker can deadlock on inherited locks
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=initializer,
+            initargs=(self.versions,) if initializer is init_recognition_worker else (),
+        )
+
+    def submit(self, fn, *args, timeout=None):
+        """
+        Run fn(*args) in a worker and return its result.
+
+        Raises RecognitionBusy if the queue is full and RecognitionTimeout if
+        the job takes longer than ``timeout`` seconds.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise RecognitionBusy("Recognition queue is full")
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        # The slot is freed when the job really finishes, not when the caller
+        # gives up, so abandoned jobs still count against the bound.
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise RecognitionTimeout("Recognition timed out")
+
+    def warm_up(self):
+        """Start every worker process and wait until each has run its initializer (loaded its models)."""
+        futures = [self._executor.submit(_ready) for _ in range(self.max_workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self, wait=False, cancel_futures=True):
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_swapped = threading.Condition(_pool_lock)  # notified when a replacement is in place or given up
+_replacing = None  # versions a replacement pool is being warmed up for
+
+
+def _new_pool(versions):
+    from ...config import Config
+
+    return RecognitionPool(
+        max_workers=Config.RECOGNITION_WORKERS,
+        max_pending=Config.RECOGNITION_MAX_PENDING,
+        timeout=Config.RECOGNITION_TIMEOUT,
+        versions=versions,
+    )
+
+
+def get_pool(version=None):
+    """
+    Return this web worker's recognition pool, starting it on first use.
+
+    Worker processes preload every model version in use (active + pending).
+    When that set changes, a replacement pool is started and warmed up in
+    the background; requests keep using the current pool until the new one
+    is ready, then the two are swapped and the old pool drains its jobs.
+
+    A job for ``version`` must not reach workers that never preloaded it
+    (e.g. just after a rollback to the previous model), or they would load
+    the model mid-request. If the current pool lacks it, this waits up to
+    the pool's timeout for the replacement and raises RecognitionBusy if
+    it is not ready by then.
+    """
+    global _pool
+    versions = tuple(write_versions())
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _new_pool(versions)
+                atexit.register(lambda: _pool.shutdown())
+    elif _pool.versions != versions:
+        _replace_pool(versions)
+
+    if version is not None and version not in _pool.versions:
+        with _pool_swapped:
+            _pool_swapped.wait_for(lambda: version in _pool.versions or _replacing is None, timeout=_pool.timeout)
+            pool = _pool
+        if version not in pool.versions:
+            raise RecognitionBusy(f"Recognition models for {version} are still loading")
+        return pool
+    return _pool
+
+
+def _replace_pool(versions):
+    global _replacing
+    with _pool_lock:
+        if _replacing == versions:
+            return
+        _replacing = versions
+
+    def build():
+        global _pool, _replacing
+        pool = _new_pool(versions)
+        try:
+            pool.warm_up()
+        except Exception:
+            pool.shutdown()
+            with _pool_swapped:
+                _replacing = None  # retried on a later request
+                _pool_swapped.notify_all()
+            return
+        with _pool_swapped:
+            old, _pool, _replacing = _pool, pool, None
+            _pool_swapped.notify_all()
+        old.shutdown(wait=False, cancel_futures=False)
+
+    threading.Thread(target=build, daemon=True, name='recognition-pool-warmup').start()
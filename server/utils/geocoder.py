@@ -0,0 +1,50 @@
+# server/utils/geocoder.py
+
+import json
+import os
+import threading
+
+from ..config import Config
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def _normalise(place):
+    return ' '.join(place.lower().replace(',', ' ').split())
+
+
+def load_gazetteer(path=None):
+    """
+    Read a gazetteer JSON file mapping place names to [latitude, longitude].
+    Names are matched case-insensitively, ignoring commas and extra spaces.
+    """
+    path = path or Config.GAZETTEER_PATH
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return {_normalise(name): (float(lat), float(lng)) for name, (lat, lng) in json.load(f).items()}
+
+
+def geocode(place, gazetteer=None):
+    """
+    Resolve a free-text location such as Owner.location to (lat, lng).
+
+    Tries the full string, then each comma-separated part (village, ward,
+    county...). Returns None when the place is unknown.
+    """
+    global _gazetteer
+    if not place:
+        return None
+    if gazetteer is None:
+        if _gazetteer is None:
+            with _gazetteer_lock:
+                if _gazetteer is None:
+                    _gazetteer = load_gazetteer()
+        gazetteer = _gazetteer
+
+    for name in [place] + place.split(','):
+        coords = gazetteer.get(_normalise(name))
+        if coords is not None:
+            return coords
+    return None
@@ -1,14 +1,155 @@
 # utils/id_generator.py
 
-import random
-import string
+import os
+import threading
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from ..config import Config
+
+# Shortest number part; longer numbers simply use more digits
+MIN_DIGITS = 5
+# Coprime with 10, so multiplying modulo 10**n permutes the n-digit numbers
+_SCRAMBLE_MULTIPLIER = 7654321
+
+
+def luhn_digit(number):
+    """Luhn check digit for a string of digits."""
+    total = 0
+    for i, ch in enumerate(reversed(number)):
+        d = int(ch)
+        if i % 2 == 0:
+            d = d * 2 - 9 if d > 4 else d * 2
+        total += d
+    return str(-total % 10)
+
+
+def has_valid_check_digit(identifier):
+    """True if an ID minted with ID_CHECK_DIGIT has an intact last digit."""
+    digits = ''.join(ch for ch in identifier if ch.isdigit())
+    return len(digits) > 1 and luhn_digit(digits[:-1]) == digits[-1]
+
+
+def format_id(prefix, value):
+    """
+    Render sequence number ``value`` as prefix + at least MIN_DIGITS digits.
+    Distinct values always give distinct IDs: scrambling permutes numbers of
+    the same width, and the check digit is a function of the rest.
+    """
+    digits = max(MIN_DIGITS, len(str(value)))
+    if Config.ID_SCRAMBLE:
+        value = value * _SCRAMBLE_MULTIPLIER % 10 ** digits
+    number = f"{value:0{digits}d}"
+    if Config.ID_CHECK_DIGIT:
+        number += luhn_digit(number)
+    return prefix + number
+
+
+class IdAllocator:
+    """
+    Hands out sequence numbers per prefix from blocks reserved in the
+    id_counters table. A reservation is one short transaction on its own
+    connection (an atomic UPDATE ... SET next_value = next_value + block),
+    so workers never hand out the same number and minting an ID only
+    touches the database once per ``block_size`` IDs. Numbers left in a
+    block when a worker exits are skipped.
+
+    Call outside an open write transaction: on SQLite the reservation waits
+    for the write lock.
+    """
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size or Config.ID_BLOCK_SIZE
+        self._blocks = {}  # prefix -> (next value, end of block)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def next_value(self, prefix, column=None):
+        """
+        Next sequence number for ``prefix``. ``column`` (e.g. Animal.animal_id)
+        holds IDs minted before counters existed; a new counter starts above
+        all of them.
+        """
+        with self._lock:
+            if os.getpid() != self._pid:
+                # Forked after reserving: the parent may use the same blocks
+                self._blocks, self._pid = {}, os.getpid()
+            start, end = self._blocks.get(prefix, (0, 0))
+            if start >= end:
+                start, end = self._reserve(prefix, column)
+            self._blocks[prefix] = (start + 1, end)
+            return start
+
+    def next_id(self, prefix, column=None):
+        return format_id(prefix, self.next_value(prefix, column))
+
+    def _reserve(self, prefix, column):
+        from ..models import db
+        from ..models.id_counter import IdCounter
+
+        counters = IdCounter.__table__
+        for _ in range(3):
+            try:
+                with db.engine.begin() as conn:
+                    updated = conn.execute(
+                        counters.update()
+                        .where(counters.c.prefix == prefix)
+                        .values(next_value=counters.c.next_value + self.block_size)
+                    )
+                    if updated.rowcount:
+                        end = conn.execute(
+                            select(counters.c.next_value).where(counters.c.prefix == prefix)
+                        ).scalar_one()
+                        return end - self.block_size, end
+
+                    start = _first_value(conn, prefix, column)
+                    conn.execute(counters.insert().values(prefix=prefix, next_value=start + self.block_size))
+                    return start, start + self.block_size
+            except IntegrityError:
+                continue  # another worker created the counter first; take a block from it
+        raise RuntimeError(f"Could not reserve IDs for prefix {prefix}")
+
+
+def _first_value(conn, prefix, column):
+    """
+    1 for a new prefix. Where random or older IDs already use the prefix,
+    the first number with more digits than any of them, so new IDs are
+    longer and cannot coincide with an existing one.
+    """
+    if column is None:
+        return 1
+    longest = conn.execute(
+        select(func.max(func.length(column))).where(column.like(f"{prefix}%"))
+    ).scalar()
+    if not longest:
+        return 1
+    return 10 ** (longest - len(prefix))
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    """Return this worker's ID allocator."""
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = IdAllocator()
+    return _allocator
+
 
 def generate_animal_id(location_code='NE'):
-    """Generate a unique Animal ID like A-NE12345"""
-    unique_number = ''.join(random.choices(string.digits, k=5))
-    return f"A-{location_code}{unique_number}"
+    """Generate a unique Animal ID like A-NE00042"""
+    from ..models.animal import Animal
+
+    return get_allocator().next_id(f"A-{location_code}", Animal.animal_id)
+
 
 def generate_owner_id(location_code='NE'):
-    """Generate a unique Owner ID like O-NE67890"""
-    unique_number = ''.join(random.choices(string.digits, k=5))
-    return f"O-{location_code}{unique_number}"
+    """Generate a unique Owner ID like O-NE00042"""
+    from ..models.animal import Owner
+
+    return get_allocator().next_id(f"O-{location_code}", Owner.owner_id)
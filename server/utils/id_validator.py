@@ -0,0 +1,176 @@
+# server/utils/id_validator.py
+
+import hashlib
+import math
+import threading
+import time
+
+import numpy as np
+
+from ..config import Config
+
+# Bound parameters per IN (...) query, under SQLite's historic 999-variable limit
+IN_CHUNK = 500
+
+
+class BloomFilter:
+    """
+    Bloom filter over strings: no false negatives, about ``error_rate`` false
+    positives at ``capacity`` items. Each key is hashed once (BLAKE2b) and the
+    k bit positions derived by double hashing, vectorised over a whole batch.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.01):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.bits = max(64, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self._array = np.zeros((self.bits + 7) // 8, dtype=np.uint8)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def full(self):
+        return self._count >= self.capacity
+
+    def _positions(self, keys):
+        digests = b''.join(hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest() for key in keys)
+        pairs = np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            return (pairs[:, :1] + steps[None, :] * pairs[:, 1:]) % np.uint64(self.bits)
+
+    def add(self, keys):
+        keys = list(keys)
+        if not keys:
+            return
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(self._array, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self._count += len(keys)
+
+    def might_contain(self, keys):
+        """Boolean array, one entry per key: False means definitely not added."""
+        keys = list(keys)
+        if not keys:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        bits = (self._array[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+
+class AnimalIdFilter:
+    """
+    Registered animal IDs, as a Bloom filter kept in step with the animals
+    table: rows with an id above the last one seen are loaded at most every
+    ANIMAL_FILTER_REFRESH seconds, and /api/register adds its own animals
+    straight away. When the filter fills up it is rebuilt at twice the size.
+
+    Ids can commit out of order (concurrent transactions drawing from one
+    sequence), so a row may appear below the watermark after it has moved
+    on. Holes left below the watermark are therefore looked up again on
+    every refresh for ANIMAL_FILTER_GAP_WINDOW seconds; ids that are still
+    missing after that were rolled back or deleted.
+    """
+
+    # Holes wider than this (e.g. a sequence jumping ahead) are not tracked
+    MAX_GAPS = 10000
+
+    def __init__(self, capacity=None, refresh=None, gap_window=None):
+        self.capacity = capacity or Config.ANIMAL_FILTER_CAPACITY
+        self.refresh_interval = Config.ANIMAL_FILTER_REFRESH if refresh is None else refresh
+        self.gap_window = Config.ANIMAL_FILTER_GAP_WINDOW if gap_window is None else gap_window
+        self.bloom = BloomFilter(self.capacity)
+        self.max_id = 0
+        self.gaps = {}  # Animal.id below max_id not loaded yet -> when the hole was seen
+        self.refreshed = None
+        self._lock = threading.Lock()
+
+    def add(self, animal_ids):
+        with self._lock:
+            self.bloom.add(animal_ids)
+
+    def refresh(self, force=False):
+        from ..models.animal import Animal
+
+        now = time.monotonic()
+        if not force and self.refreshed is not None and now - self.refreshed < self.refresh_interval:
+            return
+        columns = Animal.query.with_entities(Animal.id, Animal.animal_id)
+        with self._lock:
+            rows = columns.filter(Animal.id > self.max_id).order_by(Animal.id).all()
+            if self.bloom.full or len(self.bloom) + len(rows) > self.bloom.capacity:
+                self.capacity = max(self.capacity, len(self.bloom) + len(rows)) * 2
+                self.bloom = BloomFilter(self.capacity)
+                rows = columns.filter(Animal.id <= self.max_id).order_by(Animal.id).all() + rows
+
+            self.gaps = {i: seen for i, seen in self.gaps.items() if now - seen < self.gap_window}
+            late = sorted(self.gaps)
+            for start in range(0, len(late), IN_CHUNK):
+                rows += columns.filter(Animal.id.in_(late[start:start + IN_CHUNK])).all()
+            for row in rows:
+                self.gaps.pop(row.id, None)
+
+            new_ids = [row.id for row in rows if row.id > self.max_id]
+            if new_ids:
+                top = max(new_ids)
+                if top - self.max_id - len(new_ids) <= self.MAX_GAPS:
+                    loaded = set(new_ids)
+                    self.gaps.update((i, now) for i in range(self.max_id + 1, top) if i not in loaded)
+                self.max_id = top
+
+            self.bloom.add(row.animal_id for row in rows)
+            self.refreshed = now
+
+    def might_contain(self, animal_ids):
+        self.refresh()
+        return self.bloom.might_contain(animal_ids)
+
+
+_filter = None
+_filter_lock = threading.Lock()
+
+
+def get_animal_filter():
+    """Return this worker's AnimalIdFilter."""
+    global _filter
+    if _filter is None:
+        with _filter_lock:
+            if _filter is None:
+                _filter = AnimalIdFilter()
+    return _filter
+
+
+def remember_animal(animal_id):
+    """Add a just-registered animal to this worker's filter (call after the commit)."""
+    get_animal_filter().add([animal_id])
+
+
+def animals_exist(animal_ids):
+    """
+    Resolve a batch of animal IDs in one go; returns the set of those that are registered.
+
+    IDs the in-memory filter rules out never reach the database; the rest are
+    confirmed with chunked ``animal_id IN (...)`` queries. An animal registered
+    by another worker is seen once this worker's filter next refreshes.
+    """
+    from ..models.animal import Animal
+
+    candidates = sorted({a for a in animal_ids if isinstance(a, str) and a})
+    if not candidates:
+        return set()
+    candidates = [a for a, maybe in zip(candidates, get_animal_filter().might_contain(candidates)) if maybe]
+
+    found = set()
+    for start in range(0, len(candidates), IN_CHUNK):
+        chunk = candidates[start:start + IN_CHUNK]
+        found.update(row.animal_id for row in
+                     Animal.query.with_entities(Animal.animal_id).filter(Animal.animal_id.in_(chunk)))
+    return found
+
+
+def animal_exists(animal_id):
+    """True if animal_id is registered (see animals_exist)."""
+    return animal_id in animals_exist([animal_id])
@@ -1,10 +1,142 @@
 # utils/image_processor.py
 
+import hashlib
 import os
-from werkzeug.utils import secure_filename
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import cv2
+import numpy as np
+from flask import Request, current_app
+from PIL import Image
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# Reduced-resolution decode flags by downscale factor (JPEG decodes these via DCT scaling)
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# Background writer for optional persistence of verify uploads
+_persist_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-persist')
+
+
+class InMemoryUploadRequest(Request):
+    """
+    Request class that keeps multipart file parts in memory instead of
+    spooling anything over 500KB to a temporary file. Pair it with
+    MAX_CONTENT_LENGTH so a single request cannot exhaust memory.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BytesIO()
+
+    @property
+    def max_content_length(self):
+        """MAX_CONTENT_LENGTH, except for views marked with unbounded_upload."""
+        if current_app and self.endpoint:
+            view = current_app.view_functions.get(self.endpoint)
+            if getattr(view, 'unbounded_upload', False):
+                return None
+        return super().max_content_length
+
+
+def unbounded_upload(view):
+    """
+    Exempt a view from MAX_CONTENT_LENGTH (needs InMemoryUploadRequest).
+    Only for views that read request.stream incrementally and never buffer
+    the whole body, e.g. the NDJSON offline sync routes.
+    """
+    view.unbounded_upload = True
+    return view
+
+
+def read_upload(file):
+    """Return the raw bytes of an uploaded FileStorage without touching disk."""
+    file.stream.seek(0)
+    return file.stream.read()
+
+
+def decode_image(data, min_side=480):
+    """
+    Decode encoded image bytes straight from memory with cv2.imdecode.
+
+    The header is inspected first so the largest reduced-resolution decode
+    that keeps the shorter side >= min_side is used; the recognition model
+    only needs a 160x160 crop, so full-resolution decoding is wasted work.
+
+    Returns a BGR numpy array, or None if the data cannot be decoded.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    flag = cv2.IMREAD_COLOR
+
+    try:
+        with Image.open(BytesIO(data)) as header:
+            shorter = min(header.size)
+        for factor, reduced_flag in _REDUCED_FLAGS:
+            if shorter // factor >= min_side:
+                flag = reduced_flag
+                break
+    except Exception:
+        pass  # unknown header: let OpenCV try a full decode
+
+    return cv2.imdecode(buffer, flag)
+
+
+def blob_extension(data):
+    """
+    File extension for image bytes, from the format in their header (jpg when
+    unrecognised). It depends only on the bytes, so the same photo uploaded as
+    .jpg, .jpeg or .JPG still maps to a single blob.
+    """
+    try:
+        with Image.open(BytesIO(data)) as header:
+            image_format = header.format
+    except Exception:
+        return 'jpg'
+    return 'jpg' if image_format in (None, 'JPEG') else image_format.lower()
+
+
+def blob_path(upload_folder, digest, ext):
+    """Two-level sharded location of a blob: <folder>/ab/cd/abcd....<ext>"""
+    return os.path.join(upload_folder, digest[:2], digest[2:4], f"{digest}.{ext}")
+
+
+def blob_hash(path):
+    """Recover the content hash from a blob path."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def store_blob(data, upload_folder):
+    """
+    Store bytes under their SHA-256 in a sharded directory tree.
+
+    Identical uploads map to the same file (the extension comes from the
+    decoded format, not the upload's name), so a re-upload costs no extra
+    disk; writes go through a temp file + rename so readers never see a
+    partial blob. Returns (digest, path).
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(upload_folder, digest, blob_extension(data))
+    if os.path.exists(path):
+        return digest, path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return digest, path
+
+
+def persist_upload_async(data, upload_folder):
+    """Store upload bytes as a blob on a background thread; returns a Future of (digest, path)."""
+    return _persist_executor.submit(store_blob, data, upload_folder)
+
+
 def allowed_file(filename):
     """Check if the file has an allowed image extension."""
     return '.' in filename and \
@@ -12,32 +144,27 @@ def allowed_file(filename):
 
 def save_images(files, animal_id, upload_folder):
     """
-    Save the uploaded animal images with consistent filenames.
+    Save the uploaded animal images as content-addressed blobs.
     
     Expected keys in files: 'front', 'back', 'left', 'right'
     
-    Returns dict with saved file paths:
+    Returns dict with saved file paths (the file name is the SHA-256 of its
+    contents, sharded two levels deep):
     {
-      'front': 'uploads/A-NE12345_front.jpg',
-      'back': 'uploads/A-NE12345_back.jpg',
+      'front': 'uploads/9f/86/9f86d08....jpg',
+      'back': 'uploads/2c/26/2c26b46....jpg',
       ...
     }
+    Use blob_hash(path) to get the hash for the animal_images index.
     """
 
     saved_paths = {}
     views = ['front', 'back', 'left', 'right']
 
-    if not os.path.exists(upload_folder):
-        os.makedirs(upload_folder)
-
     for view in views:
         file = files.get(view)
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            ext = filename.rsplit('.', 1)[1].lower()
-            new_filename = f"{animal_id}_{view}.{ext}"
-            filepath = os.path.join(upload_folder, new_filename)
-            file.save(filepath)
+            _, filepath = store_blob(read_upload(file), upload_folder)
             saved_paths[view] = filepath
         else:
             # You can handle missing files or invalid files here
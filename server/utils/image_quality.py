@@ -0,0 +1,92 @@
+# server/utils/image_quality.py
+
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from ..config import Config
+
+# Sharpness is measured at a fixed width so the threshold does not depend on the camera
+ANALYSIS_WIDTH = 320
+
+_REDUCED_GRAY = ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                 (2, cv2.IMREAD_REDUCED_GRAYSCALE_2))
+
+
+def _decode_small_gray(data, width):
+    """Cheapest reduced grayscale decode that is still at least ``width`` wide, scaled to ``width``."""
+    flag = cv2.IMREAD_GRAYSCALE
+    for factor, reduced_flag in _REDUCED_GRAY:
+        if width // factor >= ANALYSIS_WIDTH:
+            flag = reduced_flag
+            break
+    gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if gray is None:
+        return None
+    height = max(1, round(gray.shape[0] * ANALYSIS_WIDTH / gray.shape[1]))
+    return cv2.resize(gray, (ANALYSIS_WIDTH, height), interpolation=cv2.INTER_AREA)
+
+
+def assess_image(data):
+    """
+    Score one encoded photo for recognition.
+
+    Checks the original resolution (from the header, no decode), then on a
+    small grayscale decode: sharpness as the variance of the Laplacian, and
+    exposure from the brightness histogram (mean level and the share of
+    clipped black / white pixels).
+
+    Returns a dict with 'ok', 'reasons' (human-readable, empty when ok) and
+    the measured 'width', 'height', 'sharpness', 'brightness' and 'clipped'.
+    """
+    report = {'ok': False, 'reasons': [], 'width': None, 'height': None,
+              'sharpness': None, 'brightness': None, 'clipped': None}
+    try:
+        with Image.open(BytesIO(data)) as header:
+            width, height = header.size
+    except Exception:
+        report['reasons'].append('not a readable image')
+        return report
+    report['width'], report['height'] = width, height
+
+    if min(width, height) < Config.QUALITY_MIN_SIDE:
+        report['reasons'].append(
+            f'resolution too low ({width}x{height}, need at least {Config.QUALITY_MIN_SIDE}px on the short side)')
+
+    gray = _decode_small_gray(data, width)
+    if gray is None:
+        report['reasons'].append('not a readable image')
+        return report
+
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+    histogram = np.bincount(gray.ravel(), minlength=256)
+    brightness = float(histogram @ np.arange(256) / gray.size)
+    clipped = float((histogram[:16].sum() + histogram[240:].sum()) / gray.size)
+    report.update(sharpness=sharpness, brightness=brightness, clipped=clipped)
+
+    if sharpness < Config.QUALITY_MIN_SHARPNESS:
+        report['reasons'].append('too blurry')
+    if brightness < Config.QUALITY_MIN_BRIGHTNESS:
+        report['reasons'].append('too dark')
+    elif brightness > Config.QUALITY_MAX_BRIGHTNESS:
+        report['reasons'].append('too bright')
+    elif clipped > Config.QUALITY_MAX_CLIPPED:
+        report['reasons'].append('badly exposed (large areas pure black or white)')
+
+    report['ok'] = not report['reasons']
+    return report
+
+
+def quality_failures(images):
+    """
+    images: dict of view -> encoded bytes
+    Returns {view: [reasons]} for the views that fail the gate (empty when all pass).
+    """
+    failures = {}
+    for view, data in images.items():
+        report = assess_image(data)
+        if not report['ok']:
+            failures[view] = report['reasons']
+    return failures
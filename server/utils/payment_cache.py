@@ -0,0 +1,156 @@
+# server/utils/payment_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from sqlalchemy import event
+
+from ..config import Config
+from ..models.engine import RoutingSession
+from ..models.payment import Payment
+
+
+class PaymentClearanceCache:
+    """
+    LRU + TTL cache of PaymentGuard.has_paid answers, per animal and action type.
+
+    "Paid" answers live for ``ttl`` seconds. "Not paid" answers live only for
+    ``negative_ttl``: within this worker they are dropped as soon as a
+    successful payment for the animal is committed, but other workers only
+    notice when the entry expires.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300.0, negative_ttl=5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # animal_id -> {action_type: (expires_at, paid)}
+        self._lock = threading.Lock()
+
+    def get(self, animal_id, action_type):
+        """Return the cached True / False, or None on a miss."""
+        with self._lock:
+            actions = self._entries.get(animal_id)
+            entry = actions.get(action_type) if actions else None
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del actions[action_type]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(animal_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, animal_id, action_type, paid):
+        expires_at = time.monotonic() + (self.ttl if paid else self.negative_ttl)
+        with self._lock:
+            self._entries.setdefault(animal_id, {})[action_type] = (expires_at, paid)
+            self._entries.move_to_end(animal_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, animal_id, action_type=None):
+        """Forget one action type's answer for an animal, or all of them (action_type None)."""
+        with self._lock:
+            if action_type is None:
+                self._entries.pop(animal_id, None)
+            elif animal_id in self._entries:
+                self._entries[animal_id].pop(action_type, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'animals': len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_clearance_cache():
+    """Return this worker's payment clearance cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PaymentClearanceCache(
+                    maxsize=Config.PAYMENT_CACHE_SIZE,
+                    ttl=Config.PAYMENT_CACHE_TTL,
+                    negative_ttl=Config.PAYMENT_CACHE_NEGATIVE_TTL,
+                )
+    return _cache
+
+
+def paid_animals(animal_ids, action_type):
+    """
+    Batch form of PaymentGuard.has_paid: the subset of ``animal_ids`` with a
+    successful ``action_type`` payment. Cached answers are reused and the
+    rest resolved with chunked IN queries, then cached.
+    """
+    from .id_validator import IN_CHUNK
+
+    cache = get_clearance_cache()
+    paid, unknown = set(), []
+    for animal_id in set(animal_ids):
+        answer = cache.get(animal_id, action_type)
+        if answer is None:
+            unknown.append(animal_id)
+        elif answer:
+            paid.add(animal_id)
+
+    unknown.sort()
+    for start in range(0, len(unknown), IN_CHUNK):
+        chunk = unknown[start:start + IN_CHUNK]
+        found = {row.animal_id for row in
+                 Payment.query.with_entities(Payment.animal_id)
+                 .filter(Payment.animal_id.in_(chunk),
+                         Payment.action_type == action_type,
+                         Payment.status == 'success')
+                 .distinct()}
+        for animal_id in chunk:
+            cache.put(animal_id, action_type, animal_id in found)
+        paid |= found
+    return paid
+
+
+# ---------- Invalidation ----------
+
+_CLEARED = 'cleared_payments'
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_cleared(session, flush_context):
+    """Note animals with a successful payment in this flush; their entries are dropped once it commits."""
+    for obj in chain(session.new, session.dirty):
+        if isinstance(obj, Payment) and obj.status == 'success':
+            session.info.setdefault(_CLEARED, set()).add(obj.animal_id)
+
+
+def invalidate_paid(animal_ids):
+    """Drop cached answers for animals given a successful payment outside the ORM (e.g. a Core bulk write)."""
+    if _cache is not None:
+        for animal_id in set(animal_ids):
+            _cache.invalidate(animal_id)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_cleared(session):
+    cleared = session.info.pop(_CLEARED, None)
+    if cleared and _cache is not None:
+        for animal_id in cleared:
+            # Payments recorded without an action type may clear either action
+            _cache.invalidate(animal_id)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_cleared(session):
+    session.info.pop(_CLEARED, None)
@@ -5,6 +5,7 @@ from datetime import datetime
 
 from server.models.payment import db, Payment
 from server.utils.logger import logger  # ✅ Logger preserved
+from server.utils.payment_cache import get_clearance_cache
 
 
 class PaymentGuard:
@@ -175,13 +176,21 @@ class PaymentGuard:
         action_type: 'ownership' or 'slaughter' (matches frontend usage)
 
         Returns True if payment exists and was successful.
+        Answers are cached per worker (see PaymentClearanceCache), so repeated
+        checks, e.g. across an offline sync batch, skip the query and the logging.
         """
+        cache = get_clearance_cache()
+        paid = cache.get(animal_id, action_type)
+        if paid is not None:
+            return paid
+
         payment = Payment.query.filter_by(
             animal_id=animal_id,
             action_type=action_type,
             status='success'
         ).first()
 
+        cache.put(animal_id, action_type, payment is not None)
         if payment:
             logger.info(
                 f"Payment verified for animal_id={animal_id}, "